@@ -3,6 +3,7 @@ from logging.config import fileConfig
 
 from alembic import context
 from app.internal import models
+from app.internal.audible.search_index import SEARCH_INDEX_TABLE
 from app.internal.env_settings import Settings
 from app.util.db import engine
 
@@ -27,6 +28,13 @@ target_metadata = models.BaseSQLModel.metadata
 # ... etc.
 
 
+def include_name(name: str | None, type_: str, _: object) -> bool:
+    # the search index is created with raw SQL (including the FTS5 shadow tables)
+    if type_ == "table" and name and name.startswith(SEARCH_INDEX_TABLE):
+        return False
+    return True
+
+
 def run_migrations() -> None:
     """Run migrations in 'online' mode.
 
@@ -42,6 +50,7 @@ def run_migrations() -> None:
             connection=connection,
             target_metadata=target_metadata,
             render_as_batch=True,
+            include_name=include_name,
         )
 
         with context.begin_transaction():
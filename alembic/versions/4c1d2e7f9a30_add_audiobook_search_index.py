@@ -0,0 +1,84 @@
+"""add audiobook search index
+
+Revision ID: 4c1d2e7f9a30
+Revises: b17f4dd7aacc
+Create Date: 2026-10-18 17:40:12.512032
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1d2e7f9a30'
+down_revision: Union[str, None] = 'b17f4dd7aacc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# the search index is not part of the models, see app/internal/audible/search_index.py
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            """
+            CREATE TABLE audiobooksearch (
+                asin VARCHAR PRIMARY KEY REFERENCES audiobook (asin) ON DELETE CASCADE,
+                document TSVECTOR NOT NULL
+            )
+            """
+        )
+        op.execute(
+            "CREATE INDEX ix_audiobooksearch_document ON audiobooksearch USING GIN (document)"
+        )
+        op.execute(
+            """
+            INSERT INTO audiobooksearch (asin, document)
+            SELECT a.asin, to_tsvector('simple', concat_ws(' ',
+                a.title,
+                a.subtitle,
+                (SELECT string_agg(au.name, ' ') FROM audiobookauthorlink l
+                    JOIN author au ON au.id::text = l.author_id::text
+                    WHERE l.audiobook_asin = a.asin),
+                (SELECT string_agg(n, ' ') FROM json_array_elements_text(a.narrators::json) n),
+                (SELECT string_agg(s.title, ' ') FROM audiobookserieslink sl
+                    JOIN series s ON s.asin = sl.series_asin
+                    WHERE sl.audiobook_asin = a.asin)
+            ))
+            FROM audiobook a
+            """
+        )
+    else:
+        op.execute(
+            """
+            CREATE VIRTUAL TABLE audiobooksearch USING fts5(
+                asin UNINDEXED,
+                title,
+                subtitle,
+                authors,
+                narrators,
+                series,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            """
+        )
+        op.execute(
+            """
+            INSERT INTO audiobooksearch (asin, title, subtitle, authors, narrators, series)
+            SELECT a.asin,
+                a.title,
+                coalesce(a.subtitle, ''),
+                coalesce((SELECT group_concat(au.name, ' ') FROM audiobookauthorlink l
+                    JOIN author au ON au.id = l.author_id
+                    WHERE l.audiobook_asin = a.asin), ''),
+                coalesce((SELECT group_concat(n.value, ' ') FROM json_each(a.narrators) n), ''),
+                coalesce((SELECT group_concat(s.title, ' ') FROM audiobookserieslink sl
+                    JOIN series s ON s.asin = sl.series_asin
+                    WHERE sl.audiobook_asin = a.asin), '')
+            FROM audiobook a
+            """
+        )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE audiobooksearch")
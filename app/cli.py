@@ -0,0 +1,97 @@
+"""
+Admin commands that run outside of the web app, for example:
+
+    python -m app.cli auto-download --user alice --min-age-days 7
+"""
+
+import asyncio
+from typing import Annotated
+
+import typer
+
+from app.internal.bulk_download import (
+    BulkDownloadFilter,
+    BulkDownloadOutcome,
+    BulkDownloadProgress,
+    BulkDownloadReport,
+    bulk_auto_download,
+)
+from app.util.connection import client_registry
+
+cli = typer.Typer(no_args_is_help=True)
+
+
+@cli.callback()
+def main():
+    """AudioBookRequest admin commands"""
+
+
+@cli.command("auto-download")
+def auto_download(
+    user: Annotated[
+        str | None, typer.Option(help="Only books requested by this user")
+    ] = None,
+    min_age_days: Annotated[
+        int | None,
+        typer.Option(help="Only books requested at least this many days ago"),
+    ] = None,
+    max_age_days: Annotated[
+        int | None, typer.Option(help="Only books requested at most this many days ago")
+    ] = None,
+    limit: Annotated[int | None, typer.Option(help="Maximum amount of books")] = None,
+    concurrency: Annotated[
+        int | None,
+        typer.Option(help="Books handled at once. Defaults to the query workers"),
+    ] = None,
+):
+    """Queries, ranks and downloads all pending requests matching the filter."""
+    filter = BulkDownloadFilter(
+        username=user,
+        min_age_days=min_age_days,
+        max_age_days=max_age_days,
+        limit=limit,
+    )
+    report = asyncio.run(_auto_download(filter, concurrency))
+    if report.failed:
+        raise typer.Exit(code=1)
+
+
+async def _auto_download(
+    filter: BulkDownloadFilter, concurrency: int | None
+) -> BulkDownloadReport:
+    colors = {
+        BulkDownloadOutcome.completed: typer.colors.GREEN,
+        BulkDownloadOutcome.failed: typer.colors.RED,
+        BulkDownloadOutcome.skipped: typer.colors.YELLOW,
+    }
+    try:
+        async for event in bulk_auto_download(filter, concurrency):
+            if isinstance(event, BulkDownloadProgress):
+                outcome = typer.style(event.outcome.value, fg=colors[event.outcome])
+                detail = f" ({event.detail})" if event.detail else ""
+                typer.echo(
+                    f"[{event.done}/{event.total}] {outcome} {event.title}{detail}"
+                )
+                continue
+
+            _print_report(event)
+            return event
+    finally:
+        await client_registry.close()
+    raise AssertionError("bulk auto download ended without a report")
+
+
+def _print_report(report: BulkDownloadReport):
+    typer.echo(
+        f"Finished in {report.duration_seconds:.1f}s: {report.total} books, "
+        + f"{report.completed} completed, {report.failed} failed, "
+        + f"{report.skipped} skipped"
+    )
+    if report.failures:
+        typer.echo("Failed books:")
+        for failure in report.failures:
+            typer.echo(f"  {failure.asin} {failure.title}: {failure.detail}")
+
+
+if __name__ == "__main__":
+    cli()
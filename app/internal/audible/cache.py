@@ -0,0 +1,183 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import cast
+
+from sqlalchemy import CursorResult, delete
+from sqlmodel import Session, col, not_, select
+
+from app.internal.audible.search_index import remove_orphaned_entries
+from app.internal.audible.suggestions import add_suggestions
+from app.internal.audible.types import REFETCH_TTL, STALE_TTL, AudibleProduct
+from app.internal.models import (
+    AudibleCacheEntry,
+    Audiobook,
+    AudiobookRequest,
+    match_books_to_db,
+)
+from app.internal.prowlarr.source_cache import clear_expired_sources
+from app.util.cache import LRUCache
+from app.util.db import get_session
+from app.util.log import logger
+
+CLEANUP_INTERVAL = 60 * 60  # 1 hour
+
+
+class NotPersistedError(Exception):
+    """
+    An Audible response could not be persisted, so it must not be cached either, as
+    its books are loaded from the database. Carries the books of the response, so
+    that they can still be returned.
+    """
+
+    def __init__(self, books: list[Audiobook]):
+        super().__init__("Audible response was not persisted")
+        self.books: list[Audiobook] = books
+
+
+def load_persisted[K](
+    session: Session, cache: LRUCache[K, list[str]], key: K, db_key: str
+):
+    """
+    On a memory cache miss, loads the entry persisted by any worker before. The
+    entry keeps its original age, so it is refreshed just like it would have been
+    without a restart.
+    """
+    if key in cache:
+        return
+    entry = session.get(AudibleCacheEntry, db_key)
+    if entry is None or entry.expires_at < datetime.now():
+        return
+    cache.set(
+        key,
+        entry.value,
+        ttl=entry.created_at.timestamp() + REFETCH_TTL - time.time(),
+    )
+
+
+def persist(
+    db_key: str, value: list[str], products: list[AudibleProduct] | None = None
+) -> bool:
+    """
+    Persists an Audible response together with the returned books. Uses its own
+    session, as it can also run in the background after a request is done.
+
+    Failures, like another worker storing the same books at the same time, are
+    logged and `False` is returned.
+    """
+    with next(get_session()) as session:
+        try:
+            if products:
+                store_books(session, products)
+            now = time.time()
+            _ = session.merge(
+                AudibleCacheEntry(
+                    key=db_key,
+                    value=value,
+                    created_at=datetime.fromtimestamp(now),
+                    expires_at=datetime.fromtimestamp(now + REFETCH_TTL + STALE_TTL),
+                )
+            )
+            session.commit()
+        except Exception as e:
+            logger.error("Failed to persist Audible response", key=db_key, error=e)
+            session.rollback()
+            return False
+
+    if products:
+        add_suggestions(
+            [product.title for product in products]
+            + [author.name for product in products for author in product.authors]
+        )
+    return True
+
+
+def store_books(session: Session, products: list[AudibleProduct]):
+    """Inserts new books and updates the metadata of books we already have."""
+    parsed = [product.to_audiobook() for product in products]
+    for new_book, book in zip(parsed, match_books_to_db(session, parsed)):
+        if book is not new_book:
+            book.title = new_book.title
+            book.subtitle = new_book.subtitle
+            book.narrators = new_book.narrators
+            book.cover_image = new_book.cover_image
+            book.release_date = new_book.release_date
+            book.runtime_length_min = new_book.runtime_length_min
+            book.updated_at = datetime.now()
+        session.add(book)
+
+
+def get_books(session: Session, asins: list[str]) -> list[Audiobook]:
+    """Loads stored books in the given order. Books that were deleted are skipped."""
+    books = {
+        book.asin: book
+        for book in session.exec(
+            select(Audiobook).where(col(Audiobook.asin).in_(asins))
+        ).all()
+    }
+    return [books[asin] for asin in asins if asin in books]
+
+
+def clear_old_book_caches(session: Session):
+    """
+    Deletes expired Audible responses and outdated cached audiobooks that haven't been
+    requested by anyone.
+
+    Books are stored again on every response they are part of, so books that are older
+    than the longest a response is kept are not referenced by any response anymore.
+    """
+    now = time.time()
+    result = cast(
+        CursorResult[AudibleCacheEntry],
+        session.execute(
+            delete(AudibleCacheEntry).where(
+                col(AudibleCacheEntry.expires_at) < datetime.fromtimestamp(now)
+            )
+        ),
+    )
+    logger.debug("Cleared expired Audible responses", rowcount=result.rowcount)
+
+    delete_query = delete(Audiobook).where(
+        col(Audiobook.updated_at)
+        < datetime.fromtimestamp(now - REFETCH_TTL - STALE_TTL),
+        col(Audiobook.asin).not_in(select(col(AudiobookRequest.asin).distinct())),
+        not_(Audiobook.downloaded),
+    )
+    result = cast(CursorResult[Audiobook], session.execute(delete_query))
+    remove_orphaned_entries(session)
+    session.commit()
+    logger.debug("Cleared old book caches", rowcount=result.rowcount)
+
+
+async def _cache_cleanup_task(stop_event: asyncio.Event):
+    """Clears old caches once an hour until stopped."""
+    while not stop_event.is_set():
+        try:
+            with next(get_session()) as session:
+                clear_old_book_caches(session)
+                clear_expired_sources(session)
+        except Exception as e:
+            logger.error("Failed to clear old book caches", error=e)
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=CLEANUP_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+_cleanup_stop_event = asyncio.Event()
+_cleanup_task: asyncio.Task[None] | None = None
+
+
+def start_cache_cleanup():
+    global _cleanup_task
+    _cleanup_stop_event.clear()
+    _cleanup_task = asyncio.create_task(_cache_cleanup_task(_cleanup_stop_event))
+
+
+async def stop_cache_cleanup():
+    global _cleanup_task
+    if _cleanup_task:
+        _cleanup_stop_event.set()
+        await _cleanup_task
+        _cleanup_task = None
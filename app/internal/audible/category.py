@@ -71,16 +71,9 @@ async def list_combined_audible_books(
         search_terms=search_terms,
         total_found=len(all_books),
     )
-    books = [
-        AudiobookWithRequests(
-            book=book,
-            requests=book.requests,
-            username=exclude_requested_username,
-        )
-        for book in all_books
-    ]
-
-    return books
+    return AudiobookWithRequests.from_books(
+        session, all_books, exclude_requested_username
+    )
 
 
 async def list_category_audible_books(
@@ -122,9 +115,4 @@ async def list_category_audible_books(
         coros.append(_fetch_category(category_name))
     await asyncio.gather(*coros)
 
-    for _, v in recommendations.items():
-        for b in v:
-            for r in b.book.requests:
-                session.refresh(r)
-
     return recommendations
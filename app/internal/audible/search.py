@@ -1,51 +1,67 @@
-import time
-from datetime import datetime
-from typing import cast
-
 from aiohttp import ClientSession
 from pydantic import BaseModel
-from sqlalchemy import CursorResult, delete
-from sqlmodel import Session, col, not_, select
+from sqlmodel import Session
 
+from app.internal.audible.cache import (
+    NotPersistedError,
+    get_books,
+    load_persisted,
+    persist,
+)
+from app.internal.audible.search_index import search_local_asins
+from app.internal.audible.suggestions import (
+    MAX_SUGGESTIONS,
+    MIN_LOCAL_SUGGESTIONS,
+    add_suggestions,
+    build_suggestion_index,
+    suggestion_index,
+)
 from app.internal.audible.types import (
     REFETCH_TTL,
+    STALE_TTL,
     AudibleSearchResponse,
     audible_region_type,
     audible_regions,
     get_region_from_settings,
     response_groups_param,
 )
-from app.internal.models import Audiobook, AudiobookRequest
+from app.internal.models import Audiobook
+from app.util.cache import LRUCache
+from app.util.connection import client_registry
 from app.util.log import logger
 
 
-def clear_old_book_caches(session: Session):
-    """Deletes outdated cached audiobooks that haven't been requested by anyone"""
-    delete_query = delete(Audiobook).where(
-        col(Audiobook.updated_at) < datetime.fromtimestamp(time.time() - REFETCH_TTL),
-        col(Audiobook.asin).not_in(select(col(AudiobookRequest.asin).distinct())),
-        not_(Audiobook.downloaded),
-    )
-    result = cast(CursorResult[Audiobook], session.execute(delete_query))
-    session.commit()
-    logger.debug("Cleared old book caches", rowcount=result.rowcount)
-
-
 class CacheQuery(BaseModel, frozen=True):
     query: str
     num_results: int
     page: int
     audible_region: audible_region_type
 
+    @property
+    def db_key(self) -> str:
+        return (
+            f"search:{self.audible_region}:{self.num_results}:{self.page}:{self.query}"
+        )
+
 
-class CacheResult[T](BaseModel, frozen=True):
-    value: T
-    timestamp: float
+# simple caching of search results to avoid having to fetch from audible so frequently.
+# Only the ordered ASINs are cached, the books are loaded from the database, where
+# the results are also persisted so that they survive restarts.
+# Concurrent identical requests to audible are only sent once.
+search_cache = LRUCache[CacheQuery, list[str]](
+    "audible_search", ttl=REFETCH_TTL, stale_ttl=STALE_TTL, max_entries=500
+)
+search_suggestions_cache = LRUCache[tuple[str, audible_region_type], list[str]](
+    "audible_search_suggestions",
+    ttl=REFETCH_TTL,
+    max_entries=5000,
+    max_size=2_000_000,
+    sizeof=lambda titles: sum(len(title) for title in titles),
+)
 
 
-# simple caching of search results to avoid having to fetch from audible so frequently
-search_cache: dict[CacheQuery, CacheResult[list[Audiobook]]] = {}
-search_suggestions_cache: dict[str, CacheResult[list[str]]] = {}
+def _suggestions_db_key(query: str, audible_region: audible_region_type) -> str:
+    return f"suggestions:{audible_region}:{query}"
 
 
 class _AudibleSuggestionsResponse(BaseModel):
@@ -85,16 +101,45 @@ class _AudibleSuggestionsResponse(BaseModel):
 
 
 async def get_search_suggestions(
+    session: Session,
     client_session: ClientSession,
     query: str,
     audible_region: audible_region_type | None = None,
 ) -> list[str]:
+    """
+    Suggestions are answered from the local prefix index. Audible is only asked if
+    there are too few local matches.
+    """
+    if not suggestion_index.built:
+        build_suggestion_index(session)
+    local_titles = suggestion_index.search(query, MAX_SUGGESTIONS)
+    if len(local_titles) >= MIN_LOCAL_SUGGESTIONS:
+        return local_titles
+
     if audible_region is None:
         audible_region = get_region_from_settings()
-    cache_result = search_suggestions_cache.get(query)
-    if cache_result and time.time() - cache_result.timestamp < REFETCH_TTL:
-        return cache_result.value
+    cache_key = (query, audible_region)
+    load_persisted(
+        session,
+        search_suggestions_cache,
+        cache_key,
+        _suggestions_db_key(query, audible_region),
+    )
+    titles = await search_suggestions_cache.get_or_fetch(
+        cache_key,
+        lambda: _fetch_search_suggestions(client_session, query, audible_region),
+    )
+    if titles is None:
+        return local_titles
+    local_titles += [title for title in titles if title not in local_titles]
+    return local_titles[:MAX_SUGGESTIONS]
+
 
+async def _fetch_search_suggestions(
+    client_session: ClientSession,
+    query: str,
+    audible_region: audible_region_type,
+) -> list[str] | None:
     base_url = (
         f"https://api.audible{audible_regions[audible_region]}/1.0/searchsuggestions"
     )
@@ -119,14 +164,11 @@ async def get_search_suggestions(
             region=audible_region,
             error=e,
         )
-        return []
+        return None
 
     titles = [item.model.title for item in suggestions.model.items if item.model.title]
-    search_suggestions_cache[query] = CacheResult(
-        value=titles,
-        timestamp=time.time(),
-    )
-
+    _ = persist(_suggestions_db_key(query, audible_region), titles)
+    add_suggestions(titles)
     return titles
 
 
@@ -137,12 +179,16 @@ async def search_audible_books(
     num_results: int = 20,
     page: int = 0,
     audible_region: audible_region_type | None = None,
+    merge_local: bool = False,
 ) -> list[Audiobook]:
     """
     https://audible.readthedocs.io/en/latest/misc/external_api.html#get--1.0-catalog-products
 
     Use the audible API to fetch all the books. We get all the required metadata by using
     the 'media' response group.
+
+    With `merge_local`, the first page is filled up with matching books we already have
+    locally. They are also returned if Audible is unreachable.
     """
     if audible_region is None:
         audible_region = get_region_from_settings()
@@ -152,20 +198,50 @@ async def search_audible_books(
         page=page,
         audible_region=audible_region,
     )
-    cache_result = search_cache.get(cache_key)
+    load_persisted(session, search_cache, cache_key, cache_key.db_key)
 
-    if cache_result and time.time() - cache_result.timestamp < REFETCH_TTL:
-        return cache_result.value
+    try:
+        # stale results are returned right away and refreshed in the background
+        asins = await search_cache.get_or_fetch(
+            cache_key,
+            lambda: _fetch_search_results(client_session, cache_key),
+            refresh=lambda: _refresh_search_results(cache_key),
+        )
+        books = get_books(session, asins) if asins is not None else []
+    except NotPersistedError as e:
+        books = e.books
 
-    base_url = (
-        f"https://api.audible{audible_regions[audible_region]}/1.0/catalog/products"
-    )
+    if merge_local and page == 0 and len(books) < num_results:
+        found = {book.asin for book in books}
+        local_books = search_local_books(session, query, num_results)
+        books += [book for book in local_books if book.asin not in found][
+            : num_results - len(books)
+        ]
+
+    return books
+
+
+def search_local_books(
+    session: Session, query: str, num_results: int = 20
+) -> list[Audiobook]:
+    """Searches the books that are already cached locally without contacting Audible."""
+    return get_books(session, search_local_asins(session, query, num_results))
+
+
+async def _refresh_search_results(cache_key: CacheQuery) -> list[str] | None:
+    return await _fetch_search_results(client_registry.get("audible"), cache_key)
+
+
+async def _fetch_search_results(
+    client_session: ClientSession, cache_key: CacheQuery
+) -> list[str] | None:
+    base_url = f"https://api.audible{audible_regions[cache_key.audible_region]}/1.0/catalog/products"
     params = {
-        "num_results": num_results,
+        "num_results": cache_key.num_results,
         "products_sort_by": "Relevance",
-        "keywords": query,
-        "page": page,
-        "response_groups": response_groups_param
+        "keywords": cache_key.query,
+        "page": cache_key.page,
+        "response_groups": response_groups_param,
     }
 
     try:
@@ -180,81 +256,24 @@ async def search_audible_books(
     except Exception as e:
         logger.error(
             "Exception while fetching search results from Audible",
-            query=query,
-            region=audible_region,
+            query=cache_key.query,
+            region=cache_key.audible_region,
             error=e,
         )
-        return []
-
-    # do not fetch book results we already have locally
-    books = audible_response.audiobooks()
-    # Match to DB so we can fill the requests field
-    books = [book.match_to_db(session) for book in books]
+        return None
 
     logger.debug(
         "Search results fetched",
-        query=query,
-        region=audible_region,
+        query=cache_key.query,
+        region=cache_key.audible_region,
         total_results=len(audible_response.products),
     )
-
-    search_cache[cache_key] = CacheResult(
-        value=books,
-        timestamp=time.time(),
-    )
-
-    # clean up cache slightly
-    for k in list(search_cache.keys()):
-        if time.time() - search_cache[k].timestamp > REFETCH_TTL:
-            try:
-                del search_cache[k]
-            except KeyError:  # ignore in race conditions
-                pass
-
-    return books
-
-
-def get_existing_books(session: Session, asins: set[str]) -> dict[str, Audiobook]:
-    books = session.exec(select(Audiobook).where(col(Audiobook.asin).in_(asins))).all()
-    ok_books: list[Audiobook] = []
-    for b in books:
-        if b.updated_at.timestamp() + REFETCH_TTL < time.time():
-            continue
-        ok_books.append(b)
-
-    return {b.asin: b for b in ok_books}
-
-
-# def upsert_new_books(session: Session, books: list[Audiobook]):
-#     asins = {b.asin: b for b in books}
-
-#     existing = list(
-#         session.exec(
-#             select(Audiobook).where(col(Audiobook.asin).in_(asins.keys()))
-#         ).all()
-#     )
-
-#     to_update: list[Audiobook] = []
-#     for b in existing:
-#         new_book = asins[b.asin]
-#         b.title = new_book.title
-#         b.subtitle = new_book.subtitle
-#         b.authors = new_book.authors
-#         b.narrators = new_book.narrators
-#         b.cover_image = new_book.cover_image
-#         b.release_date = new_book.release_date
-#         b.runtime_length_min = new_book.runtime_length_min
-#         to_update.append(b)
-
-#     existing_asins = {b.asin for b in existing}
-#     to_add = [b for b in books if b.asin not in existing_asins]
-
-#     logger.info(
-#         "Storing new search results in BookRequest cache/db",
-#         to_add_count=len(to_add),
-#         to_update_count=len(to_update),
-#         existing_count=len(existing),
-#     )
-
-#     session.add_all(to_add + existing)
-#     session.commit()
+    asins = [product.asin for product in audible_response.products]
+    if not persist(cache_key.db_key, asins, audible_response.products):
+        raise NotPersistedError(
+            [product.to_audiobook() for product in audible_response.products]
+        )
+    if asins:
+        # successful searches are suggested with a higher priority
+        add_suggestions([cache_key.query], weight=2)
+    return asins
@@ -0,0 +1,152 @@
+"""
+Local full-text index over all cached audiobooks. Uses FTS5 on SQLite and a GIN indexed
+`tsvector` on postgres. The table is created by a migration with raw SQL, as neither
+can be described with SQLModel, and is kept in sync whenever an `Audiobook` is flushed.
+"""
+
+import re
+from itertools import chain
+from typing import Iterable, Sequence, cast
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import InstanceState, UOWTransaction
+from sqlmodel import Session
+
+from app.internal.env_settings import Settings
+from app.internal.models import Audiobook
+from app.util.log import logger
+
+SEARCH_INDEX_TABLE = "audiobooksearch"
+
+_indexed_attributes = [
+    "title",
+    "subtitle",
+    "narrators",
+    "authors",
+    "series_links",
+]
+
+
+def _use_postgres() -> bool:
+    return Settings().db.use_postgres
+
+
+def _index_row(book: Audiobook) -> dict[str, str]:
+    return {
+        "asin": book.asin,
+        "title": book.title,
+        "subtitle": book.subtitle or "",
+        "authors": " ".join(author.name for author in book.authors),
+        "narrators": " ".join(book.narrators),
+        "series": " ".join(link.series.title for link in book.series_links),
+    }
+
+
+def index_books(session: Session, books: list[Audiobook]):
+    """Adds the books to the search index or updates them if they already exist."""
+    if not books:
+        return
+    rows = [_index_row(book) for book in books]
+    connection = session.connection()
+    if _use_postgres():
+        _ = connection.execute(
+            text(
+                f"INSERT INTO {SEARCH_INDEX_TABLE} (asin, document) "
+                + "VALUES (:asin, to_tsvector('simple', concat_ws(' ', "
+                + ":title, :subtitle, :authors, :narrators, :series))) "
+                + "ON CONFLICT (asin) DO UPDATE SET document = excluded.document"
+            ),
+            rows,
+        )
+    else:
+        _ = connection.execute(
+            text(f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE asin = :asin"), rows
+        )
+        _ = connection.execute(
+            text(
+                f"INSERT INTO {SEARCH_INDEX_TABLE} "
+                + "(asin, title, subtitle, authors, narrators, series) "
+                + "VALUES (:asin, :title, :subtitle, :authors, :narrators, :series)"
+            ),
+            rows,
+        )
+
+
+def unindex_books(session: Session, asins: list[str]):
+    if not asins:
+        return
+    _ = session.connection().execute(
+        text(f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE asin = :asin"),
+        [{"asin": asin} for asin in asins],
+    )
+
+
+def remove_orphaned_entries(session: Session):
+    """Removes index entries of books that were deleted with bulk deletes."""
+    _ = session.connection().execute(
+        text(
+            f"DELETE FROM {SEARCH_INDEX_TABLE} "
+            + "WHERE asin NOT IN (SELECT asin FROM audiobook)"
+        )
+    )
+
+
+def _needs_indexing(book: Audiobook) -> bool:
+    state = cast(InstanceState[Audiobook], inspect(book))
+    if state.pending:
+        return True
+    return any(state.attrs[attr].history.has_changes() for attr in _indexed_attributes)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_search_index(session: Session, _: UOWTransaction):  # pyright: ignore[reportUnusedFunction]
+    changed = [
+        obj
+        for obj in cast(Iterable[object], chain(session.new, session.dirty))
+        if isinstance(obj, Audiobook) and _needs_indexing(obj)
+    ]
+    deleted = [
+        obj.asin
+        for obj in cast(Iterable[object], session.deleted)
+        if isinstance(obj, Audiobook)
+    ]
+    if changed or deleted:
+        logger.debug(
+            "Updating search index", changed=len(changed), deleted=len(deleted)
+        )
+        index_books(session, changed)
+        unindex_books(session, deleted)
+
+
+def _terms(query: str) -> list[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def search_local_asins(session: Session, query: str, limit: int) -> list[str]:
+    """
+    Returns the ASINs of the best matching cached books. Every word of the query has
+    to match the start of a word in the title, subtitle, authors, narrators or series.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    params: dict[str, str | int] = {"limit": limit}
+    if _use_postgres():
+        params["query"] = " & ".join(f"{term}:*" for term in terms)
+        statement = text(
+            f"SELECT asin FROM {SEARCH_INDEX_TABLE} "
+            + "WHERE document @@ to_tsquery('simple', :query) "
+            + "ORDER BY ts_rank(document, to_tsquery('simple', :query)) DESC "
+            + "LIMIT :limit"
+        )
+    else:
+        params["query"] = " ".join(f'"{term}"*' for term in terms)
+        statement = text(
+            f"SELECT asin FROM {SEARCH_INDEX_TABLE} "
+            + f"WHERE {SEARCH_INDEX_TABLE} MATCH :query "
+            + f"ORDER BY bm25({SEARCH_INDEX_TABLE}) LIMIT :limit"
+        )
+
+    result = session.connection().execute(statement, params).scalars().all()
+    return list(cast(Sequence[str], result))
@@ -1,13 +1,18 @@
-import time
-
 from aiohttp import ClientSession
 from pydantic import BaseModel
 from sqlmodel import Session
 
-from app.internal.audible.search import CacheResult, search_audible_books
+from app.internal.audible.cache import (
+    NotPersistedError,
+    get_books,
+    load_persisted,
+    persist,
+)
+from app.internal.audible.search import search_audible_books
 from app.internal.audible.single import get_single_book
 from app.internal.audible.types import (
     REFETCH_TTL,
+    STALE_TTL,
     AudibleSimilarResponse,
     audible_region_type,
     audible_regions,
@@ -15,17 +20,51 @@ from app.internal.audible.types import (
     response_groups_param,
 )
 from app.internal.models import Audiobook
+from app.util.cache import LRUCache
+from app.util.connection import client_registry
 from app.util.log import logger
 
 
 class _SimsCacheKey(BaseModel, frozen=True):
     type: str = "popular"
-    region: str
+    region: audible_region_type
     num_results: int
     asin: str
 
+    @property
+    def db_key(self) -> str:
+        return f"sims:{self.type}:{self.region}:{self.num_results}:{self.asin}"
+
+
+# only the results of the sims endpoint are cached, the fallback uses the search cache
+sims_cache = LRUCache[_SimsCacheKey, list[str]](
+    "audible_sims", ttl=REFETCH_TTL, stale_ttl=STALE_TTL, max_entries=500
+)
+
+
+async def _refresh_sims(cache_key: _SimsCacheKey) -> list[str]:
+    return await _fetch_sims(client_registry.get("audible"), cache_key)
+
+
+async def _fetch_sims(
+    client_session: ClientSession, cache_key: _SimsCacheKey
+) -> list[str]:
+    base_url = f"https://api.audible{audible_regions[cache_key.region]}/1.0/catalog/products/{cache_key.asin}/sims"
+    params = {
+        # audible limits to max 10
+        "num_results": min(10, max(1, cache_key.num_results)),
+        "response_groups": response_groups_param,
+    }
+    async with client_session.get(base_url, params=params) as response:
+        response.raise_for_status()
+        sims = AudibleSimilarResponse.model_validate(await response.json())
 
-sims_cache: dict[_SimsCacheKey, CacheResult[list[Audiobook]]] = {}
+    asins = [product.asin for product in sims.similar_products]
+    if not persist(cache_key.db_key, asins, sims.similar_products):
+        raise NotPersistedError(
+            [product.to_audiobook() for product in sims.similar_products]
+        )
+    return asins
 
 
 async def list_similar_audible_books(
@@ -34,10 +73,12 @@ async def list_similar_audible_books(
     asin: str,
     num_results: int = 10,
     audible_region: audible_region_type | None = None,
+    seed: Audiobook | None = None,
 ) -> list[Audiobook]:
     """
     Fetch similar/recommended books for a given ASIN using Audible's sims endpoint when available.
-    Falls back to author-based search if the endpoint fails or is unavailable.
+    Falls back to author-based search if the endpoint fails or is unavailable. `seed`
+    is the book of the ASIN, if the caller already looked it up.
 
     Ordering of returned list should match Audible's ordering where possible.
     """
@@ -45,29 +86,21 @@ async def list_similar_audible_books(
         audible_region = get_region_from_settings()
 
     cache_key = _SimsCacheKey(region=audible_region, num_results=num_results, asin=asin)
-    cache_result = sims_cache.get(cache_key)
-    if cache_result and time.time() - cache_result.timestamp < REFETCH_TTL:
-        # Merge cached ORM instances into the current session to avoid cross-session attachment errors
-        try:
-            merged = [session.merge(book.match_to_db(session)) for book in cache_result.value]
-            logger.debug("Using cached popular books", region=audible_region)
-            return merged
-        except(Exception):
-            session.rollback()
-
-    base_url = f"https://api.audible{audible_regions[audible_region]}/1.0/catalog/products/{asin}/sims"
-    params = {
-        "num_results": min(10, max(1, num_results)),  # audible limits to max 10
-        "response_groups": response_groups_param
-    }
+    load_persisted(session, sims_cache, cache_key, cache_key.db_key)
 
     ordered: list[Audiobook] = []
     try:
-        async with client_session.get(base_url, params=params) as response:
-            response.raise_for_status()
-            sims = AudibleSimilarResponse.model_validate(await response.json())
-
-        ordered = sims.audiobooks()
+        # stale results are returned right away and refreshed in the background
+        asins = await sims_cache.get_or_fetch(
+            cache_key,
+            lambda: _fetch_sims(client_session, cache_key),
+            refresh=lambda: _refresh_sims(cache_key),
+        )
+        if asins is None:
+            raise RuntimeError("Sims endpoint returned no results")
+        ordered = get_books(session, asins)
+    except NotPersistedError as e:
+        ordered = e.books
     except Exception as e:
         # Fallback: approximate with author-based search
         logger.debug(
@@ -77,10 +110,10 @@ async def list_similar_audible_books(
         )
         try:
             # Find seed book to derive authors
-            seed = session.get(Audiobook, asin)
+            seed = seed or session.get(Audiobook, asin)
             if not seed:
                 try:
-                    seed = await get_single_book(client_session, asin, audible_region)
+                    seed = await get_single_book(asin, audible_region)
                 except Exception as e:
                     logger.error(
                         "Failed to fetch seed book for sims fallback",
@@ -106,5 +139,4 @@ async def list_similar_audible_books(
         except Exception:
             ordered = []
 
-    sims_cache[cache_key] = CacheResult(value=ordered, timestamp=time.time())
     return ordered
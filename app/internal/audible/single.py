@@ -1,35 +1,175 @@
-from typing import Optional
+import asyncio
+from typing import Optional, final
+
 from aiohttp import ClientSession
-from pydantic import ValidationError
+from pydantic import BaseModel, ValidationError
 
 from app.internal.audible.types import (
-    AudibleSingleResponse,
+    AudibleProduct,
     audible_region_type,
     audible_regions,
     get_region_from_settings,
     response_groups_param,
 )
 from app.internal.models import Audiobook
+from app.util.connection import client_registry
+from app.util.log import logger
 
+BATCH_WINDOW = 0.02
+"""Seconds to wait for more lookups before sending a batch"""
+MAX_BATCH_SIZE = 50
+"""Maximum amount of ASINs audible accepts in a single products request"""
 
-async def get_single_book(
-    client_session: ClientSession,
-    asin: str,
-    audible_region: audible_region_type | None = None,
-) -> Optional[Audiobook]:
-    if audible_region is None:
-        audible_region = get_region_from_settings()
 
-    base_url = f"https://api.audible{audible_regions[audible_region]}/1.0/catalog/products/{asin}"
-    params = {"asin": asin, "response_groups": response_groups_param}
+class _AudibleProductsResponse(BaseModel):
+    # products are validated one by one, so that a single product with missing
+    # metadata does not fail the whole batch
+    products: list[dict[str, object]]
+
+
+@final
+class ProductBatcher:
+    """
+    Collects product lookups over a short window and resolves them with as few
+    multi-ASIN `catalog/products` requests as possible. Every ASIN is only requested
+    once, no matter how many callers are waiting for it.
+    """
+
+    def __init__(self, window: float = BATCH_WINDOW, batch_size: int = MAX_BATCH_SIZE):
+        self.window = window
+        self.batch_size = batch_size
+        self._pending: dict[
+            audible_region_type, dict[str, asyncio.Future[AudibleProduct | None]]
+        ] = {}
+        self._flush_handles: dict[audible_region_type, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def get(
+        self, asin: str, audible_region: audible_region_type
+    ) -> AudibleProduct | None:
+        future = self._enqueue([asin], audible_region)[asin]
+        if audible_region not in self._flush_handles:
+            self._flush_handles[audible_region] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, audible_region
+            )
+        return await asyncio.shield(future)
+
+    async def get_many(
+        self, asins: list[str], audible_region: audible_region_type
+    ) -> dict[str, AudibleProduct]:
+        """Looks up an explicit list of ASINs right away, together with any pending ones."""
+        futures = self._enqueue(asins, audible_region)
+        self._flush(audible_region)
+        products = await asyncio.gather(*(asyncio.shield(f) for f in futures.values()))
+        return {
+            asin: product
+            for asin, product in zip(futures.keys(), products)
+            if product is not None
+        }
+
+    def _enqueue(
+        self, asins: list[str], audible_region: audible_region_type
+    ) -> dict[str, asyncio.Future[AudibleProduct | None]]:
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(audible_region, {})
+        futures: dict[str, asyncio.Future[AudibleProduct | None]] = {}
+        for asin in asins:
+            if asin not in pending:
+                pending[asin] = loop.create_future()
+            futures[asin] = pending[asin]
+        return futures
+
+    def _flush(self, audible_region: audible_region_type):
+        if handle := self._flush_handles.pop(audible_region, None):
+            handle.cancel()
+        pending = self._pending.pop(audible_region, {})
+        if not pending:
+            return
+
+        asins = list(pending.keys())
+        for i in range(0, len(asins), self.batch_size):
+            chunk = {asin: pending[asin] for asin in asins[i : i + self.batch_size]}
+            task = asyncio.create_task(self._resolve(chunk, audible_region))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(
+        self,
+        futures: dict[str, asyncio.Future[AudibleProduct | None]],
+        audible_region: audible_region_type,
+    ):
+        try:
+            products = await _fetch_products(
+                client_registry.get("audible"), list(futures.keys()), audible_region
+            )
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for asin, future in futures.items():
+            if not future.done():
+                future.set_result(products.get(asin))
+
+
+async def _fetch_products(
+    client_session: ClientSession,
+    asins: list[str],
+    audible_region: audible_region_type,
+) -> dict[str, AudibleProduct]:
+    base_url = (
+        f"https://api.audible{audible_regions[audible_region]}/1.0/catalog/products"
+    )
+    params = {"asins": ",".join(asins), "response_groups": response_groups_param}
 
     async with client_session.get(
         base_url,
         params=params,
     ) as response:
         response.raise_for_status()
+        result = _AudibleProductsResponse.model_validate(await response.json())
+
+    products: dict[str, AudibleProduct] = {}
+    for raw_product in result.products:
         try:
-            product = AudibleSingleResponse.model_validate(await response.json())
+            product = AudibleProduct.model_validate(raw_product)
         except ValidationError:
-            return None
-        return product.product.to_audiobook()
+            continue
+        products[product.asin] = product
+
+    logger.debug(
+        "Fetched products from Audible",
+        region=audible_region,
+        requested=len(asins),
+        found=len(products),
+    )
+    return products
+
+
+product_batcher = ProductBatcher()
+
+
+async def get_single_book(
+    asin: str,
+    audible_region: audible_region_type | None = None,
+) -> Optional[Audiobook]:
+    if audible_region is None:
+        audible_region = get_region_from_settings()
+
+    product = await product_batcher.get(asin, audible_region)
+    if product is None:
+        return None
+    return product.to_audiobook()
+
+
+async def get_many_books(
+    asins: list[str],
+    audible_region: audible_region_type | None = None,
+) -> dict[str, Audiobook]:
+    """Fetches the given books with one request per `MAX_BATCH_SIZE` ASINs."""
+    if audible_region is None:
+        audible_region = get_region_from_settings()
+
+    products = await product_batcher.get_many(asins, audible_region)
+    return {asin: product.to_audiobook() for asin, product in products.items()}
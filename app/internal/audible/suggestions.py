@@ -0,0 +1,152 @@
+import heapq
+from bisect import bisect_left, insort
+from typing import final
+
+from sqlmodel import Session, col, select
+
+from app.internal.models import AudibleCacheEntry, Audiobook, Author
+from app.util.log import logger
+
+MIN_LOCAL_SUGGESTIONS = 5
+"""Audible is only asked for suggestions if there are fewer local matches"""
+MAX_SUGGESTIONS = 10
+
+_CACHED_PREFIX_LENGTH = 2
+"""Short prefixes match large parts of the index, so their top results are cached"""
+
+
+@final
+class PrefixIndex:
+    """
+    In-memory index for typeahead. Every value is stored once per word, so that
+    prefixes match the start of any word. Lookups are a binary search in the sorted
+    keys.
+    """
+
+    def __init__(self, max_values: int = 100_000):
+        self.max_values = max_values
+        self._keys: list[tuple[str, str]] = []
+        """Sorted tuples of (normalized key, value)"""
+        self._weights: dict[str, int] = {}
+        self._top: dict[tuple[str, int], list[str]] = {}
+        """Ranked results of short prefixes by (prefix, limit)"""
+        self.built = False
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def build(self, values: list[tuple[str, int]]):
+        """Replaces the whole index. Faster than adding the values one by one."""
+        self._keys = []
+        self._weights = {}
+        self._top = {}
+        for value, weight in values:
+            value = _clean(value)
+            if not value:
+                continue
+            if value in self._weights:
+                self._weights[value] += weight
+            elif len(self._weights) < self.max_values:
+                self._weights[value] = weight
+                self._keys.extend((key, value) for key in _keys(value))
+        self._keys.sort()
+        self.built = True
+
+    def add(self, value: str, weight: int = 1):
+        value = _clean(value)
+        if not value:
+            return
+        if value in self._weights:
+            self._weights[value] += weight
+            self._invalidate(value)
+            return
+        if len(self._weights) >= self.max_values:
+            return
+        self._weights[value] = weight
+        for key in _keys(value):
+            insort(self._keys, (key, value))
+        self._invalidate(value)
+
+    def _invalidate(self, value: str):
+        """Drops the cached results of all prefixes the value is ranked for."""
+        if not self._top:
+            return
+        prefixes = {
+            key[:length]
+            for key in _keys(value)
+            for length in range(1, _CACHED_PREFIX_LENGTH + 1)
+        }
+        for cache_key in [k for k in self._top if k[0] in prefixes]:
+            del self._top[cache_key]
+
+    def search(self, prefix: str, limit: int) -> list[str]:
+        """
+        Values that have a word starting with the prefix. Values that start with the
+        prefix come first, then values that were added more often.
+        """
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        cached = len(prefix) <= _CACHED_PREFIX_LENGTH
+        if cached and (top := self._top.get((prefix, limit))) is not None:
+            return list(top)
+
+        # all matches are ranked, as the keys are only sorted alphabetically
+        matches: dict[str, bool] = {}
+        start = bisect_left(self._keys, (prefix, ""))
+        for i in range(start, len(self._keys)):
+            key, value = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            starts_with_prefix = _normalize(value).startswith(prefix)
+            matches[value] = matches.get(value, False) or starts_with_prefix
+
+        ranked = heapq.nsmallest(
+            limit, matches, key=lambda v: (not matches[v], -self._weights[v], len(v))
+        )
+        if cached:
+            self._top[(prefix, limit)] = list(ranked)
+        return ranked
+
+
+def _clean(value: str) -> str:
+    return " ".join(value.split())
+
+
+def _normalize(value: str) -> str:
+    return _clean(value).casefold()
+
+
+def _keys(value: str) -> list[str]:
+    words = _normalize(value).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+suggestion_index = PrefixIndex()
+
+
+def build_suggestion_index(session: Session):
+    """Builds the index from all cached book titles, author names and past searches."""
+    values: list[tuple[str, int]] = []
+    values.extend((title, 1) for title in session.exec(select(Audiobook.title)))
+    values.extend((name, 1) for name in session.exec(select(Author.name)))
+
+    # searches that returned results are persisted as `search:<region>:...:<query>`
+    for entry in session.exec(
+        select(AudibleCacheEntry).where(
+            col(AudibleCacheEntry.key).startswith("search:")
+        )
+    ):
+        if entry.value:
+            values.append((entry.key.split(":", 4)[-1], 2))
+
+    suggestion_index.build(values)
+    logger.debug("Built suggestion index", count=len(suggestion_index))
+
+
+def add_suggestions(values: list[str], weight: int = 1):
+    """Adds new values to the index, if it has already been built."""
+    if not suggestion_index.built:
+        return
+    for value in values:
+        suggestion_index.add(value, weight)
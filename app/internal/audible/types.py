@@ -9,6 +9,7 @@ from app.internal.env_settings import Settings
 from app.internal.models import Audiobook, AudiobookSeriesLink, Author, Series
 
 REFETCH_TTL = 60 * 60 * 24 * 7  # 1 week
+STALE_TTL = 60 * 60 * 24 * 7 * 3  # served for 3 more weeks while being refetched
 
 
 def to_response_groups_param(groups_list: list[str]) -> str:
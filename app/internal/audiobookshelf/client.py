@@ -20,7 +20,7 @@ from app.internal.audiobookshelf.types import (
 )
 from app.internal.folders import FolderAvailability, path_accessible
 from app.internal.models import Audiobook, Author
-from app.util.connection import USER_AGENT
+from app.util.connection import USER_AGENT, client_registry
 from app.util.db import get_session
 from app.util.log import logger
 
@@ -112,12 +112,9 @@ async def abs_check_paths_available(
 
 async def background_abs_trigger_scan():
     with next(get_session()) as session:
-        async with ClientSession() as client_session:
-            logger.debug("ABS: running background library scan trigger")
-            success = await abs_trigger_scan(session, client_session)
-            logger.info(
-                "ABS: background library scan trigger complete", success=success
-            )
+        logger.debug("ABS: running background library scan trigger")
+        success = await abs_trigger_scan(session, client_registry.get("audiobookshelf"))
+        logger.info("ABS: background library scan trigger complete", success=success)
 
 
 class _ListResponseBook(BaseModel):
@@ -0,0 +1,185 @@
+"""
+Starts the automatic download of many requested books at once, for example after an
+outage of the indexers or after the indexers were changed.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from enum import StrEnum
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+from sqlmodel import Session, col, not_, select
+
+from app.internal.env_settings import Settings
+from app.internal.models import Audiobook, AudiobookRequest, User
+from app.internal.query import query_sources
+from app.util.connection import client_registry
+from app.util.db import get_session
+from app.util.log import logger
+
+
+class BulkDownloadFilter(BaseModel, frozen=True):
+    username: str | None = None
+    """Only books requested by this user"""
+    min_age_days: int | None = Field(default=None, ge=0)
+    """Only books requested at least this many days ago"""
+    max_age_days: int | None = Field(default=None, ge=0)
+    """Only books requested at most this many days ago"""
+    limit: int | None = Field(default=None, ge=1)
+
+
+class BulkDownloadOutcome(StrEnum):
+    completed = "completed"
+    failed = "failed"
+    skipped = "skipped"
+
+
+class BulkDownloadProgress(BaseModel, frozen=True):
+    asin: str
+    title: str
+    outcome: BulkDownloadOutcome
+    detail: str | None = None
+    done: int
+    total: int
+
+
+class BulkDownloadReport(BaseModel, frozen=True):
+    total: int
+    completed: int
+    failed: int
+    skipped: int
+    duration_seconds: float
+    failures: list[BulkDownloadProgress]
+
+
+def find_pending_books(
+    session: Session, filter: BulkDownloadFilter
+) -> list[tuple[str, str]]:
+    """
+    Books that were requested but not downloaded yet, oldest request first. Returns
+    the asin and the username of the first requester of every book.
+    """
+    query = (
+        select(AudiobookRequest.asin, AudiobookRequest.user_username)
+        .join(Audiobook)
+        .where(not_(col(Audiobook.downloaded)))
+        .order_by(col(AudiobookRequest.updated_at))
+    )
+    now = datetime.now()
+    if filter.username is not None:
+        query = query.where(AudiobookRequest.user_username == filter.username)
+    if filter.min_age_days is not None:
+        query = query.where(
+            col(AudiobookRequest.updated_at)
+            <= now - timedelta(days=filter.min_age_days)
+        )
+    if filter.max_age_days is not None:
+        query = query.where(
+            col(AudiobookRequest.updated_at)
+            >= now - timedelta(days=filter.max_age_days)
+        )
+
+    books: dict[str, str] = {}
+    for asin, username in session.exec(query).all():
+        _ = books.setdefault(asin, username)
+    return list(books.items())[: filter.limit]
+
+
+async def _auto_download(
+    asin: str, username: str
+) -> tuple[str, BulkDownloadOutcome, str | None]:
+    # every book uses its own session, as they are downloaded concurrently
+    with next(get_session()) as session:
+        book = session.get(Audiobook, asin)
+        requester = session.get(User, username)
+        if not book or not requester:
+            return asin, BulkDownloadOutcome.skipped, "Request was removed"
+        title = book.title
+        if book.downloaded:
+            return title, BulkDownloadOutcome.skipped, "Already downloaded"
+
+        try:
+            result = await query_sources(
+                asin=asin,
+                session=session,
+                client_session=client_registry.get("prowlarr"),
+                requester=requester,
+                start_auto_download=True,
+            )
+        except HTTPException as e:
+            return title, BulkDownloadOutcome.failed, str(e.detail)
+        except Exception as e:
+            logger.error("Bulk auto download failed", asin=asin, error=e)
+            return title, BulkDownloadOutcome.failed, str(e) or type(e).__name__
+
+        if result.state == "querying":
+            return title, BulkDownloadOutcome.skipped, "Book is already being queried"
+        if not result.sources:
+            return title, BulkDownloadOutcome.skipped, "No sources found"
+        return title, BulkDownloadOutcome.completed, None
+
+
+async def bulk_auto_download(
+    filter: BulkDownloadFilter,
+    concurrency: int | None = None,
+) -> AsyncIterator[BulkDownloadProgress | BulkDownloadReport]:
+    """
+    Queries, ranks and downloads all pending books matching the filter. At most
+    `concurrency` books are handled at once, while requests to the upstreams are
+    rate limited per host by the shared HTTP sessions. Yields the progress of every
+    book as it finishes and a report at the end.
+    """
+    start = time.monotonic()
+    with next(get_session()) as session:
+        books = find_pending_books(session, filter)
+    total = len(books)
+    concurrency = max(1, concurrency or Settings().app.query_workers)
+    logger.info("Starting bulk auto download", books=total, concurrency=concurrency)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(asin: str, username: str):
+        async with semaphore:
+            return asin, *await _auto_download(asin, username)
+
+    counts = {outcome: 0 for outcome in BulkDownloadOutcome}
+    failures: list[BulkDownloadProgress] = []
+    tasks = [asyncio.create_task(run(asin, username)) for asin, username in books]
+    try:
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            asin, title, outcome, detail = await task
+            counts[outcome] += 1
+            progress = BulkDownloadProgress(
+                asin=asin,
+                title=title,
+                outcome=outcome,
+                detail=detail,
+                done=done,
+                total=total,
+            )
+            if outcome == BulkDownloadOutcome.failed:
+                failures.append(progress)
+            yield progress
+    finally:
+        # stops the remaining books if the caller went away
+        for task in tasks:
+            _ = task.cancel()
+
+    report = BulkDownloadReport(
+        total=total,
+        completed=counts[BulkDownloadOutcome.completed],
+        failed=counts[BulkDownloadOutcome.failed],
+        skipped=counts[BulkDownloadOutcome.skipped],
+        duration_seconds=time.monotonic() - start,
+        failures=failures,
+    )
+    logger.info(
+        "Finished bulk auto download",
+        completed=report.completed,
+        failed=report.failed,
+        skipped=report.skipped,
+    )
+    yield report
@@ -16,6 +16,7 @@ from app.internal.downloadclient.types import (
     TorrentProperties,
     torrent_status_sort_fields,
 )
+from app.util.connection import create_session
 from app.util.log import logger
 
 # Define ParamSpec to capture the exact parameters of the decorated function
@@ -55,7 +56,9 @@ class qBittorrentClient:
         self.base_url: str = base_url
         self.username: str = username
         self.password: str = password
-        self.http_session: ClientSession = aiohttp.ClientSession(base_url=base_url)
+        self.http_session: ClientSession = create_session(
+            aiohttp.client.DEFAULT_TIMEOUT, base_url=base_url
+        )
         self.sid: Optional[str] = None
 
     def is_authorised(self) -> bool:
@@ -18,6 +18,35 @@ class DBSettings(BaseModel):
     postgres_ssl_mode: str = "prefer"
 
 
+class HostLimits(BaseModel):
+    rate: float = 10
+    """Requests per second"""
+    burst: int = 20
+    """Requests that can be sent at once after being idle"""
+    concurrency: int = 10
+    queue_timeout: float = 30
+    """Seconds a request waits for the rate limit before failing"""
+
+
+class HTTPSettings(BaseModel):
+    connection_limit: int = 100
+    """Maximum amount of open connections across all upstream services"""
+    connection_limit_per_host: int = 10
+    keepalive_timeout: float = 60
+    """Seconds an idle connection is kept open for reuse"""
+    dns_cache_ttl: int = 300
+    default_limits: HostLimits = HostLimits()
+    host_limits: dict[str, HostLimits] = {
+        "api.audible.*": HostLimits(rate=10, burst=20, concurrency=8),
+        "*myanonamouse.net": HostLimits(rate=1, burst=2, concurrency=2),
+    }
+    """Limits for hosts matching the glob patterns. Others use `default_limits`."""
+    breaker_failure_threshold: int = 5
+    """Consecutive failures after which requests to a host fail immediately"""
+    breaker_reset_timeout: float = 30
+    """Seconds until a failing host is tried again"""
+
+
 class ApplicationSettings(BaseModel):
     debug: bool = False
     openapi_enabled: bool = False
@@ -31,6 +60,9 @@ class ApplicationSettings(BaseModel):
     default_region: str = "us"
     """Default region used in the search"""
 
+    query_workers: int = 2
+    """Amount of background source queries that run at the same time"""
+
     force_login_type: str = ""
     """Forces the login type used. If set, the login type cannot be changed in the UI."""
 
@@ -61,6 +93,7 @@ class Settings(BaseSettings):
 
     db: DBSettings = DBSettings()
     app: ApplicationSettings = ApplicationSettings()
+    http: HTTPSettings = HTTPSettings()
 
     def get_sqlite_path(self):
         if self.db.sqlite_path.startswith("/"):
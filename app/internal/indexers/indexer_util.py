@@ -135,4 +135,4 @@ async def update_single_indexer(
             enabled,
         )
 
-    flush_prowlarr_cache()
+    flush_prowlarr_cache(session)
@@ -3,11 +3,13 @@ import json
 import uuid
 from datetime import datetime
 from enum import Enum
-from typing import Annotated, Literal, Optional, Union, cast
+from typing import Annotated, Literal, Optional, Self, Sequence, Union, cast
 
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Index, text
 from sqlalchemy.orm import relationship
-from sqlmodel import JSON, Column, DateTime, Field, SQLModel, Session, func, select
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import JSON, Column, DateTime, Field, SQLModel, Session, col, func, select
 from sqlmodel._compat import SQLModelConfig
 from sqlmodel.main import Relationship
 
@@ -88,8 +90,6 @@ class AudiobookAuthorLink(BaseSQLModel, table=True):
     )
 
 
-
-
 class Series(BaseSQLModel, table=True):
     asin: str = Field(primary_key=True)
     title: str
@@ -198,6 +198,91 @@ class Audiobook(BaseSQLModel, table=True):
         return self
 
 
+def match_books_to_db(session: Session, books: list[Audiobook]) -> list[Audiobook]:
+    """
+    Same as `Audiobook.match_to_db`, but resolves a whole list of parsed books with a
+    single query each for the books, the authors by asin, the authors by name and the
+    series. Unmatched authors and series are shared between the returned books, so
+    that they are only inserted once.
+    """
+    asins = {book.asin for book in books}
+    matched_books = {
+        book.asin: book
+        for book in session.exec(
+            select(Audiobook).where(col(Audiobook.asin).in_(asins))
+        )
+    }
+    new_books = [book for book in books if book.asin not in matched_books]
+
+    authors = [author for book in new_books for author in book.authors]
+    author_asins = {author.asin for author in authors if author.asin}
+    author_names = {author.name for author in authors}
+    authors_by_asin = {
+        author.asin: author
+        for author in session.exec(
+            select(Author).where(col(Author.asin).in_(author_asins))
+        )
+    }
+    authors_by_name = {
+        author.name: author
+        for author in session.exec(
+            select(Author).where(col(Author.name).in_(author_names))
+        )
+    }
+
+    series_asins = {
+        link.series.asin for book in new_books for link in book.series_links
+    }
+    series_by_asin = {
+        series.asin: series
+        for series in session.exec(
+            select(Series).where(col(Series.asin).in_(series_asins))
+        )
+    }
+
+    for book in new_books:
+        if book.asin in matched_books:  # duplicate in the list
+            continue
+        for i, author in enumerate(book.authors):
+            match = (author.asin and authors_by_asin.get(author.asin)) or (
+                authors_by_name.get(author.name)
+            )
+            if match:
+                book.authors[i] = match
+            else:
+                if author.asin:
+                    authors_by_asin[author.asin] = author
+                authors_by_name[author.name] = author
+        for link in book.series_links:
+            if match := series_by_asin.get(link.series.asin):
+                link.series = match
+            else:
+                series_by_asin[link.series.asin] = link.series
+        matched_books[book.asin] = book
+
+    return [matched_books[book.asin] for book in books]
+
+
+class AudibleCacheEntry(BaseSQLModel, table=True):
+    """
+    A cached Audible response. Search and similar results are stored as the ordered
+    ASINs of the returned books, which themselves are stored as `Audiobook`s.
+    Search suggestions are stored as the suggested titles.
+    """
+
+    key: str = Field(primary_key=True)
+    value: list[str] = Field(default_factory=list, sa_column=Column(JSON))
+    created_at: datetime = Field(
+        default_factory=datetime.now,
+        sa_column=Column(
+            server_default=func.now(),
+            type_=DateTime,
+            nullable=False,
+        ),
+    )
+    expires_at: datetime = Field(index=True)
+
+
 class AudiobookWithRequests(BaseModel):
     book: Audiobook
     requests: list[AudiobookRequest]
@@ -209,12 +294,25 @@ class AudiobookWithRequests(BaseModel):
             return any(req.user_username == self.username for req in self.requests)
         return len(self.requests) > 0
 
-    def fill_requests(self, session: Session):
-        self.requests = list(
-            session.exec(
-                select(AudiobookRequest).where(AudiobookRequest.asin == self.book.asin)
-            ).all()
-        )
+    @classmethod
+    def from_books(
+        cls, session: Session, books: Sequence[Audiobook], username: str | None
+    ) -> list[Self]:
+        """Loads the requests of all books with a single query."""
+        requests: dict[str, list[AudiobookRequest]] = {book.asin: [] for book in books}
+        for request in session.exec(
+            select(AudiobookRequest).where(col(AudiobookRequest.asin).in_(requests))
+        ):
+            requests[request.asin].append(request)
+
+        results: list[Self] = []
+        for book in books:
+            # also fill the relationship so that it isn't lazy-loaded per book later on
+            set_committed_value(book, "requests", requests[book.asin])
+            results.append(
+                cls(book=book, requests=requests[book.asin], username=username)
+            )
+        return results
 
 
 class AudiobookRequest(BaseSQLModel, table=True):
@@ -284,6 +382,58 @@ class ManualBookRequest(BaseSQLModel, table=True):
     )
 
 
+class QueryJobState(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class QueryJob(BaseSQLModel, table=True):
+    """
+    Background query for the sources of a book, optionally starting the download.
+
+    A running job is the lease of its book. Only one job per book can be running,
+    which is enforced by a partial unique index. Queries that run directly for a
+    request add a `direct` job that only holds the lease.
+    """
+
+    __table_args__ = (  # pyright: ignore[reportUnannotatedClassAttribute]
+        Index(
+            "ix_queryjob_running_asin",
+            "asin",
+            unique=True,
+            sqlite_where=text("state = 'running'"),
+            postgresql_where=text("state = 'running'"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    asin: str = Field(foreign_key="audiobook.asin", ondelete="CASCADE", index=True)
+    requester_username: str = Field(foreign_key="user.username", ondelete="CASCADE")
+    auto_download: bool = False
+    force_refresh: bool = False
+    priority: int = 0
+    """Jobs with a lower priority run first"""
+    state: QueryJobState = Field(default=QueryJobState.queued, index=True)
+    attempts: int = 0
+    last_error: str | None = None
+    run_after: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(
+        default_factory=datetime.now,
+        sa_column=Column(
+            server_default=func.now(),
+            type_=DateTime,
+            nullable=False,
+        ),
+    )
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    direct: bool = False
+    lease_expires_at: datetime | None = None
+    """Running jobs renew their lease. Expired leases belong to crashed queries."""
+
+
 class BookMetadata(BaseSQLModel):
     """extra metadata that can be added to sources to better rank them"""
 
@@ -317,6 +467,7 @@ class TorrentSource(BaseSource):
     protocol: Literal["torrent"] = "torrent"
     seeders: int
     leechers: int
+    info_hash: str | None = None
 
 
 class UsenetSource(BaseSource):
@@ -329,6 +480,33 @@ ProwlarrSource = Annotated[
 ]
 
 
+class ProwlarrSourceCacheEntry(BaseSQLModel, table=True):
+    """
+    The sources found by a Prowlarr search, keyed by the query, the searched indexers
+    and the categories. The ranked order is stored as the guids of the sources, along
+    with the book and the config version it was ranked for, as changes to the
+    quality settings change the ranking.
+    """
+
+    key: str = Field(primary_key=True)
+    sources: str
+    """JSON list of `ProwlarrSource`s"""
+    partial: bool = False
+    """Some of the searches failed, so the sources are only kept for a short time"""
+    ranked: list[str] | None = Field(default=None, sa_column=Column(JSON))
+    ranked_asin: str | None = None
+    ranked_version: int | None = None
+    created_at: datetime = Field(
+        default_factory=datetime.now,
+        sa_column=Column(
+            server_default=func.now(),
+            type_=DateTime,
+            nullable=False,
+        ),
+    )
+    expires_at: datetime = Field(index=True)
+
+
 class Indexer(BaseModel, frozen=True):
     id: int
     name: str
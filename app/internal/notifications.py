@@ -13,6 +13,7 @@ from app.internal.models import (
     author_to_name_list,
 )
 from app.util import json_type
+from app.util.connection import client_registry
 from app.util.db import get_session
 from app.util.log import logger
 
@@ -128,8 +129,7 @@ async def send_notification(
     )
 
     try:
-        async with ClientSession() as client_session:
-            resp = await _send(body, notification, client_session)
+        resp = await _send(body, notification, client_registry.get("notifications"))
         logger.info(
             "Notification sent successfully",
             url=notification.url,
@@ -218,8 +218,7 @@ async def send_manual_notification(
             headers=notification.headers,
         )
 
-        async with ClientSession() as client_session:
-            return await _send(body, notification, client_session)
+        return await _send(body, notification, client_registry.get("notifications"))
 
     except Exception as e:
         logger.error("Failed to send notification", error=str(e))
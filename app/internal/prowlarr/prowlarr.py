@@ -1,13 +1,13 @@
+import asyncio
 import html
 import json
 import posixpath
 import time
-from datetime import datetime
-from typing import Literal
-from urllib.parse import urlencode
+from typing import AsyncIterator, Awaitable, Callable, Literal, final
+from urllib.parse import urlencode, urlparse
 
 from aiohttp import ClientResponse, ClientSession
-from pydantic import BaseModel, TypeAdapter
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from sqlmodel import Session
 
 from app.internal.indexers.abstract import SessionContainer
@@ -16,21 +16,23 @@ from app.internal.models import (
     EventEnum,
     Indexer,
     ProwlarrSource,
-    TorrentSource,
-    UsenetSource,
     User,
 )
 from app.internal.notifications import send_all_notifications
-from app.internal.prowlarr.source_metadata import edit_source_metadata
-from app.internal.prowlarr.util import (
-    prowlarr_config,
-    prowlarr_indexer_cache,
-    prowlarr_source_cache,
+from app.internal.prowlarr.search_queries import plan_search_queries
+from app.internal.prowlarr.search_results import parse_search_results
+from app.internal.prowlarr.source_cache import (
+    cache_sources,
+    get_cached_sources,
+    query_cache_key,
+    source_cache_key,
 )
+from app.internal.prowlarr.source_metadata import edit_source_metadata
+from app.internal.prowlarr.util import prowlarr_config, prowlarr_indexer_cache
+from app.util.circuitbreaker import CircuitOpenError
 from app.util.connection import USER_AGENT
 from app.util.log import logger
-
-
+from app.util.ratelimit import request_governor
 
 
 async def prowlarr_start_download(
@@ -77,33 +79,132 @@ async def prowlarr_start_download(
         return response
 
 
-class _ProwlarrResultBase(BaseModel):
-    guid: str
-    indexerId: int
-    indexer: str
-    title: str
-    size: int
-    infoUrl: str | None = None
-    indexerFlags: list[str] = []
-    downloadUrl: str | None = None
-    magnetUrl: str | None = None
-    publishDate: str
+PAGE_SIZE = 100
+MAX_RESULTS = 500
+"""Maximum amount of results that are paginated through per indexer"""
+INDEXER_TIMEOUT = 30
+"""
+Seconds after which the search of a single indexer is given up. Only starts once
+the search is running, waiting for the other searches is not part of it.
+"""
 
+type SourceBatchCallback = Callable[[list[ProwlarrSource]], Awaitable[None]]
+"""Receives the new sources of every page as soon as it arrives"""
 
-class _ProwlarrTorrentResult(_ProwlarrResultBase):
-    protocol: Literal["torrent"]
-    seeders: int = 0
-    leechers: int = 0
 
+class _ProwlarrSearchError(Exception):
+    pass
 
-class _ProwlarrUsenetResult(_ProwlarrResultBase):
-    protocol: Literal["usenet"]
-    grabs: int = 0
 
+@final
+class _SourceMerger:
+    """Deduplicates sources by their guid and, for torrents, their info hash."""
+
+    def __init__(self):
+        self.sources: list[ProwlarrSource] = []
+        self._seen: dict[str, ProwlarrSource] = {}
+
+    def _keys(self, source: ProwlarrSource) -> list[str]:
+        keys = [source.guid]
+        if source.protocol == "torrent" and source.info_hash:
+            keys.append(f"btih:{source.info_hash.lower()}")
+        return keys
+
+    def add(self, sources: list[ProwlarrSource]) -> list[ProwlarrSource]:
+        """Adds the sources and returns the ones that were not seen before."""
+        new: list[ProwlarrSource] = []
+        for source in sources:
+            keys = self._keys(source)
+            if any(key in self._seen for key in keys):
+                continue
+            for key in keys:
+                self._seen[key] = source
+            new.append(source)
+        self.sources.extend(new)
+        return new
+
+    def merged(self, sources: list[ProwlarrSource]) -> list[ProwlarrSource]:
+        """The already added sources that the given sources were deduplicated into."""
+        merged: dict[str, ProwlarrSource] = {}
+        for source in sources:
+            for key in self._keys(source):
+                if match := self._seen.get(key):
+                    merged[match.guid] = match
+                    break
+        return list(merged.values())
+
+
+async def _search_page(
+    client_session: ClientSession,
+    base_url: str,
+    api_key: str,
+    params: dict[str, int | str | list[int]],
+) -> list[ProwlarrSource]:
+    url = posixpath.join(base_url, f"api/v1/search?{urlencode(params, doseq=True)}")
+    logger.debug("Querying prowlarr", url=url)
+    async with client_session.get(
+        url,
+        headers={
+            "X-Api-Key": api_key,
+            "Accept": "application/json",
+            "User-Agent": USER_AGENT,
+        },
+    ) as response:
+        body = await response.read()
+    if not response.ok:
+        raise _ProwlarrSearchError(
+            f"{response.status}: {body.decode(errors='replace')}"
+        )
+    try:
+        return parse_search_results(body)
+    except ValidationError as e:
+        # the raw response is only kept to tell what could not be parsed
+        raise _ProwlarrSearchError(
+            f"{e.error_count()} parsing errors in: {body.decode(errors='replace')}"
+        ) from e
 
-_ProwlarrSearchResult = TypeAdapter(
-    list[_ProwlarrTorrentResult | _ProwlarrUsenetResult]
-)
+
+async def _search_pages(
+    client_session: ClientSession,
+    base_url: str,
+    api_key: str,
+    params: dict[str, int | str | list[int]],
+) -> AsyncIterator[list[ProwlarrSource]]:
+    """Fetches the next page for as long as the previous one was full."""
+    offset = 0
+    while True:
+        page = await _search_page(
+            client_session,
+            base_url,
+            api_key,
+            params | {"limit": PAGE_SIZE, "offset": offset},
+        )
+        yield page
+        offset += PAGE_SIZE
+        if len(page) < PAGE_SIZE or offset >= MAX_RESULTS:
+            return
+
+
+async def _get_search_groups(
+    session: Session,
+    client_session: ClientSession,
+    indexer_ids: list[int] | None,
+) -> list[list[int] | None]:
+    """
+    The indexer ids of every search request. Searching each indexer on its own means
+    the slowest indexer doesn't hold back the results of all the others.
+    """
+    if not prowlarr_config.get_search_per_indexer(session):
+        return [indexer_ids]
+    if not indexer_ids:
+        # no selection searches all enabled indexers
+        response = await get_indexers(session, client_session)
+        indexer_ids = [
+            id for id, indexer in response.indexers.items() if indexer.enable
+        ]
+    if not indexer_ids:
+        return [None]
+    return [[id] for id in indexer_ids]
 
 
 async def query_prowlarr(
@@ -113,134 +214,141 @@ async def query_prowlarr(
     indexer_ids: list[int] | None = None,
     force_refresh: bool = False,
     only_return_if_cached: bool = False,
+    on_batch: SourceBatchCallback | None = None,
 ) -> list[ProwlarrSource] | None:
-    query = book.title
+    """
+    Searches Prowlarr for every query variant of the book at once, one request per
+    indexer if configured. Results beyond the first page are paginated through and
+    the results of all queries are merged. Queries that were searched recently, for
+    example with other variant settings, are not searched again. `on_batch` is called
+    with the new deduplicated sources of every page as they arrive, before the
+    sources are enriched with additional metadata.
+    """
+    queries = plan_search_queries(session, book)
 
     base_url = prowlarr_config.get_base_url(session)
     api_key = prowlarr_config.get_api_key(session)
     assert base_url is not None and api_key is not None
-    source_ttl = prowlarr_config.get_source_ttl(session)
+    cache_key = source_cache_key(session, book, indexer_ids)
 
     if only_return_if_cached:
-        cached_sources = prowlarr_source_cache.get(source_ttl, query)
+        cached_sources = get_cached_sources(session, cache_key)
         return cached_sources
 
     if not force_refresh:
-        cached_sources = prowlarr_source_cache.get(source_ttl, query)
+        cached_sources = get_cached_sources(session, cache_key)
         if cached_sources:
             return cached_sources
 
-    params: dict[str, int | str | list[int]] = {
-        "query": query,
-        "type": "search",
-        "limit": 100,
-        "offset": 0,
-    }
-
+    merger = _SourceMerger()
+    searched_queries: list[str] = []
+    for query in queries:
+        cached_sources = None
+        if not force_refresh and len(queries) > 1:
+            cached_sources = get_cached_sources(
+                session, query_cache_key(session, query, indexer_ids)
+            )
+        if not cached_sources:
+            searched_queries.append(query)
+            continue
+        new = merger.add(cached_sources)
+        if new and on_batch:
+            await on_batch(new)
+    cached_count = len(merger.sources)
+
+    params: dict[str, int | str | list[int]] = {"type": "search"}
     if len(x := prowlarr_config.get_categories(session)) > 0:
         params["categories"] = x
 
-    if indexer_ids is not None:
-        params["indexerIds"] = indexer_ids
-
-    url = posixpath.join(base_url, f"api/v1/search?{urlencode(params, doseq=True)}")
-
-    logger.info("Querying prowlarr", url=url)
+    logger.info("Querying prowlarr", queries=searched_queries)
     start_time = time.time()
-    prowlarr_text = None
+    query_results: dict[str, list[ProwlarrSource]] = {
+        query: [] for query in searched_queries
+    }
 
-    try:
-        async with client_session.get(
-            url,
-            headers={
-                "X-Api-Key": api_key,
-                "Accept": "application/json",
-                "User-Agent": USER_AGENT,
-            },
-        ) as response:
-            prowlarr_text = await response.text()
-            if not response.ok:
-                logger.error(
-                    "Prowlarr: Failed to query", response=await response.text()
-                )
-                return []
-            search_results = _ProwlarrSearchResult.validate_python(
-                await response.json()
+    async def search(query: str, ids: list[int] | None) -> Exception | None:
+        group_params = params | {"query": query}
+        if ids is not None:
+            group_params["indexerIds"] = ids
+        try:
+            async with slots, asyncio.timeout(INDEXER_TIMEOUT):
+                async for page in _search_pages(
+                    client_session, base_url, api_key, group_params
+                ):
+                    query_results[query].extend(page)
+                    new = merger.add(page)
+                    if new and on_batch:
+                        await on_batch(new)
+        except CircuitOpenError as e:
+            return e
+        except TimeoutError as e:
+            logger.error(
+                "Prowlarr query timed out",
+                query=query,
+                indexers=ids,
+                elapsed_time=time.time() - start_time,
             )
-    except TimeoutError as e:
-        elapsed_time = time.time() - start_time
-        logger.error(
-            "Prowlarr query timed out", error=str(e), elapsed_time=elapsed_time
-        )
-        return []
-    except Exception as e:
-        elapsed_time = time.time() - start_time
-        logger.error(
-            "Failed to query Prowlarr",
-            error=str(e),
-            prowlarr_response=prowlarr_text,
-            elapsed_time=elapsed_time,
+            return e
+        except Exception as e:
+            logger.error(
+                "Failed to query Prowlarr",
+                query=query,
+                indexers=ids,
+                error=str(e),
+                elapsed_time=time.time() - start_time,
+            )
+            return e
+        return None
+
+    # more searches than Prowlarr takes at once would wait for the rate limit
+    # and run into their timeout there
+    host = urlparse(base_url).hostname or ""
+    slots = asyncio.Semaphore(request_governor.get(host).limits.concurrency)
+
+    # all variants share the slots, so they are searched together without exceeding
+    # what Prowlarr takes at once
+    searches: list[tuple[str, list[int] | None]] = []
+    if searched_queries:
+        groups = await _get_search_groups(session, client_session, indexer_ids)
+        searches = [(query, ids) for query in searched_queries for ids in groups]
+    results = await asyncio.gather(*(search(query, ids) for query, ids in searches))
+    errors = [e for e in results if e]
+    failed_queries = {query for (query, _), e in zip(searches, results) if e}
+
+    unavailable = [e for e in errors if isinstance(e, CircuitOpenError)]
+    if unavailable and not merger.sources:
+        stale_sources = get_cached_sources(session, cache_key, stale=True)
+        logger.warning(
+            "Prowlarr is unavailable",
+            error=str(unavailable[0]),
+            serving_stale=stale_sources is not None,
         )
-        return []
+        return stale_sources or []
 
-    elapsed_time = time.time() - start_time
+    sources = merger.sources
     logger.info(
         "Prowlarr query completed",
-        elapsed_time_seconds=elapsed_time,
-        results_size=len(search_results),
+        elapsed_time_seconds=time.time() - start_time,
+        results_size=len(sources),
+        queries=len(queries),
+        searches=len(searches),
+        failed=len(errors),
     )
 
-    sources: list[ProwlarrSource] = []
-    for result in search_results:
-        try:
-            if result.protocol not in ["torrent", "usenet"]:
-                logger.info(
-                    "Skipping source with unknown protocol", protocol=result.protocol
-                )
-                continue
-            if result.protocol == "torrent":
-                sources.append(
-                    TorrentSource(
-                        protocol="torrent",
-                        guid=result.guid,
-                        indexer_id=result.indexerId,
-                        indexer=result.indexer,
-                        title=result.title,
-                        seeders=result.seeders,
-                        leechers=result.leechers,
-                        size=result.size,
-                        info_url=result.infoUrl,
-                        indexer_flags=[x.lower() for x in result.indexerFlags],
-                        download_url=result.downloadUrl,
-                        magnet_url=result.magnetUrl,
-                        publish_date=datetime.fromisoformat(result.publishDate),
-                    )
-                )
-            else:
-                sources.append(
-                    UsenetSource(
-                        protocol="usenet",
-                        guid=result.guid,
-                        indexer_id=result.indexerId,
-                        indexer=result.indexer,
-                        title=result.title,
-                        grabs=result.grabs,
-                        size=result.size,
-                        info_url=result.infoUrl,
-                        indexer_flags=[x.lower() for x in result.indexerFlags],
-                        download_url=result.downloadUrl,
-                        magnet_url=result.magnetUrl,
-                        publish_date=datetime.fromisoformat(result.publishDate),
-                    )
-                )
-        except KeyError as e:
-            logger.error("Failed to parse source", source=result, keyerror=str(e))
-
-    # add additional metadata using any available indexers
+    # add additional metadata using any available indexers. Cached sources have it
     container = SessionContainer(session=session, client_session=client_session)
-    await edit_source_metadata(book, sources, container)
-
-    prowlarr_source_cache.set(sources, query)
+    await edit_source_metadata(book, sources[cached_count:], container)
+
+    # incomplete results are only cached shortly, so that a later query tries again
+    if len(queries) > 1:
+        for query in searched_queries:
+            cache_sources(
+                session,
+                query_cache_key(session, query, indexer_ids),
+                merger.merged(query_results[query]),
+                partial=query in failed_queries,
+            )
+    cache_sources(session, cache_key, sources, partial=bool(errors))
 
     return sources
 
@@ -281,7 +389,7 @@ async def get_indexers(
             error="Missing Prowlarr base url or api key",
         )
 
-    indexers = list(prowlarr_indexer_cache.get_all(source_ttl).values())
+    indexers = list(prowlarr_indexer_cache.values(max_age=source_ttl))
     try:
         if len(indexers) > 0:
             return IndexerResponse(
@@ -305,7 +413,7 @@ async def get_indexers(
 
             indexers = _IndexerList.validate_python(await response.json())
             for indexer in indexers:
-                prowlarr_indexer_cache.set(indexer, str(indexer.id))
+                prowlarr_indexer_cache.set(indexer.id, indexer, ttl=source_ttl)
             logger.info(
                 "Successfully fetched indexers from Prowlarr",
                 count=len(indexers),
@@ -314,7 +422,7 @@ async def get_indexers(
         return IndexerResponse(
             indexers={
                 indexer.id: indexer
-                for indexer in prowlarr_indexer_cache.get_all(source_ttl).values()
+                for indexer in prowlarr_indexer_cache.values(max_age=source_ttl)
             },
             state="ok",
         )
@@ -0,0 +1,33 @@
+from sqlmodel import Session
+
+from app.internal.models import Audiobook
+from app.internal.prowlarr.util import SearchQueryVariant, prowlarr_config
+
+
+def _build_query(book: Audiobook, variant: SearchQueryVariant) -> str | None:
+    match variant:
+        case "title":
+            return book.title
+        case "title_author":
+            if not book.authors:
+                return None
+            return f"{book.title} {book.authors[0].name}"
+        case "series":
+            for link in book.series_links:
+                if link.sequence:
+                    return f"{link.series.title} {link.sequence}"
+            return None
+
+
+def plan_search_queries(session: Session, book: Audiobook) -> list[str]:
+    """
+    The queries of the enabled search variants for the book. Variants the book is
+    missing the information for, like books without a series, are left out. Falls
+    back to the title if no variant applies.
+    """
+    queries: list[str] = []
+    for variant in prowlarr_config.get_search_queries(session):
+        query = _build_query(book, variant)
+        if query and query not in queries:
+            queries.append(query)
+    return queries or [book.title]
@@ -0,0 +1,151 @@
+"""
+Persisted Prowlarr search results. The sources are stored in the database, so they
+survive restarts and are shared between all workers. Entries are only loaded when
+the sources of a book are requested.
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import cast
+
+from pydantic import TypeAdapter
+from sqlalchemy import CursorResult, delete
+from sqlmodel import Session, col
+
+from app.internal.models import Audiobook, ProwlarrSource, ProwlarrSourceCacheEntry
+from app.internal.prowlarr.search_queries import plan_search_queries
+from app.internal.prowlarr.util import prowlarr_config
+from app.util.log import logger
+
+STALE_TTL = 60 * 60 * 24
+"""Outdated sources are kept for another day to be served while Prowlarr is down"""
+PARTIAL_TTL = 5 * 60
+"""Sources of searches that partially failed are searched again after five minutes"""
+
+_SourceList = TypeAdapter(list[ProwlarrSource])
+
+
+def _cache_key(
+    session: Session, queries: list[str], indexer_ids: list[int] | None
+) -> str:
+    """The same queries with other indexers or categories have other sources."""
+    return json.dumps(
+        [
+            queries,
+            sorted(indexer_ids) if indexer_ids is not None else None,
+            sorted(prowlarr_config.get_categories(session)),
+        ]
+    )
+
+
+def source_cache_key(
+    session: Session, book: Audiobook, indexer_ids: list[int] | None
+) -> str:
+    """Key of the merged sources of all search queries of the book."""
+    return _cache_key(session, plan_search_queries(session, book), indexer_ids)
+
+
+def query_cache_key(session: Session, query: str, indexer_ids: list[int] | None) -> str:
+    """
+    Key of the sources of a single search query, so that they are reused by books
+    and variant settings that share the query. Equal to the key of the merged
+    sources if a book only has the one query.
+    """
+    return _cache_key(session, [query], indexer_ids)
+
+
+def _get_entry(
+    session: Session, key: str, stale: bool
+) -> ProwlarrSourceCacheEntry | None:
+    entry = session.get(ProwlarrSourceCacheEntry, key)
+    if entry is None:
+        return None
+    now = datetime.now()
+    if entry.expires_at < now:
+        return None
+    # the TTL is read on every access, so that changes apply to existing entries
+    source_ttl = prowlarr_config.get_source_ttl(session)
+    if entry.partial:
+        source_ttl = min(source_ttl, PARTIAL_TTL)
+    if not stale and entry.created_at + timedelta(seconds=source_ttl) <= now:
+        return None
+    return entry
+
+
+def get_cached_sources(
+    session: Session, key: str, stale: bool = False
+) -> list[ProwlarrSource] | None:
+    """With `stale`, also returns outdated sources that are within the stale window."""
+    entry = _get_entry(session, key, stale)
+    if entry is None:
+        return None
+    return _SourceList.validate_json(entry.sources)
+
+
+def cache_sources(
+    session: Session, key: str, sources: list[ProwlarrSource], partial: bool = False
+):
+    """
+    `partial` sources are missing the results of failed searches. They are still
+    cached, so that every request doesn't search all indexers again, but only
+    for a short time.
+    """
+    now = datetime.now()
+    source_ttl = prowlarr_config.get_source_ttl(session)
+    _ = session.merge(
+        ProwlarrSourceCacheEntry(
+            key=key,
+            sources=_SourceList.dump_json(sources).decode(),
+            partial=partial,
+            created_at=now,
+            expires_at=now + timedelta(seconds=source_ttl + STALE_TTL),
+        )
+    )
+    session.commit()
+
+
+def get_cached_ranking(
+    session: Session, key: str, book: Audiobook
+) -> list[ProwlarrSource] | None:
+    """
+    The sources in the order they were ranked in, if they were ranked for the same
+    book and nothing in the config changed since.
+    """
+    entry = _get_entry(session, key, stale=False)
+    if (
+        entry is None
+        or entry.ranked is None
+        or entry.ranked_asin != book.asin
+        or entry.ranked_version != prowlarr_config.get_version(session)
+    ):
+        return None
+    sources = {
+        source.guid: source for source in _SourceList.validate_json(entry.sources)
+    }
+    return [sources[guid] for guid in entry.ranked if guid in sources]
+
+
+def cache_ranking(
+    session: Session, key: str, book: Audiobook, ranked: list[ProwlarrSource]
+):
+    entry = session.get(ProwlarrSourceCacheEntry, key)
+    if entry is None:
+        return
+    entry.ranked = [source.guid for source in ranked]
+    entry.ranked_asin = book.asin
+    entry.ranked_version = prowlarr_config.get_version(session)
+    session.add(entry)
+    session.commit()
+
+
+def clear_expired_sources(session: Session):
+    result = cast(
+        CursorResult[ProwlarrSourceCacheEntry],
+        session.execute(
+            delete(ProwlarrSourceCacheEntry).where(
+                col(ProwlarrSourceCacheEntry.expires_at) < datetime.now()
+            )
+        ),
+    )
+    session.commit()
+    logger.debug("Cleared expired Prowlarr sources", rowcount=result.rowcount)
@@ -1,10 +1,11 @@
 import json
 from typing import Literal
 
+from sqlalchemy import delete
 from sqlmodel import Session
 
-from app.internal.models import Indexer, ProwlarrSource
-from app.util.cache import SimpleCache, StringConfigCache
+from app.internal.models import Indexer, ProwlarrSourceCacheEntry
+from app.util.cache import LRUCache, StringConfigCache
 from app.util.log import logger
 
 
@@ -18,8 +19,12 @@ ProwlarrConfigKey = Literal[
     "prowlarr_source_ttl",
     "prowlarr_categories",
     "prowlarr_indexers",
+    "prowlarr_search_per_indexer",
+    "prowlarr_search_queries",
 ]
 
+SearchQueryVariant = Literal["title", "title_author", "series"]
+
 
 class ProwlarrConfig(StringConfigCache[ProwlarrConfigKey]):
     def raise_if_invalid(self, session: Session):
@@ -73,13 +78,32 @@ class ProwlarrConfig(StringConfigCache[ProwlarrConfigKey]):
     def set_indexers(self, session: Session, indexers: list[int]):
         self.set(session, "prowlarr_indexers", json.dumps(indexers))
 
+    def get_search_per_indexer(self, session: Session) -> bool:
+        enabled = self.get_bool(session, "prowlarr_search_per_indexer")
+        return True if enabled is None else enabled
+
+    def set_search_per_indexer(self, session: Session, enabled: bool):
+        self.set_bool(session, "prowlarr_search_per_indexer", enabled)
+
+    def get_search_queries(self, session: Session) -> list[SearchQueryVariant]:
+        queries = self.get(session, "prowlarr_search_queries")
+        if queries is None:
+            return ["title"]
+        return json.loads(queries)  # pyright: ignore[reportAny]
+
+    def set_search_queries(self, session: Session, queries: list[SearchQueryVariant]):
+        self.set(session, "prowlarr_search_queries", json.dumps(queries))
+
 
 prowlarr_config = ProwlarrConfig()
-prowlarr_source_cache = SimpleCache[list[ProwlarrSource], str]()
-prowlarr_indexer_cache = SimpleCache[Indexer, str]()
+# the TTL is passed in from the source_ttl setting on every access
+prowlarr_indexer_cache = LRUCache[int, Indexer](
+    "prowlarr_indexers", ttl=0, max_entries=1000
+)
 
 
-def flush_prowlarr_cache():
+def flush_prowlarr_cache(session: Session):
     logger.info("Flushing prowlarr caches")
-    prowlarr_source_cache.flush()
-    prowlarr_indexer_cache.flush()
+    _ = session.execute(delete(ProwlarrSourceCacheEntry))
+    session.commit()
+    prowlarr_indexer_cache.clear()
@@ -1,32 +1,161 @@
-from contextlib import contextmanager
-from typing import Literal
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Literal
 
-import aiohttp
 import pydantic
 from aiohttp import ClientSession
 from fastapi import HTTPException
-from sqlmodel import Session, select
+from sqlalchemy import delete, not_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, select
 
-from app.internal.models import Audiobook, ProwlarrSource, User
-from app.internal.prowlarr.prowlarr import query_prowlarr
+from app.internal.models import (
+    Audiobook,
+    ProwlarrSource,
+    QueryJob,
+    QueryJobState,
+    User,
+)
+from app.internal.prowlarr.prowlarr import SourceBatchCallback, query_prowlarr
+from app.internal.prowlarr.source_cache import (
+    cache_ranking,
+    get_cached_ranking,
+    get_cached_sources,
+    source_cache_key,
+)
 from app.internal.prowlarr.util import prowlarr_config
 from app.internal.ranking.download_ranking import rank_sources
 from app.util.db import get_session
 from app.util.download import DownloadError, start_download_with_rename
+from app.util.log import logger
+from app.util.singleflight import JoinTimeout, SingleFlight
 
-querying: set[str] = set()
+LEASE_TTL = 60
+"""Seconds a query holds the lease of its book without renewing it"""
+WAIT_TIMEOUT = 30
+"""Seconds a caller waits for a query of the same book that is already running"""
+_LEASE_POLL_INTERVAL = 0.25
+"""Seconds before the first check if the lease of a busy book was released"""
+_MAX_LEASE_POLL_INTERVAL = 1
 
 
-@contextmanager
-def manage_queried(asin: str):
-    querying.add(asin)
+def is_querying(session: Session, asin: str) -> bool:
+    return (
+        session.exec(
+            select(QueryJob.id).where(
+                QueryJob.asin == asin,
+                QueryJob.state == QueryJobState.running,
+                col(QueryJob.lease_expires_at) > datetime.now(),
+            )
+        ).first()
+        is not None
+    )
+
+
+def release_expired_leases(session: Session):
+    """Expired leases belong to crashed queries. Their jobs are queued again."""
+    expired = (
+        col(QueryJob.state) == QueryJobState.running,
+        col(QueryJob.lease_expires_at) < datetime.now(),
+    )
+    _ = session.execute(delete(QueryJob).where(*expired, col(QueryJob.direct)))
+    _ = session.execute(
+        update(QueryJob)
+        .where(*expired, not_(col(QueryJob.direct)))
+        .values(state=QueryJobState.queued)
+    )
+    session.commit()
+
+
+def _try_acquire_lease(asin: str, requester: User) -> uuid.UUID | None:
+    with next(get_session()) as session:
+        release_expired_leases(session)
+        now = datetime.now()
+        lease = QueryJob(
+            asin=asin,
+            requester_username=requester.username,
+            direct=True,
+            state=QueryJobState.running,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=LEASE_TTL),
+        )
+        session.add(lease)
+        try:
+            session.commit()
+        except IntegrityError:
+            # another worker is querying the book
+            session.rollback()
+            return None
+        return lease.id
+
+
+def _is_leased(asin: str) -> bool:
+    with next(get_session()) as session:
+        return is_querying(session, asin)
+
+
+async def _wait_for_lease(asin: str, requester: User) -> uuid.UUID | None:
+    """
+    While another query holds the lease, it is polled with a read-only check and an
+    exponential backoff. Taking the lease is only tried again once it looks free.
+    """
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    interval = _LEASE_POLL_INTERVAL
+    while (lease_id := _try_acquire_lease(asin, requester)) is None:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, _MAX_LEASE_POLL_INTERVAL)
+            if not _is_leased(asin):
+                break
+    return lease_id
+
+
+async def _renew_lease(lease_id: uuid.UUID):
+    while True:
+        await asyncio.sleep(LEASE_TTL / 3)
+        with next(get_session()) as session:
+            _ = session.execute(
+                update(QueryJob)
+                .where(col(QueryJob.id) == lease_id)
+                .values(lease_expires_at=datetime.now() + timedelta(seconds=LEASE_TTL))
+            )
+            session.commit()
+
+
+def _release_lease(lease_id: uuid.UUID):
+    with next(get_session()) as session:
+        _ = session.execute(delete(QueryJob).where(col(QueryJob.id) == lease_id))
+        session.commit()
+
+
+@asynccontextmanager
+async def hold_lease(
+    asin: str, requester: User, job_id: uuid.UUID | None
+) -> AsyncIterator[bool]:
+    """
+    Holds the lease of the book for the duration of the query, so that a book is
+    only queried once at a time, even across multiple app workers. Jobs of the
+    queue already hold the lease. Yields False if another query kept the lease for
+    longer than `WAIT_TIMEOUT`.
+    """
+    lease_id = job_id or await _wait_for_lease(asin, requester)
+    if lease_id is None:
+        yield False
+        return
+
+    renewal = asyncio.create_task(_renew_lease(lease_id))
     try:
-        yield
+        yield True
     finally:
-        try:
-            querying.remove(asin)
-        except KeyError:
-            pass
+        _ = renewal.cancel()
+        if job_id is None:
+            _release_lease(lease_id)
 
 
 class QueryResult(pydantic.BaseModel):
@@ -40,6 +169,9 @@ class QueryResult(pydantic.BaseModel):
         return self.state == "ok"
 
 
+_query_flight = SingleFlight[tuple[str, bool, str | None], QueryResult]("query_sources")
+
+
 async def query_sources(
     asin: str,
     session: Session,
@@ -47,80 +179,242 @@ async def query_sources(
     requester: User,
     force_refresh: bool = False,
     only_return_if_cached: bool = False,
-    start_auto_download: bool = False
+    start_auto_download: bool = False,
+    job_id: uuid.UUID | None = None,
+    on_sources: SourceBatchCallback | None = None,
 ) -> QueryResult:
+    """
+    Queries the sources of a book and ranks them. Concurrent calls for the same book
+    and options share a single query. Auto downloads are only shared with calls of
+    the same requester, as the download is started in their name. If the book is
+    already being queried for longer than `WAIT_TIMEOUT`, the `querying` state is
+    returned instead.
+
+    `job_id` is given when running as a job of the query queue. `on_sources` receives
+    the unranked sources in batches while Prowlarr is searched. Callers that join an
+    already running query only receive the final result.
+    """
     book = session.exec(select(Audiobook).where(Audiobook.asin == asin)).first()
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    if asin in querying:
-        return QueryResult(
-            sources=None,
-            book=book,
-            state="querying",
+    if only_return_if_cached:
+        if is_querying(session, asin):
+            return QueryResult(sources=None, book=book, state="querying")
+        return await _query(
+            session, client_session, book, requester, only_return_if_cached=True
         )
 
-    with manage_queried(asin):
-        prowlarr_config.raise_if_invalid(session)
-
-        sources = await query_prowlarr(
-            session,
+    def run():
+        return _leased_query(
+            asin,
             client_session,
-            book,
+            requester,
             force_refresh=force_refresh,
-            only_return_if_cached=only_return_if_cached,
-            indexer_ids=prowlarr_config.get_indexers(session),
+            start_auto_download=start_auto_download,
+            job_id=job_id,
+            on_sources=on_sources,
+        )
+
+    try:
+        if job_id is not None:
+            # jobs hold the lease already, so they can't wait for other callers
+            result = await run()
+        else:
+            result = await _query_flight.do(
+                (
+                    asin,
+                    force_refresh,
+                    requester.username if start_auto_download else None,
+                ),
+                run,
+                join_timeout=WAIT_TIMEOUT,
+            )
+    except JoinTimeout:
+        return QueryResult(sources=None, book=book, state="querying")
+
+    # the result was loaded in the session of the query
+    session.refresh(book)
+    return result.model_copy(update={"book": book})
+
+
+async def stream_sources(
+    asin: str,
+    client_session: ClientSession,
+    requester: User,
+) -> AsyncIterator[QueryResult]:
+    """
+    Queries the sources of a book like `query_sources`, but yields the ranked sources
+    found so far while the indexers are still being searched, starting with outdated
+    cached sources if there are any. These partial results have the `querying` state.
+    The last result is the final one, after the sources were enriched with additional
+    metadata. Errors are returned in its `error_message`.
+    """
+    # uses its own session, as the stream outlives the request
+    with next(get_session()) as session:
+        book = session.get(Audiobook, asin)
+        if not book:
+            raise HTTPException(status_code=404, detail="Book not found")
+
+        batches: asyncio.Queue[list[ProwlarrSource] | None] = asyncio.Queue()
+
+        async def on_sources(batch: list[ProwlarrSource]):
+            batches.put_nowait(batch)
+
+        query = asyncio.create_task(
+            query_sources(
+                asin,
+                session=session,
+                client_session=client_session,
+                requester=requester,
+                on_sources=on_sources,
+            )
         )
-        if sources is None:
-            return QueryResult(
+        query.add_done_callback(lambda _: batches.put_nowait(None))
+        try:
+            cache_key = source_cache_key(
+                session, book, prowlarr_config.get_indexers(session)
+            )
+            if stale_sources := get_cached_sources(session, cache_key, stale=True):
+                ranked = await rank_sources(
+                    session, client_session, stale_sources, book
+                )
+                yield QueryResult(sources=ranked, book=book, state="querying")
+
+            found: list[ProwlarrSource] = []
+            while (batch := await batches.get()) is not None:
+                found.extend(batch)
+                if not batches.empty():
+                    # batches that arrived during the last ranking are ranked at once
+                    continue
+                ranked = await rank_sources(session, client_session, found, book)
+                yield QueryResult(sources=ranked, book=book, state="querying")
+
+            result = await query
+            if result.state == "querying":
+                result.error_message = "Book is already being queried"
+        except HTTPException as e:
+            result = QueryResult(
+                sources=None,
+                book=book,
+                state="uncached",
+                error_message=str(e.detail),
+            )
+        except Exception as e:
+            logger.error("Failed to query sources", asin=asin, error=e)
+            result = QueryResult(
                 sources=None,
                 book=book,
                 state="uncached",
+                error_message=str(e) or type(e).__name__,
             )
+        finally:
+            # the query itself continues for other callers, see `query_sources`
+            _ = query.cancel()
+        yield result
 
-        ranked = await rank_sources(session, client_session, sources, book)
-
-        # start download if requested
-        if start_auto_download and not book.downloaded and len(ranked) > 0:
-            if not (url := ranked[0].download_url or ranked[0].magnet_url):
-                raise HTTPException(status_code=500, detail=f"{ranked[0].guid} had no torrent or magnet link")
-
-            try:
-                await start_download_with_rename(
-                    session=session,
-                    client_session=client_session,
-                    guid=ranked[0].guid,
-                    torrent_url=url,
-                    indexer_id=ranked[0].indexer_id,
-                    requester=requester,
-                    book=book,
-                    prowlarr_source=ranked[0],
-                )
-            except DownloadError as e:
-                raise HTTPException(status_code=500, detail=e)
-
-            same_books = session.exec(
-                select(Audiobook).where(Audiobook.asin == asin)
-            ).all()
-            for b in same_books:
-                b.downloaded = True
-                session.add(b)
-            session.commit()
 
+async def _leased_query(
+    asin: str,
+    client_session: ClientSession,
+    requester: User,
+    *,
+    force_refresh: bool,
+    start_auto_download: bool,
+    job_id: uuid.UUID | None,
+    on_sources: SourceBatchCallback | None,
+) -> QueryResult:
+    # uses its own session, as the query is shared and outlives the caller
+    with next(get_session()) as session:
+        book = session.get(Audiobook, asin)
+        if not book:
+            raise HTTPException(status_code=404, detail="Book not found")
+
+        async with hold_lease(asin, requester, job_id) as acquired:
+            if not acquired:
+                return QueryResult(sources=None, book=book, state="querying")
+            # the previous holder of the lease could have downloaded the book
+            session.refresh(book)
+            return await _query(
+                session,
+                client_session,
+                book,
+                requester,
+                force_refresh=force_refresh,
+                start_auto_download=start_auto_download,
+                on_sources=on_sources,
+            )
+
+
+async def _query(
+    session: Session,
+    client_session: ClientSession,
+    book: Audiobook,
+    requester: User,
+    *,
+    force_refresh: bool = False,
+    only_return_if_cached: bool = False,
+    start_auto_download: bool = False,
+    on_sources: SourceBatchCallback | None = None,
+) -> QueryResult:
+    asin = book.asin
+    prowlarr_config.raise_if_invalid(session)
+
+    indexer_ids = prowlarr_config.get_indexers(session)
+    sources = await query_prowlarr(
+        session,
+        client_session,
+        book,
+        force_refresh=force_refresh,
+        only_return_if_cached=only_return_if_cached,
+        indexer_ids=indexer_ids,
+        on_batch=on_sources,
+    )
+    if sources is None:
         return QueryResult(
-            sources=ranked,
+            sources=None,
             book=book,
-            state="ok",
+            state="uncached",
         )
 
+    if start_auto_download:
+        # auto downloading only requires the best source
+        ranked = await rank_sources(session, client_session, sources, book, top_k=1)
+    else:
+        # ranking extracts the quality of every source, which can require downloads
+        cache_key = source_cache_key(session, book, indexer_ids)
+        ranked = get_cached_ranking(session, cache_key, book)
+        if ranked is None:
+            ranked = await rank_sources(session, client_session, sources, book)
+            cache_ranking(session, cache_key, book, ranked)
 
-async def background_start_query(asin: str, requester: User, auto_download: bool):
-    with next(get_session()) as session:
-        async with ClientSession(timeout=aiohttp.ClientTimeout(60)) as client_session:
-            await query_sources(
-                asin=asin,
+    # start download if requested
+    if start_auto_download and not book.downloaded and len(ranked) > 0:
+        if not (url := ranked[0].download_url or ranked[0].magnet_url):
+            raise HTTPException(status_code=500, detail=f"{ranked[0].guid} had no torrent or magnet link")
+
+        try:
+            await start_download_with_rename(
                 session=session,
                 client_session=client_session,
-                start_auto_download=auto_download,
+                guid=ranked[0].guid,
+                torrent_url=url,
+                indexer_id=ranked[0].indexer_id,
                 requester=requester,
+                book=book,
+                prowlarr_source=ranked[0],
             )
+        except DownloadError as e:
+            raise HTTPException(status_code=500, detail=e)
+
+        same_books = session.exec(select(Audiobook).where(Audiobook.asin == asin)).all()
+        for b in same_books:
+            b.downloaded = True
+            session.add(b)
+        session.commit()
+
+    return QueryResult(
+        sources=ranked,
+        book=book,
+        state="ok",
+    )
@@ -0,0 +1,318 @@
+"""
+Persistent queue for background source queries. Jobs are stored in the database, so
+they survive restarts, and are run by a fixed amount of workers in priority order.
+Failed jobs are retried with an exponential backoff.
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from enum import IntEnum
+from typing import cast, final
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import CursorResult, delete, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, select
+
+from app.internal.env_settings import Settings
+from app.internal.models import QueryJob, QueryJobState, User
+from app.internal.query import LEASE_TTL, query_sources, release_expired_leases
+from app.util.connection import client_registry
+from app.util.db import get_session
+from app.util.log import logger
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30
+"""Seconds until the first retry. Doubles with every attempt."""
+POLL_INTERVAL = 5
+"""Seconds between checks for jobs that became due"""
+FINISHED_JOB_TTL = 60 * 60 * 24 * 7
+CLEANUP_INTERVAL = 60 * 60
+
+
+class QueryJobPriority(IntEnum):
+    interactive = 0
+    request = 10
+    bulk = 20
+
+
+def enqueue_query(
+    session: Session,
+    asin: str,
+    requester: User,
+    *,
+    priority: QueryJobPriority,
+    auto_download: bool = False,
+    force_refresh: bool = False,
+) -> QueryJob:
+    """
+    Adds a query job for the book. If the book already has a queued job, that job is
+    updated instead, so that every book is only queried once. Downloads are started
+    in the name of the requester, so auto-download jobs of other users are not
+    reused.
+    """
+    query = select(QueryJob).where(
+        QueryJob.asin == asin, QueryJob.state == QueryJobState.queued
+    )
+    if auto_download:
+        query = query.where(
+            or_(
+                col(QueryJob.auto_download).is_(False),
+                col(QueryJob.requester_username) == requester.username,
+            )
+        )
+    job = session.exec(query).first()
+    if job:
+        if auto_download and not job.auto_download:
+            job.requester_username = requester.username
+        job.priority = min(job.priority, priority)
+        job.auto_download = job.auto_download or auto_download
+        job.force_refresh = job.force_refresh or force_refresh
+        job.run_after = min(job.run_after, datetime.now())
+    else:
+        job = QueryJob(
+            asin=asin,
+            requester_username=requester.username,
+            priority=priority,
+            auto_download=auto_download,
+            force_refresh=force_refresh,
+        )
+    session.add(job)
+    session.commit()
+    logger.debug("Queued source query", asin=asin, priority=priority.name)
+
+    query_queue.wake()
+    return job
+
+
+def _claim_next_job(session: Session) -> QueryJob | None:
+    """
+    Marks the next due job as running, which gives it the lease of its book. Jobs of
+    books that are already being queried are skipped. The conditional update makes
+    sure no job is claimed twice and the unique index that no book is leased twice.
+    """
+    now = datetime.now()
+    running_asins = select(QueryJob.asin).where(QueryJob.state == QueryJobState.running)
+    candidates = session.exec(
+        select(QueryJob)
+        .where(
+            QueryJob.state == QueryJobState.queued,
+            col(QueryJob.run_after) <= now,
+            col(QueryJob.asin).not_in(running_asins),
+        )
+        .order_by(col(QueryJob.priority), col(QueryJob.created_at))
+        .limit(10)
+    ).all()
+    for job in candidates:
+        try:
+            result = cast(
+                CursorResult[QueryJob],
+                session.execute(
+                    update(QueryJob)
+                    .where(
+                        col(QueryJob.id) == job.id,
+                        col(QueryJob.state) == QueryJobState.queued,
+                    )
+                    .values(
+                        state=QueryJobState.running,
+                        started_at=now,
+                        lease_expires_at=now + timedelta(seconds=LEASE_TTL),
+                        attempts=col(QueryJob.attempts) + 1,
+                    )
+                ),
+            )
+            session.commit()
+        except IntegrityError:
+            # the book was leased in the meantime
+            session.rollback()
+            continue
+        if result.rowcount == 1:
+            session.refresh(job)
+            return job
+    return None
+
+
+def _finish_job(session: Session, job: QueryJob, error: str | None, retry: bool):
+    job.last_error = error
+    if error is None:
+        job.state = QueryJobState.done
+    elif retry and job.attempts < MAX_ATTEMPTS:
+        job.state = QueryJobState.queued
+        job.run_after = datetime.now() + timedelta(
+            seconds=RETRY_DELAY * 2.0 ** (job.attempts - 1)
+        )
+        logger.warning(
+            "Source query failed, retrying",
+            asin=job.asin,
+            attempts=job.attempts,
+            retry_at=job.run_after,
+            error=error,
+        )
+    else:
+        job.state = QueryJobState.failed
+        logger.error(
+            "Source query failed", asin=job.asin, attempts=job.attempts, error=error
+        )
+    if job.state != QueryJobState.queued:
+        job.finished_at = datetime.now()
+    session.add(job)
+    session.commit()
+
+
+async def _run_job(session: Session, job: QueryJob):
+    requester = session.get(User, job.requester_username)
+    if requester is None:
+        _finish_job(session, job, "Requester does not exist anymore", retry=False)
+        return
+
+    try:
+        _ = await query_sources(
+            asin=job.asin,
+            session=session,
+            client_session=client_registry.get("prowlarr"),
+            requester=requester,
+            force_refresh=job.force_refresh,
+            start_auto_download=job.auto_download,
+            job_id=job.id,
+        )
+    except HTTPException as e:
+        # client errors like a missing book or configuration don't resolve by retrying
+        session.rollback()
+        _finish_job(session, job, str(e.detail), retry=e.status_code >= 500)
+    except Exception as e:
+        session.rollback()
+        _finish_job(session, job, str(e) or type(e).__name__, retry=True)
+    else:
+        _finish_job(session, job, None, retry=False)
+
+
+def clear_finished_jobs(session: Session):
+    result = cast(
+        CursorResult[QueryJob],
+        session.execute(
+            delete(QueryJob).where(
+                col(QueryJob.state).in_([QueryJobState.done, QueryJobState.failed]),
+                col(QueryJob.finished_at)
+                < datetime.now() - timedelta(seconds=FINISHED_JOB_TTL),
+            )
+        ),
+    )
+    session.commit()
+    logger.debug("Cleared finished query jobs", rowcount=result.rowcount)
+
+
+class QueueStats(BaseModel, frozen=True):
+    queued: int
+    running: int
+    failed: int
+    oldest_queued_seconds: float
+    avg_wait_seconds: float
+    """Average time finished jobs waited in the queue before they started"""
+    avg_run_seconds: float
+    workers: int
+
+
+def get_queue_stats(session: Session) -> QueueStats:
+    counts = dict(
+        session.exec(
+            select(QueryJob.state, func.count()).group_by(col(QueryJob.state))
+        ).all()
+    )
+    now = datetime.now()
+    oldest = session.exec(
+        select(func.min(QueryJob.created_at)).where(
+            QueryJob.state == QueryJobState.queued
+        )
+    ).one()
+    finished = session.exec(
+        select(QueryJob).where(
+            col(QueryJob.state).in_([QueryJobState.done, QueryJobState.failed]),
+            col(QueryJob.finished_at) > now - timedelta(days=1),
+        )
+    ).all()
+    waits = [
+        (job.started_at - job.created_at).total_seconds()
+        for job in finished
+        if job.started_at
+    ]
+    runs = [
+        (job.finished_at - job.started_at).total_seconds()
+        for job in finished
+        if job.started_at and job.finished_at
+    ]
+    return QueueStats(
+        queued=counts.get(QueryJobState.queued, 0),
+        running=counts.get(QueryJobState.running, 0),
+        failed=counts.get(QueryJobState.failed, 0),
+        oldest_queued_seconds=(now - oldest).total_seconds() if oldest else 0,
+        avg_wait_seconds=sum(waits) / len(waits) if waits else 0,
+        avg_run_seconds=sum(runs) / len(runs) if runs else 0,
+        workers=query_queue.workers,
+    )
+
+
+@final
+class QueryQueue:
+    def __init__(self):
+        self.workers = 0
+        self._cleared_at = time.time()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._stop_event = asyncio.Event()
+        self._wake_event = asyncio.Event()
+
+    def start(self):
+        with next(get_session()) as session:
+            # jobs of other app workers keep their lease, crashed ones are run again
+            release_expired_leases(session)
+            clear_finished_jobs(session)
+
+        self.workers = max(1, Settings().app.query_workers)
+        self._stop_event.clear()
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        for task in self._tasks:
+            _ = task.cancel()
+        _ = await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        self._wake_event.set()
+
+    async def _worker(self, worker_id: int):
+        logger.debug("Started query worker", worker=worker_id)
+        while not self._stop_event.is_set():
+            # cleared before claiming, so jobs queued during the claim wake us again
+            self._wake_event.clear()
+            job_id: uuid.UUID | None = None
+            try:
+                with next(get_session()) as session:
+                    if time.time() - self._cleared_at > CLEANUP_INTERVAL:
+                        self._cleared_at = time.time()
+                        clear_finished_jobs(session)
+                    release_expired_leases(session)
+                    job = _claim_next_job(session)
+                    if job:
+                        job_id = job.id
+                        logger.info(
+                            "Running source query", asin=job.asin, attempt=job.attempts
+                        )
+                        await _run_job(session, job)
+                        continue
+            except Exception as e:
+                logger.error("Query worker failed", job=job_id, error=e)
+
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+query_queue = QueryQueue()
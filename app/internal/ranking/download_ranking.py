@@ -1,16 +1,16 @@
 import asyncio
-from functools import cmp_to_key
-from typing import Callable, final
+import heapq
+from dataclasses import dataclass
+from typing import Callable, Literal, final
 
 import pydantic
 from aiohttp import ClientSession
-from rapidfuzz import fuzz, utils
+from rapidfuzz import fuzz, process, utils
 from sqlmodel import Session
 
 from app.internal.models import Audiobook, ProwlarrSource, author_to_name_list
-from app.internal.ranking.quality import quality_config
+from app.internal.ranking.quality import CompiledQualityProfile, quality_config
 from app.internal.ranking.quality_extract import Quality, extract_qualities
-from app.util.log import logger
 
 
 class RankSource(pydantic.BaseModel):
@@ -23,7 +23,16 @@ async def rank_sources(
     client_session: ClientSession,
     sources: list[ProwlarrSource],
     book: Audiobook,
+    top_k: int | None = None,
 ) -> list[ProwlarrSource]:
+    """
+    Ranks the sources from best to worst.
+
+    If `top_k` is given, only the best `top_k` valid sources are returned. Sources
+    failing the quality or seeder checks are then dropped before any fuzzy matching
+    happens and the best sources are selected without sorting all of them.
+    """
+
     async def get_qualities(source: ProwlarrSource):
         qualities = await extract_qualities(session, client_session, source, book)
         return [RankSource(source=source, quality=q) for q in qualities]
@@ -31,326 +40,253 @@ async def rank_sources(
     coros = [get_qualities(source) for source in sources]
     rank_sources = [x for y in await asyncio.gather(*coros) for x in y]
 
-    compare = CompareSource(session, book)
-    rank_sources.sort(key=cmp_to_key(compare))
+    ranker = SourceRanker(quality_config.compile(session), book)
+    if top_k is not None:
+        ranked = ranker.best(rank_sources, top_k)
+    else:
+        ranked = ranker.rank(rank_sources)
 
-    return [rs.source for rs in rank_sources]
+    return [rs.source for rs in ranked]
 
 
-@final
-class CompareSource:
-    def __init__(self, session: Session, book: Audiobook):
-        self.session = session
-        self.book = book
-        self.compare_order = [
-            self._compare_valid,
-            self._compare_title,
-            self._compare_authors,
-            self._compare_narrators,
-            self._compare_format,
-            self._compare_flags,
-            self._compare_indexer,
-            self._compare_subtitle,
-            self._compare_seeders,
-            self._compare_age,
-        ]
+SortKey = tuple[bool, bool, int, int, int, int, int, bool, int, float]
+
+
+@dataclass(frozen=True)
+class SourceFeatures:
+    """All the values of a source that are relevant for ranking it."""
+
+    valid: bool
+    title_match: bool
+    author_score: int
+    narrator_score: int
+    format_rank: int
+    flag_score: int
+    indexer_rank: int
+    subtitle_match: bool
+    protocol: Literal["torrent", "usenet"]
+    seeders: int
+    publish_timestamp: float
 
-    def __call__(self, a: RankSource, b: RankSource):
-        return self.compare(a, b)
-
-    def compare(self, a: RankSource, b: RankSource) -> int:
-        return self._get_next_compare(0)(a, b, 1)
-
-    def _get_next_compare(
-        self, index: int
-    ) -> Callable[[RankSource, RankSource, int], int]:
-        def default_compare(a: RankSource, b: RankSource, next_compare: int) -> int:
-            _, _, _ = a, b, next_compare
-            return 0
-
-        if index < len(self.compare_order):
-            return self.compare_order[index]
-        return default_compare
-
-    def _is_valid_quality(self, a: RankSource) -> bool:
-        match a.quality.file_format:
-            case "flac":
-                quality_range = quality_config.get_range(self.session, "quality_flac")
-            case "m4b":
-                quality_range = quality_config.get_range(self.session, "quality_m4b")
-            case "mp3":
-                quality_range = quality_config.get_range(self.session, "quality_mp3")
-            case "unknown-audio":
-                quality_range = quality_config.get_range(
-                    self.session, "quality_unknown_audio"
-                )
-            case "unknown":
-                quality_range = quality_config.get_range(
-                    self.session, "quality_unknown"
-                )
-
-        return quality_range.from_kbits < a.quality.kbits < quality_range.to_kbits
-
-    def _has_minimum_match(self, a: RankSource) -> bool:
-        """Check if source has at least a minimal match with the book.
-
-        Requires either:
-        - Title match, OR
-        - At least one author/narrator match
+    def sort_key(self) -> SortKey:
         """
-        title_ratio = quality_config.get_title_exists_ratio(self.session)
-        name_ratio = quality_config.get_name_exists_ratio(self.session)
-
-        # Check title match
-        title_match = exists_in_title(
-            self.book.title,
-            a.source.title,
-            title_ratio,
+        Sources are sorted ascending by this key. The order of the elements
+        decides the priority of each feature.
+        """
+        if self.protocol == "torrent":
+            seeders = -self.seeders
+            age = -self.publish_timestamp
+        else:
+            seeders = 0
+            age = self.publish_timestamp
+        return (
+            not self.valid,
+            not self.title_match,
+            -self.author_score,
+            -self.narrator_score,
+            self.format_rank,
+            -self.flag_score,
+            self.indexer_rank,
+            not self.subtitle_match,
+            seeders,
+            age,
         )
 
-        if title_match:
-            logger.debug(
-                "Title matches",
-                book_title=self.book.title,
-                source_title=a.source.title,
-                ratio=title_ratio,
-            )
-            return True
-
-        # Check author/narrator match
-        author_score = max(
-            vaguely_exist_in_title(
-                author_to_name_list( self.book.authors ),
-                a.source.title,
-                name_ratio,
-            ),
-            fuzzy_author_narrator_match(
-                a.source.book_metadata.authors,
-                author_to_name_list( self.book.authors ),
-                name_ratio,
-            ),
-        )
 
-        narrator_score = max(
-            vaguely_exist_in_title(
-                self.book.narrators,
-                a.source.title,
-                name_ratio,
-            ),
-            fuzzy_author_narrator_match(
-                a.source.book_metadata.narrators,
-                self.book.narrators,
-                name_ratio,
-            ),
-        )
+@final
+class SourceRanker:
+    """
+    Extracts the ranking features of sources for a book. All config values
+    come from the compiled quality profile, so that computing the features
+    of the sources does not touch the database.
+    """
+
+    def __init__(self, profile: CompiledQualityProfile, book: Audiobook):
+        self.profile = profile
+        self.book = book
 
-        # Require at least one author OR one narrator match
-        return author_score > 0 or narrator_score > 0
+    def rank(self, rank_sources: list[RankSource]) -> list[RankSource]:
+        features = self.features(rank_sources)
+        ranked = sorted(zip(features, rank_sources), key=_pair_sort_key)
+        return [rs for _, rs in ranked]
 
-    def _compare_valid(self, a: RankSource, b: RankSource, next_compare: int) -> int:
+    def best(self, rank_sources: list[RankSource], k: int) -> list[RankSource]:
+        """
+        Returns the best `k` valid sources in the same order as `rank` would.
+        Invalid sources are never returned.
+        """
+        candidates = [rs for rs in rank_sources if self._is_valid(rs)]
+        features = self.features(candidates)
+        best = heapq.nsmallest(
+            k,
+            (pair for pair in zip(features, candidates) if pair[0].valid),
+            key=_pair_sort_key,
+        )
+        return [rs for _, rs in best]
+
+    def features(self, rank_sources: list[RankSource]) -> list[SourceFeatures]:
+        scores = score_source_matches(
+            self.book,
+            [rs.source for rs in rank_sources],
+            self.profile.title_exists_ratio,
+            self.profile.name_exists_ratio,
+        )
+        return [
+            SourceFeatures(
+                valid=self._is_valid(a)
+                and (
+                    scores.title_match[i]
+                    or scores.author_score[i] > 0
+                    or scores.narrator_score[i] > 0
+                ),
+                title_match=scores.title_match[i],
+                author_score=scores.author_score[i],
+                narrator_score=scores.narrator_score[i],
+                format_rank=self.profile.format_rank(a.quality.file_format),
+                flag_score=self.profile.flag_score(a.source.indexer_flags),
+                indexer_rank=self.profile.indexer_rank(a.source.indexer_id),
+                subtitle_match=scores.subtitle_match[i],
+                protocol=a.source.protocol,
+                seeders=a.source.seeders if a.source.protocol == "torrent" else 0,
+                publish_timestamp=a.source.publish_date.timestamp(),
+            )
+            for i, a in enumerate(rank_sources)
+        ]
+
+    def _is_valid(self, a: RankSource) -> bool:
         """Filter out any reasons that make it not valid"""
+        quality_range = self.profile.ranges[a.quality.file_format]
+        if not quality_range.from_kbits < a.quality.kbits < quality_range.to_kbits:
+            return False
         if a.source.protocol == "torrent":
-            a_valid = self._is_valid_quality(
-                a
-            ) and a.source.seeders >= quality_config.get_min_seeders(self.session)
-        else:
-            a_valid = self._is_valid_quality(a)
+            return a.source.seeders >= self.profile.min_seeders
+        return True
 
-        if b.source.protocol == "torrent":
-            b_valid = self._is_valid_quality(
-                b
-            ) and b.source.seeders >= quality_config.get_min_seeders(self.session)
-        else:
-            b_valid = self._is_valid_quality(b)
-
-        # Check if the source has a reasonable match with the book
-        # Require either title match OR (author/narrator match)
-        a_valid = a_valid and self._has_minimum_match(a)
-        b_valid = b_valid and self._has_minimum_match(b)
-
-        if a_valid == b_valid:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return int(b_valid) - int(a_valid)
-
-    def _compare_format(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        if a.quality.file_format == b.quality.file_format:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        a_index = quality_config.calculate_quality_rank(
-            self.session, a.quality.file_format
-        )
-        b_index = quality_config.calculate_quality_rank(
-            self.session, b.quality.file_format
-        )
-        return a_index - b_index
 
-    def _compare_flags(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        a_score = sum(
-            f.score
-            for f in quality_config.get_indexer_flags(self.session)
-            if f.flag.lower() in a.source.indexer_flags
-        )
-        b_score = sum(
-            f.score
-            for f in quality_config.get_indexer_flags(self.session)
-            if f.flag.lower() in b.source.indexer_flags
-        )
-        if a_score == b_score:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return b_score - a_score
+def _pair_sort_key(pair: tuple[SourceFeatures, RankSource]) -> SortKey:
+    return pair[0].sort_key()
 
-    def _compare_indexer(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        a_index = quality_config.calculate_indexer_rank(
-            self.session, a.source.indexer_id
-        )
-        b_index = quality_config.calculate_indexer_rank(
-            self.session, b.source.indexer_id
-        )
-        if a_index == b_index:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return a_index - b_index
-
-    def _compare_title(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        a_title = exists_in_title(
-            self.book.title,
-            a.source.title,
-            quality_config.get_title_exists_ratio(self.session),
-        )
-        b_title = exists_in_title(
-            self.book.title,
-            b.source.title,
-            quality_config.get_title_exists_ratio(self.session),
-        )
-        if a_title == b_title:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return int(b_title) - int(a_title)
-
-    def _compare_subtitle(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        if not self.book.subtitle:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        a_title = exists_in_title(
-            self.book.subtitle,
-            a.source.title,
-            quality_config.get_title_exists_ratio(self.session),
-        )
-        b_title = exists_in_title(
-            self.book.subtitle,
-            b.source.title,
-            quality_config.get_title_exists_ratio(self.session),
-        )
-        if a_title == b_title:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return int(b_title) - int(a_title)
-
-    def _compare_authors(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        a_score = max(
-            vaguely_exist_in_title(
-                author_to_name_list( self.book.authors ),
-                a.source.title,
-                quality_config.get_name_exists_ratio(self.session),
-            ),
-            fuzzy_author_narrator_match(
-                a.source.book_metadata.authors,
-                author_to_name_list( self.book.authors ),
-                quality_config.get_name_exists_ratio(self.session),
-            ),
-        )
-        b_score = max(
-            vaguely_exist_in_title(
-                author_to_name_list( self.book.authors ),
-                b.source.title,
-                quality_config.get_name_exists_ratio(self.session),
-            ),
-            fuzzy_author_narrator_match(
-                b.source.book_metadata.authors,
-                author_to_name_list( self.book.authors ),
-                quality_config.get_name_exists_ratio(self.session),
-            ),
+
+@dataclass(frozen=True)
+class MatchScores:
+    """How well each source matches the book. Indexed the same as the sources."""
+
+    title_match: list[bool]
+    subtitle_match: list[bool]
+    author_score: list[int]
+    narrator_score: list[int]
+
+
+def score_source_matches(
+    book: Audiobook,
+    sources: list[ProwlarrSource],
+    title_exists_ratio: int,
+    name_exists_ratio: int,
+) -> MatchScores:
+    """
+    Scores all sources against the book at once. Every string is only processed
+    a single time and each book string is compared against all source titles
+    or names with a single rapidfuzz call.
+    """
+    titles = [utils.default_process(source.title) for source in sources]
+    authors = [utils.default_process(a) for a in author_to_name_list(book.authors)]
+    narrators = [utils.default_process(n) for n in book.narrators]
+
+    title_match = _exists_in_titles(
+        utils.default_process(book.title), titles, title_exists_ratio
+    )
+    if book.subtitle:
+        subtitle_match = _exists_in_titles(
+            utils.default_process(book.subtitle), titles, title_exists_ratio
         )
-        if a_score == b_score:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return b_score - a_score
-
-    def _compare_narrators(
-        self, a: RankSource, b: RankSource, next_compare: int
-    ) -> int:
-        a_score = max(
-            vaguely_exist_in_title(
-                self.book.narrators,
-                a.source.title,
-                quality_config.get_name_exists_ratio(self.session),
-            ),
-            fuzzy_author_narrator_match(
-                a.source.book_metadata.narrators,
-                self.book.narrators,
-                quality_config.get_name_exists_ratio(self.session),
+    else:
+        subtitle_match = [False] * len(sources)
+
+    author_score = [
+        max(in_title, in_metadata)
+        for in_title, in_metadata in zip(
+            _count_in_titles(authors, titles, name_exists_ratio),
+            _count_in_names(
+                authors,
+                [source.book_metadata.authors for source in sources],
+                name_exists_ratio,
             ),
         )
-        b_score = max(
-            vaguely_exist_in_title(
-                self.book.narrators,
-                b.source.title,
-                quality_config.get_name_exists_ratio(self.session),
-            ),
-            fuzzy_author_narrator_match(
-                b.source.book_metadata.narrators,
-                self.book.narrators,
-                quality_config.get_name_exists_ratio(self.session),
+    ]
+    narrator_score = [
+        max(in_title, in_metadata)
+        for in_title, in_metadata in zip(
+            _count_in_titles(narrators, titles, name_exists_ratio),
+            _count_in_names(
+                narrators,
+                [source.book_metadata.narrators for source in sources],
+                name_exists_ratio,
             ),
         )
-        if a_score == b_score:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return b_score - a_score
-
-    def _compare_seeders(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        if a.source.protocol == "usenet" or b.source.protocol == "usenet":
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        if a.source.seeders == b.source.seeders:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        return b.source.seeders - a.source.seeders
-
-    def _compare_age(self, a: RankSource, b: RankSource, next_compare: int) -> int:
-        if a.source.protocol != b.source.protocol:
-            return self._get_next_compare(next_compare)(a, b, next_compare + 1)
-        if a.source.protocol == "usenet":
-            # With usenets: newer => better
-            return int((a.source.publish_date - b.source.publish_date).total_seconds())
-        # With torrents: older => better
-        return int((b.source.publish_date - a.source.publish_date).total_seconds())
-
-
-def fuzzy_author_narrator_match(
-    source_people: list[str], book_people: list[str], name_exists_ratio: int
-) -> int:
-    """Calculate a fuzzy matching score between two lists of author/narrator names."""
-    if not source_people or not book_people:
-        return 0
-    score = 0
-    for book_person in book_people:
-        best_match = 0.0
-        for source_person in source_people:
-            match_score = fuzz.token_set_ratio(
-                book_person, source_person, processor=utils.default_process
-            )
-            best_match = max(best_match, match_score)
+    ]
 
-        # Only count matches above threshold
-        if best_match > name_exists_ratio:
-            score += 1
-
-    return score
-
-
-def vaguely_exist_in_title(words: list[str], title: str, name_exists_ratio: int) -> int:
-    return sum(
-        1
-        for w in words
-        if fuzz.token_set_ratio(w, title, processor=utils.default_process)
-        > name_exists_ratio
+    return MatchScores(
+        title_match=title_match,
+        subtitle_match=subtitle_match,
+        author_score=author_score,
+        narrator_score=narrator_score,
     )
 
 
-def exists_in_title(word: str, title: str, title_exists_ratio: int) -> bool:
-    return (
-        fuzz.partial_ratio(word, title, processor=utils.default_process)
-        > title_exists_ratio
-    )
+def _matching_indices(
+    query: str,
+    choices: list[str],
+    scorer: Callable[..., float],
+    ratio: int,
+) -> set[int]:
+    """Indices of all (already processed) choices that score above the ratio."""
+    return {
+        index
+        for _, score, index in process.extract(
+            query,
+            choices,
+            scorer=scorer,
+            processor=None,
+            limit=None,
+            score_cutoff=ratio,
+        )
+        if score > ratio
+    }
+
+
+def _exists_in_titles(word: str, titles: list[str], ratio: int) -> list[bool]:
+    matches = _matching_indices(word, titles, fuzz.partial_ratio, ratio)
+    return [i in matches for i in range(len(titles))]
+
+
+def _count_in_titles(words: list[str], titles: list[str], ratio: int) -> list[int]:
+    """For each title, counts how many of the words vaguely exist in it."""
+    counts = [0] * len(titles)
+    for word in words:
+        for i in _matching_indices(word, titles, fuzz.token_set_ratio, ratio):
+            counts[i] += 1
+    return counts
+
+
+def _count_in_names(
+    book_people: list[str], source_people: list[list[str]], ratio: int
+) -> list[int]:
+    """
+    For each list of source authors/narrators, counts how many of the (already
+    processed) book authors/narrators have a fuzzy match in it.
+    """
+    counts = [0] * len(source_people)
+    names: list[str] = []
+    owners: list[int] = []
+    for i, people in enumerate(source_people):
+        for person in people:
+            names.append(utils.default_process(person))
+            owners.append(i)
+    if not names:
+        return counts
+
+    for book_person in book_people:
+        matched = _matching_indices(book_person, names, fuzz.token_set_ratio, ratio)
+        for owner in {owners[i] for i in matched}:
+            counts[owner] += 1
+    return counts
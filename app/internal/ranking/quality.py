@@ -53,12 +53,48 @@ class IndexerFlag(pydantic.BaseModel):
     score: int
 
 
+quality_range_keys: dict[FileFormat, QualityFormatKey] = {
+    "flac": "quality_flac",
+    "m4b": "quality_m4b",
+    "mp3": "quality_mp3",
+    "unknown-audio": "quality_unknown_audio",
+    "unknown": "quality_unknown",
+}
+
+
+class CompiledQualityProfile(pydantic.BaseModel, frozen=True):
+    """
+    Immutable snapshot of the quality profile with all values already parsed.
+    Used while ranking sources so no config values have to be read or parsed.
+    """
+
+    ranges: dict[FileFormat, QualityRange]
+    flag_scores: dict[str, int]
+    format_ranks: dict[FileFormat, int]
+    unranked_format: int
+    indexer_ranks: dict[int, int]
+    unranked_indexer: int
+    name_exists_ratio: int
+    title_exists_ratio: int
+    min_seeders: int
+
+    def format_rank(self, file_format: FileFormat) -> int:
+        return self.format_ranks.get(file_format, self.unranked_format)
+
+    def indexer_rank(self, indexer_id: int) -> int:
+        return self.indexer_ranks.get(indexer_id, self.unranked_indexer)
+
+    def flag_score(self, indexer_flags: list[str]) -> int:
+        return sum(self.flag_scores.get(flag, 0) for flag in set(indexer_flags))
+
+
 @final
 class QualityProfile(StringConfigCache[QualityConfigKey]):
     _default_quality_range = QualityRange(from_kbits=20.0, to_kbits=400.0)
     _default_name_exists_ratio: int = 75
     _default_title_exists_ratio: int = 90
     _default_min_seeders = 2
+    _compiled: tuple[int, CompiledQualityProfile] | None = None
 
     def reset_all(self, session: Session):
         # TODO: find a way so values don't have to be repeated here
@@ -145,19 +181,46 @@ class QualityProfile(StringConfigCache[QualityConfigKey]):
     def set_min_seeders(self, session: Session, min_seeders: int):
         self.set_int(session, "quality_min_seeders", min_seeders)
 
-    def calculate_quality_rank(self, session: Session, file_format: FileFormat) -> int:
+    def compile(self, session: Session) -> CompiledQualityProfile:
+        """
+        Returns a snapshot of the quality profile. The snapshot is reused until
+        any config value changes.
+        """
+        version = self.get_version(session)
+        if self._compiled and self._compiled[0] == version:
+            return self._compiled[1]
+
+        flag_scores: dict[str, int] = {}
+        for flag in self.get_indexer_flags(session):
+            key = flag.flag.lower()
+            flag_scores[key] = flag_scores.get(key, 0) + flag.score
         format_order = self.get_format_order(session)
-        try:
-            return format_order.index(file_format)
-        except ValueError:
-            return len(format_order)
-
-    def calculate_indexer_rank(self, session: Session, indexer_id: int) -> int:
         indexer_order = self.get_indexer_order(session)
-        try:
-            return indexer_order.index(indexer_id)
-        except ValueError:
-            return len(indexer_order)
+
+        compiled = CompiledQualityProfile(
+            ranges={
+                file_format: self.get_range(session, key)
+                for file_format, key in quality_range_keys.items()
+            },
+            flag_scores=flag_scores,
+            format_ranks=_first_indices(format_order),
+            unranked_format=len(format_order),
+            indexer_ranks=_first_indices(indexer_order),
+            unranked_indexer=len(indexer_order),
+            name_exists_ratio=self.get_name_exists_ratio(session),
+            title_exists_ratio=self.get_title_exists_ratio(session),
+            min_seeders=self.get_min_seeders(session),
+        )
+        self._compiled = (version, compiled)
+        return compiled
+
+
+def _first_indices[T](values: list[T]) -> dict[T, int]:
+    """Maps each value to its first index, the same as `list.index`."""
+    indices: dict[T, int] = {}
+    for i, value in enumerate(values):
+        _ = indices.setdefault(value, i)
+    return indices
 
 
 quality_config = QualityProfile()
@@ -65,13 +65,11 @@ def get_popular_books(
     results = session.exec(query).all()
     logger.debug(f"Popular books query returned {len(results)} results")
 
+    books_with_requests = AudiobookWithRequests.from_books(
+        session, [book for book, _ in results], exclude_requested_username
+    )
     popular: list[AudiobookPopularity] = []
-    for book, request_count in results:
-        book_with_requests = AudiobookWithRequests(
-            book=book,
-            requests=book.requests,
-            username=exclude_requested_username,
-        )
+    for book_with_requests, (book, request_count) in zip(books_with_requests, results):
         popular.append(
             AudiobookPopularity(
                 book=book_with_requests,
@@ -111,14 +109,9 @@ def get_recently_requested_books(
     results = session.exec(query).all()
     logger.debug(f"Recently requested books query returned {len(results)} results")
 
-    return [
-        AudiobookWithRequests(
-            book=book,
-            requests=book.requests,
-            username=exclude_requested_username,
-        )
-        for book in results
-    ]
+    return AudiobookWithRequests.from_books(
+        session, results, exclude_requested_username
+    )
 
 
 class AuthorNarrators(BaseModel):
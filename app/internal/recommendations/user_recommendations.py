@@ -6,9 +6,10 @@ from typing import Counter, Iterable
 
 from aiohttp import ClientSession
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import Session, col, select
 
 from app.internal.audible.similar import list_similar_audible_books
+from app.internal.audible.single import get_many_books
 from app.internal.models import Audiobook, AudiobookRequest, AudiobookWithRequests, User, author_to_name_list
 from app.util.censor import censor
 from app.util.log import logger
@@ -86,9 +87,24 @@ async def get_user_sims_recommendations(
         )
         return UserSimsRecommendation(recommendations=[], total=0)
 
+    # seeds we don't have are looked up together, instead of one by one by the
+    # fallback of every sims lookup
+    known = set(
+        session.exec(select(Audiobook.asin).where(col(Audiobook.asin).in_(seeds))).all()
+    )
+    missing = [asin for asin in seeds if asin not in known]
+    seed_books: dict[str, Audiobook] = {}
+    if missing:
+        try:
+            seed_books = await get_many_books(missing)
+        except Exception as e:
+            logger.debug("Fetch seed books failed", asins=missing, error=str(e))
+
     async def _fetch(asin: str) -> list[_RankedRecommendation]:
         try:
-            books = await list_similar_audible_books(session, client_session, asin)
+            books = await list_similar_audible_books(
+                session, client_session, asin, seed=seed_books.get(asin)
+            )
             return [
                 _RankedRecommendation(book=b, rank=idx) for idx, b in enumerate(books)
             ]
@@ -223,13 +239,12 @@ async def get_user_sims_recommendations(
     ordered_books = diversified + remainder
 
     # Convert to BookSearchResult and apply limit
+    page = ordered_books[offset : offset + limit]
+    books_with_requests = AudiobookWithRequests.from_books(
+        session, [sim.book for sim in page], censor(user.username)
+    )
     results: list[AudiobookRecommendation] = []
-    for sim in ordered_books[offset : offset + limit]:
-        book_with_requests = AudiobookWithRequests(
-            book=sim.book,
-            requests=sim.book.requests,
-            username=censor(user.username),
-        )
+    for sim, book_with_requests in zip(page, books_with_requests):
         results.append(
             AudiobookRecommendation(
                 book=book_with_requests,
@@ -17,7 +17,7 @@ from starlette.responses import Content
 from app.internal.postprocessing.config import postprocessing_config
 from app.util.log import logger
 
-from app.internal.audible.search import clear_old_book_caches
+from app.internal.audible.cache import start_cache_cleanup, stop_cache_cleanup
 from app.internal.auth.authentication import RequiresLoginException
 from app.internal.auth.config import auth_config, initialize_force_login_type
 from app.internal.auth.oidc_config import InvalidOIDCConfiguration
@@ -28,7 +28,10 @@ from app.internal.auth.session_middleware import (
 from app.internal.env_settings import Settings
 from app.internal.models import User
 from app.internal.prowlarr.util import ProwlarrMisconfigured
+from app.internal.query_queue import query_queue
 from app.routers import api, pages
+from app.util.cache import preload_config_cache
+from app.util.connection import client_registry
 from app.util.db import get_session
 from app.util.downloadclient import (
     get_global_downloadclient,
@@ -49,9 +52,9 @@ from app.util.toast import ToastException
 fetch_scripts(Settings().app.debug)
 
 with next(get_session()) as session:
+    preload_config_cache(session)
     auth_secret = auth_config.get_auth_secret(session)
     initialize_force_login_type(session)
-    clear_old_book_caches(session)
 
 
 @asynccontextmanager
@@ -67,9 +70,16 @@ async def lifespan(_: FastAPI) -> AsyncGenerator[None, None]:
     if postprocessing_config.get_auto_moving(session):
         start_download_monitor()
 
+    client_registry.start()
+    start_cache_cleanup()
+    query_queue.start()
+
     yield
 
+    await query_queue.stop()
     await stop_download_monitor()
+    await stop_cache_cleanup()
+    await client_registry.close()
 
 
 # TODO LIAM
@@ -21,7 +21,7 @@ from app.internal.recommendations.user_recommendations import (
     UserSimsRecommendation,
     get_user_sims_recommendations,
 )
-from app.util.connection import get_connection
+from app.util.connection import get_audible_connection
 from app.util.db import get_session
 
 router = APIRouter(prefix="/recommendations", tags=["Recommendations"])
@@ -30,7 +30,7 @@ router = APIRouter(prefix="/recommendations", tags=["Recommendations"])
 @router.get("/user", response_model=UserSimsRecommendation)
 async def get_user_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     seed_asins: Annotated[list[str] | None, Query(alias="seed_asins")] = None,
     limit: int = 20,
@@ -84,7 +84,7 @@ async def get_recently_requested_recommendations(
 @router.get("/fallback", response_model=list[Audiobook])
 async def get_fallback_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     limit: int = 10,
     audible_region: audible_region_type | None = None,
@@ -117,7 +117,7 @@ async def get_fallback_recommendations(
 @router.get("/categories", response_model=dict[str, list[Audiobook]])
 async def get_category_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     audible_region: audible_region_type | None = None,
 ) -> dict[str, list[AudiobookWithRequests]]:
@@ -137,7 +137,7 @@ async def get_category_recommendations(
 @router.get("/authors", response_model=list[AudiobookWithRequests])
 async def get_popular_authors_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     limit: int = 10,
     exclude_downloaded: bool = True,
@@ -165,7 +165,7 @@ async def get_popular_authors_recommendations(
 @router.get("/narrators", response_model=list[Audiobook])
 async def get_popular_narrators_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     limit: int = 10,
     exclude_downloaded: bool = True,
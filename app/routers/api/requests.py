@@ -10,7 +10,8 @@ from fastapi import (
     Response,
     Security,
 )
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from sqlmodel import Session, asc, col, delete, select
 
 from app.internal.audible.single import get_single_book
@@ -20,6 +21,7 @@ from app.internal.audible.types import (
     get_region_from_settings,
 )
 from app.internal.auth.authentication import AnyAuth, DetailedUser
+from app.internal.bulk_download import BulkDownloadFilter, bulk_auto_download
 from app.internal.db_queries import get_wishlist_results
 from app.internal.downloadclient.client import qBittorrentClient
 from app.internal.models import (
@@ -37,10 +39,11 @@ from app.internal.notifications import (
     send_all_notifications,
 )
 from app.internal.prowlarr.util import ProwlarrMisconfigured, prowlarr_config
-from app.internal.query import QueryResult, background_start_query, query_sources
+from app.internal.query import QueryResult, query_sources
+from app.internal.query_queue import QueryJobPriority, enqueue_query
 from app.internal.ranking.quality import quality_config
 from app.util.censor import censor
-from app.util.connection import get_connection
+from app.util.connection import get_prowlarr_connection
 from app.util.db import get_session
 from app.util.download import DownloadError, start_download_with_rename
 from app.util.downloadclient import get_global_downloadclient
@@ -56,10 +59,32 @@ class DownloadSourceBody(BaseModel):
     download_url: str
 
 
+class BulkAutoDownloadBody(BulkDownloadFilter, frozen=True):
+    concurrency: int | None = Field(default=None, ge=1, le=20)
+    """Defaults to the amount of query workers"""
+
+
+# defined before `/{asin}`, so that the path is not taken as an asin
+@router.post("/auto-download")
+async def bulk_auto_download_endpoint(
+    body: BulkAutoDownloadBody,
+    _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
+):
+    """
+    Starts the automatic download of all pending requests matching the filter.
+    Streams the progress of every book as JSON lines, followed by a summary report.
+    """
+
+    async def stream():
+        async for event in bulk_auto_download(body, body.concurrency):
+            yield event.model_dump_json() + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.post("/{asin}", response_model=Audiobook)
 async def create_request(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     background_task: BackgroundTasks,
     asin: str,
@@ -72,7 +97,7 @@ async def create_request(
 
     if not ( book := session.get(Audiobook, asin) ):
         try:
-            if not ( book := await get_single_book(client_session, asin=asin) ):
+            if not ( book := await get_single_book(asin=asin) ):
                 raise HTTPException(status_code=404, detail="Book not found")
             book.match_to_db( session)
             session.add(book)
@@ -114,10 +139,11 @@ async def create_request(
 
     if quality_config.get_auto_download(session) and user.is_above(GroupEnum.trusted):
         # start querying and downloading if auto download is enabled
-        background_task.add_task(
-            background_start_query,
-            asin=asin,
-            requester=User.model_validate(user),
+        _ = enqueue_query(
+            session,
+            asin,
+            User.model_validate(user),
+            priority=QueryJobPriority.request,
             auto_download=True,
         )
 
@@ -307,17 +333,18 @@ async def delete_manual_request(
 async def refresh_source(
     asin: str,
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     force_refresh: bool = False,
 ):
+    if not session.get(Audiobook, asin):
+        raise HTTPException(status_code=404, detail="Book not found")
     # causes the sources to be placed into cache once they're done
-    await query_sources(
-        asin=asin,
-        session=session,
-        client_session=client_session,
+    _ = enqueue_query(
+        session,
+        asin,
+        User.model_validate(user),
+        priority=QueryJobPriority.interactive,
         force_refresh=force_refresh,
-        requester=User.model_validate(user),
     )
     return Response(status_code=202)
 
@@ -326,7 +353,7 @@ async def refresh_source(
 async def list_sources(
     asin: str,
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     admin_user: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
     only_cached: bool = False,
 ):
@@ -353,7 +380,7 @@ async def download_book(
     body: DownloadSourceBody,
     session: Annotated[Session, Depends(get_session)],
     client_session: Annotated[
-        ClientSession, Depends(get_connection)
+        ClientSession, Depends(get_prowlarr_connection)
     ],
     admin_user: Annotated[
         DetailedUser, Security(AnyAuth(GroupEnum.admin))
@@ -361,7 +388,7 @@ async def download_book(
 ):
     
     if not ( book := session.get(Audiobook, asin) ):
-        if not (book := await get_single_book(client_session, asin)):
+        if not (book := await get_single_book(asin)):
             logger.error(
                 f"Could not find a book with asin {asin} and failed to create name for it"
             )
@@ -390,7 +417,7 @@ async def download_book(
 async def start_auto_download_endpoint(
     asin: str,
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.trusted))],
     download_client: Annotated[Optional[qBittorrentClient], Depends(get_global_downloadclient)]
 ):
@@ -4,7 +4,11 @@ from aiohttp import ClientSession
 from fastapi import APIRouter, Depends, HTTPException, Query, Security
 from sqlmodel import Session
 
-from app.internal.audible.search import get_search_suggestions, search_audible_books
+from app.internal.audible.search import (
+    get_search_suggestions,
+    search_audible_books,
+    search_local_books,
+)
 from app.internal.audible.types import (
     audible_region_type,
     audible_regions,
@@ -12,7 +16,7 @@ from app.internal.audible.types import (
 )
 from app.internal.auth.authentication import AnyAuth, DetailedUser
 from app.internal.models import AudiobookWithRequests
-from app.util.connection import get_connection
+from app.util.connection import get_audible_connection
 from app.util.db import get_session
 
 router = APIRouter(prefix="/search", tags=["Search"])
@@ -21,18 +25,25 @@ router = APIRouter(prefix="/search", tags=["Search"])
 @router.get("", response_model=list[AudiobookWithRequests])
 async def search_books(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(AnyAuth())],
     query: Annotated[str | None, Query(alias="q")] = None,
     num_results: int = 20,
     page: int = 0,
     region: audible_region_type | None = None,
+    local_only: bool = False,
 ):
+    """
+    Results from Audible are merged with books that are already known locally.
+    `local_only` skips Audible, which makes it fast enough for typeahead.
+    """
     if region is None:
         region = get_region_from_settings()
     if audible_regions.get(region) is None:
         raise HTTPException(status_code=400, detail="Invalid region")
-    if query:
+    if query and local_only:
+        results = search_local_books(session, query, num_results)
+    elif query:
         results = await search_audible_books(
             session,
             client_session=client_session,
@@ -40,30 +51,22 @@ async def search_books(
             num_results=num_results,
             page=page,
             audible_region=region,
+            merge_local=True,
         )
     else:
         results = []
 
-    audiobook_with_requests = [
-        AudiobookWithRequests(
-            book=book,
-            requests=book.requests,
-            username=user.username,
-        )
-        for book in results
-    ]
-    for request in audiobook_with_requests:
-        request.fill_requests(session)
-    return audiobook_with_requests
+    return AudiobookWithRequests.from_books(session, results, user.username)
 
 
 @router.get("/suggestions", response_model=list[str])
 async def search_suggestions(
+    session: Annotated[Session, Depends(get_session)],
     query: Annotated[str, Query(alias="q")],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     _: Annotated[DetailedUser, Security(AnyAuth())],
     region: audible_region_type | None = None,
 ):
     if region is None:
         region = get_region_from_settings()
-    async with ClientSession() as client_session:
-        return await get_search_suggestions(client_session, query, region)
+    return await get_search_suggestions(session, client_session, query, region)
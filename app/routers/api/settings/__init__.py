@@ -7,6 +7,7 @@ from app.routers.api.settings.downloadclient import router as downloadclient_rou
 from app.routers.api.settings.notifications import router as notifications_router
 from app.routers.api.settings.prowlarr import router as prowlarr_router
 from app.routers.api.settings.security import router as security_router
+from app.routers.api.settings.upstreams import router as upstreams_router
 
 router = APIRouter(prefix="/settings", tags=["Settings"])
 
@@ -17,3 +18,4 @@ router.include_router(downloadclient_router)
 router.include_router(notifications_router)
 router.include_router(prowlarr_router)
 router.include_router(security_router)
+router.include_router(upstreams_router)
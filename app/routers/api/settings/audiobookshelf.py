@@ -14,7 +14,7 @@ from app.internal.audiobookshelf.config import abs_config
 from app.internal.audiobookshelf.types import ABSLibrary
 from app.internal.auth.authentication import AnyAuth, DetailedUser
 from app.internal.models import GroupEnum
-from app.util.connection import get_connection
+from app.util.connection import get_audiobookshelf_connection
 from app.util.db import get_session
 from app.util.log import logger
 
@@ -32,7 +32,7 @@ class ABSResponse(BaseModel):
 @router.get("")
 async def read_abs(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audiobookshelf_connection)],
     admin_user: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
 ):
     _ = admin_user
@@ -106,7 +106,7 @@ class TestResponse(BaseModel):
 @router.get("/test-connection")
 async def test_abs_connection(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audiobookshelf_connection)],
     _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
 ):
     abs_config.raise_if_invalid(session)
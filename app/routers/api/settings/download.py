@@ -6,6 +6,7 @@ from sqlmodel import Session
 
 from app.internal.auth.authentication import AnyAuth, DetailedUser
 from app.internal.models import GroupEnum
+from app.internal.query_queue import QueueStats, get_queue_stats
 from app.internal.ranking.quality import IndexerFlag, QualityRange, quality_config
 from app.util.db import get_session
 
@@ -44,6 +45,15 @@ def get_download_settings(
     )
 
 
+@router.get("/queue", response_model=QueueStats)
+def get_query_queue(
+    session: Annotated[Session, Depends(get_session)],
+    _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
+):
+    """Depth and latency of the background source queries."""
+    return get_queue_stats(session)
+
+
 class UpdateDownloadSettings(BaseModel):
     auto_download: bool
     flac_range: QualityRange
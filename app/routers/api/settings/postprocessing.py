@@ -17,7 +17,7 @@ from app.internal.folders import FolderAvailability
 from app.internal.models import GroupEnum
 from app.internal.postprocessing.config import postprocessing_config
 from app.internal.audiobookshelf.config import abs_config
-from app.util.connection import get_connection
+from app.util.connection import get_audiobookshelf_connection
 from app.util.db import get_session
 from app.util.downloadclient import (
     get_global_downloadclient,
@@ -38,7 +38,7 @@ class PostProcessingResponse(BaseModel):
 @router.get("")
 async def read_postprocessing(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audiobookshelf_connection)],
     admin_user: Annotated[DetailedUser, Security(APIKeyAuth(GroupEnum.admin))],
     downloadclient: Annotated[
         Optional[qBittorrentClient], Depends(get_global_downloadclient)
@@ -1,7 +1,7 @@
 from typing import Annotated
 
 from aiohttp import ClientSession
-from fastapi import APIRouter, Depends, Response, Security
+from fastapi import APIRouter, Depends, Form, Response, Security
 from pydantic import BaseModel
 from sqlmodel import Session
 
@@ -9,8 +9,12 @@ from app.internal.auth.authentication import AnyAuth, DetailedUser
 from app.internal.models import GroupEnum
 from app.internal.prowlarr.indexer_categories import indexer_categories
 from app.internal.prowlarr.prowlarr import IndexerResponse, get_indexers
-from app.internal.prowlarr.util import flush_prowlarr_cache, prowlarr_config
-from app.util.connection import get_connection
+from app.internal.prowlarr.util import (
+    SearchQueryVariant,
+    flush_prowlarr_cache,
+    prowlarr_config,
+)
+from app.util.connection import get_prowlarr_connection
 from app.util.db import get_session
 
 router = APIRouter(prefix="/prowlarr")
@@ -21,6 +25,8 @@ class ProwlarrSettings(BaseModel):
     api_key: str
     selected_categories: list[int]
     selected_indexers: list[int]
+    search_per_indexer: bool
+    search_queries: list[SearchQueryVariant]
     all_categories: dict[int, str]
     indexers: IndexerResponse
 
@@ -28,7 +34,7 @@ class ProwlarrSettings(BaseModel):
 @router.get("", response_model=ProwlarrSettings)
 async def get_prowlarr_settings(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
 ):
     indexers = await get_indexers(session, client_session)
@@ -37,6 +43,8 @@ async def get_prowlarr_settings(
         api_key=prowlarr_config.get_api_key(session) or "",
         selected_categories=prowlarr_config.get_categories(session),
         selected_indexers=prowlarr_config.get_indexers(session),
+        search_per_indexer=prowlarr_config.get_search_per_indexer(session),
+        search_queries=prowlarr_config.get_search_queries(session),
         all_categories=indexer_categories,
         indexers=indexers,
     )
@@ -53,7 +61,7 @@ def update_prowlarr_api_key(
     _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
 ):
     prowlarr_config.set_api_key(session, body.api_key)
-    flush_prowlarr_cache()
+    flush_prowlarr_cache(session)
     return Response(status_code=204)
 
 
@@ -68,7 +76,7 @@ def update_prowlarr_base_url(
     _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
 ):
     prowlarr_config.set_base_url(session, body.base_url)
-    flush_prowlarr_cache()
+    flush_prowlarr_cache(session)
     return Response(status_code=204)
 
 
@@ -83,5 +91,34 @@ def update_indexer_categories(
     _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
 ):
     prowlarr_config.set_categories(session, body.categories)
-    flush_prowlarr_cache()
+    flush_prowlarr_cache(session)
+    return Response(status_code=204)
+
+
+@router.put("/search-per-indexer", status_code=204)
+def update_search_per_indexer(
+    session: Annotated[Session, Depends(get_session)],
+    admin_user: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
+    search_per_indexer: Annotated[bool, Form()] = False,
+):
+    _ = admin_user
+    prowlarr_config.set_search_per_indexer(session, search_per_indexer)
+    return Response(status_code=204)
+
+
+class UpdateSearchQueries(BaseModel):
+    search_queries: list[SearchQueryVariant]
+
+
+@router.put("/search-queries", status_code=204)
+def update_search_queries(
+    body: UpdateSearchQueries,
+    session: Annotated[Session, Depends(get_session)],
+    _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
+):
+    """
+    The query variants searched for every book. Sources are cached per query, so
+    no cache has to be flushed.
+    """
+    prowlarr_config.set_search_queries(session, body.search_queries)
     return Response(status_code=204)
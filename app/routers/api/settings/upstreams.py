@@ -0,0 +1,43 @@
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Response, Security
+from pydantic import BaseModel
+
+from app.internal.auth.authentication import AnyAuth, DetailedUser
+from app.internal.models import GroupEnum
+from app.util.cache import CacheStats, lru_cache_stats
+from app.util.circuitbreaker import BreakerState, circuit_breakers
+from app.util.ratelimit import GovernorStats, request_governor
+from app.util.singleflight import SingleFlightStats, single_flight_stats
+
+router = APIRouter(prefix="/upstreams")
+
+
+class UpstreamsResponse(BaseModel):
+    circuit_breakers: list[BreakerState]
+    rate_limits: list[GovernorStats]
+    single_flights: list[SingleFlightStats]
+    caches: list[CacheStats]
+
+
+@router.get("", response_model=UpstreamsResponse)
+def read_upstreams(
+    _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
+):
+    return UpstreamsResponse(
+        circuit_breakers=circuit_breakers.states(),
+        rate_limits=request_governor.stats(),
+        single_flights=single_flight_stats(),
+        caches=lru_cache_stats(),
+    )
+
+
+@router.post("/{host}/reset", status_code=204)
+def reset_circuit_breaker(
+    host: str,
+    _: Annotated[DetailedUser, Security(AnyAuth(GroupEnum.admin))],
+):
+    """Closes the circuit of a host, so it is contacted again right away."""
+    if not circuit_breakers.reset(host):
+        raise HTTPException(status_code=404, detail="Unknown host")
+    return Response(status_code=204)
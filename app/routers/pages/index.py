@@ -31,7 +31,7 @@ from app.routers.api.recommendations import (
 from app.routers.api.recommendations import (
     get_user_recommendations as api_get_user_recommendations,
 )
-from app.util.connection import get_connection
+from app.util.connection import get_audible_connection
 from app.util.db import get_session
 from app.util.templates import catalog_response
 
@@ -62,7 +62,7 @@ def read_root(
 @router.get("/hx-for-you")
 async def get_user_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     seed_asins: Annotated[list[str] | None, Query(alias="seed_asins")] = None,
     limit: int = 20,
@@ -119,7 +119,7 @@ async def get_popular_recommendations(
 @router.get("/hx-categories")
 async def get_category_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     audible_region: audible_region_type | None = None,
 ):
@@ -187,7 +187,7 @@ async def get_recently_requested_recommendations(
 @router.get("/hx-fallback")
 async def get_fallback_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     limit: int = 10,
     audible_region: audible_region_type | None = None,
@@ -221,7 +221,7 @@ async def get_fallback_recommendations(
 @router.get("/hx-authors")
 async def get_popular_authors_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     limit: int = 10,
     exclude_downloaded: bool = True,
@@ -256,7 +256,7 @@ async def get_popular_authors_recommendations(
 @router.get("/hx-narrators")
 async def get_popular_narrators_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     limit: int = 10,
     exclude_downloaded: bool = True,
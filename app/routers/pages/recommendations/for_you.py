@@ -10,7 +10,7 @@ from app.internal.ranking.quality import quality_config
 from app.routers.api.recommendations import (
     get_user_recommendations as api_get_user_recommendations,
 )
-from app.util.connection import get_connection
+from app.util.connection import get_audible_connection
 from app.util.db import get_session
 from app.util.templates import catalog_response
 
@@ -20,7 +20,7 @@ router = APIRouter(prefix="/for-you")
 @router.get("")
 async def get_for_you_recommendations(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     page: int = 1,
     per_page: int = 10,
@@ -1,6 +1,5 @@
 from typing import Annotated
 
-from aiohttp import ClientSession
 from fastapi import APIRouter, BackgroundTasks, Depends, Form, HTTPException, Security
 from sqlmodel import Session
 
@@ -9,7 +8,6 @@ from app.internal.auth.authentication import ABRAuth, DetailedUser
 from app.internal.ranking.quality import quality_config
 from app.routers.api.requests import create_request
 from app.util.censor import censor
-from app.util.connection import get_connection
 from app.util.db import get_session
 from app.util.log import logger
 from app.util.templates import catalog_response
@@ -22,7 +20,6 @@ router = APIRouter(prefix="/request")
 async def add_request(
     asin: str,
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
     background_task: BackgroundTasks,
     user: Annotated[DetailedUser, Security(ABRAuth())],
     region: Annotated[audible_region_type | None, Form()] = None,
@@ -31,7 +28,6 @@ async def add_request(
         book = await create_request(
             asin=asin,
             session=session,
-            client_session=client_session,
             background_task=background_task,
             user=user,
             region=region,
@@ -15,7 +15,7 @@ from app.internal.prowlarr.util import prowlarr_config
 from app.internal.ranking.quality import quality_config
 from app.routers.api.search import search_books
 from app.routers.api.search import search_suggestions as api_search_suggestions
-from app.util.connection import get_connection
+from app.util.connection import get_audible_connection
 from app.util.db import get_session
 from app.util.log import logger
 from app.util.templates import catalog_response
@@ -30,7 +30,7 @@ router.include_router(manual.router)
 
 @router.get("")
 async def read_search(
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     session: Annotated[Session, Depends(get_session)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     query: Annotated[str | None, Query(alias="q")] = None,
@@ -75,12 +75,16 @@ async def read_search(
 
 @router.get("/hx-suggestions")
 async def search_suggestions(
+    session: Annotated[Session, Depends(get_session)],
     query: Annotated[str, Query(alias="q")],
+    client_session: Annotated[ClientSession, Depends(get_audible_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth())],
     region: audible_region_type | None = None,
 ):
     if query.strip():
-        suggestions = await api_search_suggestions(query, user, region)
+        suggestions = await api_search_suggestions(
+            session, query, client_session, user, region
+        )
     else:
         suggestions = []
     return catalog_response(
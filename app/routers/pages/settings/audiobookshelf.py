@@ -21,7 +21,8 @@ from app.routers.api.settings.audiobookshelf import (
 from app.routers.api.settings.audiobookshelf import (
     update_abs_library as api_update_abs_library,
 )
-from app.util.connection import get_connection
+from app.util.circuitbreaker import circuit_breakers
+from app.util.connection import get_audiobookshelf_connection
 from app.util.db import get_session
 from app.util.templates import catalog_response
 
@@ -31,7 +32,7 @@ router = APIRouter(prefix="/audiobookshelf")
 @router.get("")
 async def read_abs(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audiobookshelf_connection)],
     admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
 ):
     response = await api_read_abs(
@@ -48,6 +49,7 @@ async def read_abs(
         abs_library_id=response.abs_library_id,
         abs_check_downloaded=response.abs_check_downloaded,
         abs_libraries=response.abs_libraries,
+        breaker=circuit_breakers.state_for_url(response.abs_base_url),
     )
 
 
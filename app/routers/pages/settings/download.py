@@ -5,6 +5,7 @@ from sqlmodel import Session
 
 from app.internal.auth.authentication import ABRAuth, DetailedUser
 from app.internal.models import GroupEnum
+from app.internal.query_queue import get_queue_stats
 from app.internal.ranking.quality import IndexerFlag, QualityRange, quality_config
 from app.routers.api.settings.download import (
     UpdateDownloadSettings,
@@ -47,6 +48,7 @@ def read_download(
         name_ratio=name_ratio,
         title_ratio=title_ratio,
         indexer_flags=flags,
+        queue_stats=get_queue_stats(session),
     )
 
 
@@ -6,6 +6,7 @@ from sqlmodel import Session
 from app.internal.auth.authentication import ABRAuth, DetailedUser
 from app.internal.downloadclient.client import qBittorrentClient
 from app.internal.models import GroupEnum
+from app.util.circuitbreaker import circuit_breakers
 from app.util.db import get_session
 from app.util.downloadclient import get_global_downloadclient
 from app.util.templates import catalog_response
@@ -43,6 +44,7 @@ async def read_downclient(
         downloadclient_password=response.password,
         downloadclient_category=response.selected_category,
         downloadclient_categories=response.categories,
+        breaker=circuit_breakers.state_for_url(response.base_url),
     )
 
 
@@ -17,7 +17,7 @@ from app.internal.indexers.indexer_util import (
 )
 from app.internal.models import GroupEnum
 from app.util.cache import StringConfigCache
-from app.util.connection import get_connection
+from app.util.connection import client_registry, get_connection
 from app.util.db import get_session
 from app.util.log import logger
 from app.util.templates import catalog_response
@@ -30,11 +30,10 @@ last_modified = 0
 
 async def check_indexer_file_changes():
     with next(get_session()) as session:
-        async with ClientSession() as client_session:
-            try:
-                await read_indexer_file(session, client_session)
-            except Exception as e:
-                logger.error("Failed to read indexer configuration file", error=str(e))
+        try:
+            await read_indexer_file(session, client_registry.get())
+        except Exception as e:
+            logger.error("Failed to read indexer configuration file", error=str(e))
 
 
 @asynccontextmanager
@@ -14,7 +14,7 @@ from app.routers.api.settings.postprocessing import (
     update_postprocessing_auto_moving as api_update_postprocessing_auto_moving,
     update_postprocessing_disable_hardlinking as api_update_postprocessing_disable_hardlinking,
 )
-from app.util.connection import get_connection
+from app.util.connection import get_audiobookshelf_connection
 from app.util.db import get_session
 from app.util.downloadclient import get_global_downloadclient
 from app.util.templates import catalog_response
@@ -26,7 +26,7 @@ router = APIRouter(prefix="/postprocessing")
 async def read_postprocessing(
     # request: Request,
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_audiobookshelf_connection)],
     admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
     downloadclient: Annotated[
         Optional[qBittorrentClient], Depends(get_global_downloadclient)
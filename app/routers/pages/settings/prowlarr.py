@@ -8,11 +8,16 @@ from app.internal.auth.authentication import ABRAuth, DetailedUser
 from app.internal.models import GroupEnum
 from app.internal.prowlarr.indexer_categories import indexer_categories
 from app.internal.prowlarr.prowlarr import get_indexers
-from app.internal.prowlarr.util import flush_prowlarr_cache, prowlarr_config
+from app.internal.prowlarr.util import (
+    SearchQueryVariant,
+    flush_prowlarr_cache,
+    prowlarr_config,
+)
 from app.routers.api.settings.prowlarr import (
     UpdateApiKey,
     UpdateBaseUrl,
     UpdateCategories,
+    UpdateSearchQueries,
 )
 from app.routers.api.settings.prowlarr import (
     update_indexer_categories as api_update_indexer_categories,
@@ -23,7 +28,14 @@ from app.routers.api.settings.prowlarr import (
 from app.routers.api.settings.prowlarr import (
     update_prowlarr_base_url as api_update_prowlarr_base_url,
 )
-from app.util.connection import get_connection
+from app.routers.api.settings.prowlarr import (
+    update_search_per_indexer as api_update_search_per_indexer,
+)
+from app.routers.api.settings.prowlarr import (
+    update_search_queries as api_update_search_queries,
+)
+from app.util.circuitbreaker import circuit_breakers
+from app.util.connection import get_prowlarr_connection
 from app.util.db import get_session
 from app.util.templates import catalog_response, catalog_response_toast
 
@@ -33,7 +45,7 @@ router = APIRouter(prefix="/prowlarr")
 @router.get("")
 async def read_prowlarr(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
     prowlarr_misconfigured: object | None = None,
 ):
@@ -53,7 +65,10 @@ async def read_prowlarr(
         selected_categories=selected,
         indexers=indexers,
         selected_indexers=selected_indexers,
+        search_per_indexer=prowlarr_config.get_search_per_indexer(session),
+        search_queries=prowlarr_config.get_search_queries(session),
         prowlarr_misconfigured=True if prowlarr_misconfigured else False,
+        breaker=circuit_breakers.state_for_url(prowlarr_base_url),
     )
 
 
@@ -106,7 +121,7 @@ def update_indexer_categories(
 @router.put("/hx-indexers")
 async def update_selected_indexers(
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
     indexer_ids: Annotated[list[int] | None, Form(alias="i")] = None,
 ):
@@ -117,7 +132,7 @@ async def update_selected_indexers(
 
     indexers = await get_indexers(session, client_session)
     selected_indexers = set(prowlarr_config.get_indexers(session))
-    flush_prowlarr_cache()
+    flush_prowlarr_cache(session)
 
     return catalog_response_toast(
         "Settings.Prowlarr.Indexer",
@@ -126,3 +141,34 @@ async def update_selected_indexers(
         indexers=indexers,
         selected_indexers=selected_indexers,
     )
+
+
+@router.put("/hx-search-per-indexer")
+def update_search_per_indexer(
+    session: Annotated[Session, Depends(get_session)],
+    admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
+    search_per_indexer: Annotated[bool, Form()] = False,
+):
+    api_update_search_per_indexer(
+        session=session,
+        admin_user=admin_user,
+        search_per_indexer=search_per_indexer,
+    )
+    return Response(status_code=204)
+
+
+@router.put("/hx-search-queries")
+def update_search_queries(
+    session: Annotated[Session, Depends(get_session)],
+    admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
+    search_queries: Annotated[list[SearchQueryVariant] | None, Form(alias="q")] = None,
+):
+    if search_queries is None:
+        search_queries = []
+
+    api_update_search_queries(
+        UpdateSearchQueries(search_queries=search_queries),
+        session,
+        admin_user,
+    )
+    return Response(status_code=204)
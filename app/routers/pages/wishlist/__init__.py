@@ -10,7 +10,7 @@ from app.internal.downloadclient.client import qBittorrentClient
 from app.internal.models import GroupEnum
 from app.routers.api.requests import delete_request as api_delete_request
 from app.routers.api.requests import start_auto_download_endpoint
-from app.util.connection import get_connection
+from app.util.connection import get_prowlarr_connection
 from app.util.db import get_session
 from app.util.downloadclient import get_global_downloadclient
 from app.util.templates import catalog_response
@@ -44,7 +44,7 @@ async def wishlist(
 async def start_auto_download(
     asin: str,
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.trusted))],
     download_client: Annotated[Optional[qBittorrentClient], Depends(get_global_downloadclient)]
 ):
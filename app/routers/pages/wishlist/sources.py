@@ -2,17 +2,19 @@ from typing import Annotated
 
 from aiohttp import ClientSession
 from fastapi import APIRouter, Depends, Form, HTTPException, Security
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 
 from app.internal.auth.authentication import ABRAuth, DetailedUser
-from app.internal.models import GroupEnum
+from app.internal.models import Audiobook, GroupEnum
+from app.internal.query import stream_sources as query_stream_sources
 from app.routers.api.requests import DownloadSourceBody
 from app.routers.api.requests import download_book as api_download_book
 from app.routers.api.requests import list_sources as api_list_sources
-from app.util.connection import get_connection
+from app.util.connection import get_prowlarr_connection
 from app.util.db import get_session
 from app.util.redirect import BaseUrlRedirectResponse
-from app.util.templates import catalog_response
+from app.util.templates import catalog_response, catalog_sse_event, sse_event
 
 router = APIRouter(prefix="/sources")
 
@@ -21,9 +23,8 @@ router = APIRouter(prefix="/sources")
 async def list_sources(
     asin: str,
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
-    only_body: bool = False,
 ):
     try:
         result = await api_list_sources(
@@ -31,7 +32,7 @@ async def list_sources(
             session,
             client_session,
             admin_user,
-            only_cached=not only_body,
+            only_cached=True,
         )
     except HTTPException as e:
         if e.detail == "Prowlarr misconfigured":
@@ -40,12 +41,6 @@ async def list_sources(
             )
         raise e
 
-    if only_body:
-        return catalog_response(
-            "Wishlist.Sources.Content",
-            result=result,
-        )
-
     return catalog_response(
         "Wishlist.Sources.Index",
         user=admin_user,
@@ -53,6 +48,35 @@ async def list_sources(
     )
 
 
+@router.get("/{asin}/stream")
+async def stream_sources(
+    asin: str,
+    session: Annotated[Session, Depends(get_session)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
+    admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
+):
+    """
+    Server-sent events with the sources found so far, re-ranked whenever more
+    indexers respond. The `done` event follows the final sources.
+    """
+    # errors have to happen before the stream starts, as the browser would reconnect
+    if not session.get(Audiobook, asin):
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    async def stream():
+        async for result in query_stream_sources(asin, client_session, admin_user):
+            yield catalog_sse_event(
+                "Wishlist.Sources.Content", "sources", result=result
+            )
+        yield sse_event("done")
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/{asin}")
 async def download_book(
     # background_task: BackgroundTasks,
@@ -61,7 +85,7 @@ async def download_book(
     indexer_id: Annotated[int, Form()],
     download_url: Annotated[str, Form()],
     session: Annotated[Session, Depends(get_session)],
-    client_session: Annotated[ClientSession, Depends(get_connection)],
+    client_session: Annotated[ClientSession, Depends(get_prowlarr_connection)],
     admin_user: Annotated[DetailedUser, Security(ABRAuth(GroupEnum.admin))],
 ):
     body = DownloadSourceBody(guid=guid, indexer_id=indexer_id, download_url=download_url)
@@ -1,42 +1,348 @@
+import asyncio
 import time
+import weakref
 from abc import ABC
-from typing import overload
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Protocol, cast, final, overload
 
-from sqlmodel import Session, select
+from pydantic import BaseModel
+from sqlalchemy import Integer, String
+from sqlalchemy import cast as sa_cast
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, col, select
 
 from app.internal.models import Config
+from app.util.log import logger
+from app.util.singleflight import SingleFlight
 
 
-class SimpleCache[VT, *KTs]:
-    _cache: dict[tuple[*KTs], tuple[int, VT]] = {}
+@dataclass(frozen=True, slots=True)
+class _CacheEntry[V]:
+    value: V
+    created_at: float
+    ttl: float
+    size: int
 
-    def get(self, source_ttl: int, *query: *KTs) -> VT | None:
-        hit = self._cache.get(query)
-        if not hit:
+
+class CacheStats(BaseModel, frozen=True):
+    name: str
+    entries: int
+    size: int
+    hits: int
+    stale_hits: int
+    misses: int
+    evictions: int
+
+
+class _ReportsStats(Protocol):
+    def stats(self) -> CacheStats: ...
+
+
+_lru_caches: weakref.WeakSet[_ReportsStats] = weakref.WeakSet()
+
+
+@final
+class LRUCache[K, V]:
+    """
+    In-memory cache that is bounded by the amount of entries and optionally by the
+    total size of all entries, as determined by `sizeof`. When full, the least
+    recently used entries are evicted first.
+
+    Every entry expires after its TTL. With `stale_ttl`, expired entries are kept for
+    that much longer and `get_or_fetch` serves them while a single background refresh
+    per key updates the entry.
+
+    No awaits happen between reading and updating entries, so the cache is safe to
+    use from concurrent tasks on the event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        ttl: float,
+        max_entries: int,
+        max_size: int | None = None,
+        sizeof: Callable[[V], int] | None = None,
+        stale_ttl: float = 0,
+    ):
+        if max_size is not None and sizeof is None:
+            raise ValueError("sizeof is required to limit the size of the cache")
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._sizeof = sizeof
+        self._entries: OrderedDict[K, _CacheEntry[V]] = OrderedDict()
+        self._size = 0
+        self._flight = SingleFlight[K, V | None](name)
+        self._refreshing: dict[K, asyncio.Task[V | None]] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        """Amount of expired entries that were served while being refreshed"""
+        self.misses = 0
+        self.evictions = 0
+        """Amount of entries removed to stay within the limits"""
+        _lru_caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        """If there is an entry for the key, no matter if it is still fresh."""
+        return key in self._entries
+
+    def _lookup(
+        self, key: K, max_age: float | None
+    ) -> tuple[_CacheEntry[V] | None, bool]:
+        """Returns the entry, if it is not yet hard-expired, and if it is still fresh."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        age = time.time() - entry.created_at
+        ttl = entry.ttl if max_age is None else max_age
+        if age >= ttl + self.stale_ttl:
+            self._remove(key)
+            return None, False
+        self._entries.move_to_end(key)
+        return entry, age < ttl
+
+    def get(self, key: K, max_age: float | None = None) -> V | None:
+        """
+        Returns the value if it is still fresh. `max_age` overrides the TTL the
+        entry was stored with.
+        """
+        entry, fresh = self._lookup(key, max_age)
+        if entry is None or not fresh:
+            self.misses += 1
             return None
-        cached_at, sources = hit
-        if cached_at + source_ttl < time.time():
+        self.hits += 1
+        return entry.value
+
+    def get_stale(self, key: K, max_age: float | None = None) -> V | None:
+        """Also returns expired values, as long as they are within the stale window."""
+        entry, fresh = self._lookup(key, max_age)
+        if entry is None:
             return None
-        return sources
+        if not fresh:
+            self.stale_hits += 1
+        return entry.value
+
+    def set(self, key: K, value: V, ttl: float | None = None):
+        size = self._sizeof(value) if self._sizeof else 0
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CacheEntry(
+            value=value,
+            created_at=time.time(),
+            ttl=self.ttl if ttl is None else ttl,
+            size=size,
+        )
+        self._size += size
+
+        while len(self._entries) > self.max_entries or (
+            self.max_size is not None
+            and self._size > self.max_size
+            and len(self._entries) > 1
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+            self.evictions += 1
+
+    def delete(self, key: K):
+        if key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key: K):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
 
-    def get_all(self, source_ttl: int) -> dict[tuple[*KTs], VT]:
-        now = int(time.time())
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
 
-        return {
-            query: sources
-            for query, (cached_at, sources) in self._cache.items()
-            if cached_at + source_ttl > now
-        }
+    def values(self, max_age: float | None = None) -> list[V]:
+        """All fresh values. Does not count as usage for the LRU order."""
+        now = time.time()
+        return [
+            entry.value
+            for entry in self._entries.values()
+            if now - entry.created_at < (entry.ttl if max_age is None else max_age)
+        ]
 
-    def set(self, sources: VT, *query: *KTs):
-        self._cache[query] = (int(time.time()), sources)
+    async def get_or_fetch(
+        self,
+        key: K,
+        fetch: Callable[[], Awaitable[V | None]],
+        ttl: float | None = None,
+        refresh: Callable[[], Awaitable[V | None]] | None = None,
+    ) -> V | None:
+        """
+        Returns the cached value or fetches it. Concurrent fetches for the same key
+        are coalesced and `None` results are not cached.
 
-    def flush(self):
-        self._cache = {}
+        Entries that are expired, but still within the stale window, are returned
+        immediately while the entry is refreshed in the background. The refresh
+        outlives the caller, so `refresh` can be given if `fetch` depends on
+        anything that only lives as long as the caller, like its connection.
+        """
+        entry, fresh = self._lookup(key, None)
+        if entry is not None and fresh:
+            self.hits += 1
+            return entry.value
+        if entry is not None:
+            self.stale_hits += 1
+            self._refresh(key, refresh or fetch, ttl)
+            return entry.value
+
+        self.misses += 1
+        return await self._flight.do(key, lambda: self._fetch(key, fetch, ttl))
+
+    async def _fetch(
+        self,
+        key: K,
+        fetch: Callable[[], Awaitable[V | None]],
+        ttl: float | None,
+    ) -> V | None:
+        value = await fetch()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def _refresh(
+        self,
+        key: K,
+        fetch: Callable[[], Awaitable[V | None]],
+        ttl: float | None,
+    ):
+        if key in self._refreshing:
+            return
+
+        def done(task: asyncio.Task[V | None]):
+            _ = self._refreshing.pop(key, None)
+            if not task.cancelled() and (e := task.exception()):
+                logger.warning(
+                    "Failed to refresh stale cache entry", name=self.name, error=str(e)
+                )
+
+        task = asyncio.create_task(
+            self._flight.do(key, lambda: self._fetch(key, fetch, ttl))
+        )
+        self._refreshing[key] = task
+        task.add_done_callback(done)
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            name=self.name,
+            entries=len(self._entries),
+            size=self._size,
+            hits=self.hits,
+            stale_hits=self.stale_hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+def lru_cache_stats() -> list[CacheStats]:
+    """The counters of every LRU cache, sorted by name."""
+    return sorted((cache.stats() for cache in _lru_caches), key=lambda s: s.name)
+
+
+CONFIG_VERSION_KEY = "config_version"
+"""
+Config row that is incremented on every config change. Used to invalidate the
+config caches of all workers.
+"""
+
+_VERSION_CHECK_INTERVAL = 5
+"""Seconds after which a long-lived session checks the config version again."""
+
+
+class _ConfigSnapshot:
+    """The complete config table as loaded by `preload_config_cache`."""
+
+    version: int | None = None
+    rows: dict[str, str] = {}
+
+
+def _get_config_version(session: Session) -> int:
+    """
+    The config version is only queried once per session (and therefore usually once
+    per request), so that changes by other workers are picked up on the next request.
+    """
+    checked = cast(tuple[int, float] | None, session.info.get(CONFIG_VERSION_KEY))
+    if checked is not None and time.time() - checked[1] < _VERSION_CHECK_INTERVAL:
+        return checked[0]
+
+    value = session.exec(
+        select(Config.value).where(Config.key == CONFIG_VERSION_KEY)
+    ).one_or_none()
+    version = int(value) if value else 0
+    session.info[CONFIG_VERSION_KEY] = (version, time.time())
+    return version
+
+
+def _increment_config_version(session: Session) -> int:
+    """
+    Increments the config version in the same transaction as the config change.
+    The first change creates the row, which concurrent first changes would both try
+    to do, so the row is upserted.
+    """
+    insert = (
+        postgresql.insert
+        if session.get_bind().dialect.name == "postgresql"
+        else sqlite.insert
+    )
+    statement = (
+        insert(Config)
+        .values(key=CONFIG_VERSION_KEY, value="1")
+        .on_conflict_do_update(
+            index_elements=[col(Config.key)],
+            set_={"value": sa_cast(sa_cast(col(Config.value), Integer) + 1, String)},
+        )
+        .returning(col(Config.value))
+    )
+    return int(cast(str, session.execute(statement).scalar_one()))
+
+
+def preload_config_cache(session: Session):
+    """Loads the complete config table with a single query."""
+    rows = {config.key: config.value for config in session.exec(select(Config)).all()}
+    version = int(rows.pop(CONFIG_VERSION_KEY, None) or 0)
+    _ConfigSnapshot.rows = rows
+    _ConfigSnapshot.version = version
+    session.info[CONFIG_VERSION_KEY] = (version, time.time())
+    logger.debug("Preloaded config cache", count=len(rows), version=version)
 
 
 class StringConfigCache[L: str](ABC):
-    _cache: dict[L, str] = {}
+    """
+    Read-through cache of config values. Every subclass has its own cache, which is
+    cleared as soon as the config version in the database changes.
+    """
+
+    _cache: dict[str, str | None] = {}
+    _cache_version: int | None = None
+
+    def __init_subclass__(cls, **kwargs: Any):  # pyright: ignore[reportExplicitAny, reportAny]
+        super().__init_subclass__(**kwargs)
+        cls._cache = {}
+        cls._cache_version = None
+
+    def get_version(self, session: Session) -> int:
+        """The current config version. Changes whenever any config value changes."""
+        return _get_config_version(session)
+
+    def _get_cache(self, session: Session) -> dict[str, str | None]:
+        cls = type(self)
+        version = self.get_version(session)
+        if cls._cache_version != version:
+            cls._cache = {}
+            cls._cache_version = version
+        return cls._cache
 
     @overload
     def get(self, session: Session, key: L) -> str | None: ...
@@ -45,12 +351,15 @@ class StringConfigCache[L: str](ABC):
     def get(self, session: Session, key: L, default: str) -> str: ...
 
     def get(self, session: Session, key: L, default: str | None = None) -> str | None:
-        if key in self._cache:
-            return self._cache[key]
-        return (
-            session.exec(select(Config.value).where(Config.key == key)).one_or_none()
-            or default
-        )
+        cache = self._get_cache(session)
+        if key not in cache:
+            if _ConfigSnapshot.version == type(self)._cache_version:
+                cache[key] = _ConfigSnapshot.rows.get(key)
+            else:
+                cache[key] = session.exec(
+                    select(Config.value).where(Config.key == key)
+                ).one_or_none()
+        return cache[key] or default
 
     def set(self, session: Session, key: L, value: str):
         old = session.exec(select(Config).where(Config.key == key)).one_or_none()
@@ -59,16 +368,25 @@ class StringConfigCache[L: str](ABC):
         else:
             old = Config(key=key, value=value)
         session.add(old)
-        session.commit()
-        self._cache[key] = value
+        self._commit_change(session, key, value)
 
     def delete(self, session: Session, key: L):
         old = session.exec(select(Config).where(Config.key == key)).one_or_none()
         if old:
             session.delete(old)
-            session.commit()
-        if key in self._cache:
-            del self._cache[key]
+            self._commit_change(session, key, None)
+        else:
+            self._get_cache(session)[key] = None
+
+    def _commit_change(self, session: Session, key: L, value: str | None):
+        version = _increment_config_version(session)
+        session.commit()
+        session.info[CONFIG_VERSION_KEY] = (version, time.time())
+
+        # other changes to this cache could have happened in between
+        cls = type(self)
+        cls._cache = {key: value}
+        cls._cache_version = version
 
     @overload
     def get_int(self, session: Session, key: L) -> int | None: ...
@@ -0,0 +1,189 @@
+import time
+from enum import StrEnum
+from typing import final
+from urllib.parse import urlparse
+
+from aiohttp import (
+    ClientConnectionError,
+    ClientHandlerType,
+    ClientRequest,
+    ClientResponse,
+)
+from pydantic import BaseModel
+
+from app.internal.env_settings import Settings
+from app.util.log import logger
+
+
+class CircuitOpenError(ClientConnectionError):
+    """The upstream failed too often and is not contacted until it recovers."""
+
+
+class CircuitState(StrEnum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class BreakerState(BaseModel, frozen=True):
+    host: str
+    state: CircuitState
+    consecutive_failures: int
+    trips: int
+    """Amount of times the circuit was opened"""
+    last_error: str | None
+    retry_in: float
+    """Seconds until the next request is let through as a probe"""
+
+
+@final
+class CircuitBreaker:
+    """
+    Counts consecutive failures of a single host. Once the threshold is reached, the
+    circuit opens and requests fail immediately. After the reset timeout, a single
+    probe request is let through. If it succeeds, the circuit closes again,
+    otherwise it stays open for another reset timeout.
+    """
+
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.closed
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.last_error: str | None = None
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """If a request may be sent. Claims the probe when the circuit is half-open."""
+        if self.state == CircuitState.closed:
+            return True
+        if self._probing:
+            return False
+        if self.state == CircuitState.open:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = CircuitState.half_open
+        self._probing = True
+        return True
+
+    def record_success(self):
+        if self.state != CircuitState.closed:
+            logger.info("Upstream recovered, closing circuit", host=self.host)
+        self.state = CircuitState.closed
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_error = error
+        self._probing = False
+        if (
+            self.state == CircuitState.half_open
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.state == CircuitState.closed:
+                self.trips += 1
+                logger.warning(
+                    "Upstream keeps failing, opening circuit",
+                    host=self.host,
+                    failures=self.consecutive_failures,
+                    error=error,
+                )
+            self.state = CircuitState.open
+            self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The probe ended without telling anything about the upstream."""
+        self._probing = False
+
+    def reset(self):
+        self.state = CircuitState.closed
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def retry_in(self) -> float:
+        if self.state != CircuitState.open:
+            return 0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def snapshot(self) -> BreakerState:
+        return BreakerState(
+            host=self.host,
+            state=self.state,
+            consecutive_failures=self.consecutive_failures,
+            trips=self.trips,
+            last_error=self.last_error,
+            retry_in=self.retry_in(),
+        )
+
+
+@final
+class CircuitBreakers:
+    """
+    Keeps one `CircuitBreaker` per upstream host. Used as an aiohttp client
+    middleware. Connection errors, timeouts and 5xx responses count as failures.
+    """
+
+    def __init__(self):
+        self._hosts: dict[str, CircuitBreaker] = {}
+
+    def get(self, host: str) -> CircuitBreaker:
+        breaker = self._hosts.get(host)
+        if breaker is None:
+            settings = Settings().http
+            breaker = CircuitBreaker(
+                host,
+                failure_threshold=settings.breaker_failure_threshold,
+                reset_timeout=settings.breaker_reset_timeout,
+            )
+            self._hosts[host] = breaker
+        return breaker
+
+    def state(self, host: str) -> BreakerState | None:
+        breaker = self._hosts.get(host)
+        return breaker.snapshot() if breaker else None
+
+    def state_for_url(self, url: str | None) -> BreakerState | None:
+        if not url:
+            return None
+        return self.state(urlparse(url).hostname or "")
+
+    def reset(self, host: str) -> bool:
+        breaker = self._hosts.get(host)
+        if breaker is None:
+            return False
+        breaker.reset()
+        return True
+
+    def states(self) -> list[BreakerState]:
+        return [breaker.snapshot() for breaker in self._hosts.values()]
+
+    async def middleware(
+        self, request: ClientRequest, handler: ClientHandlerType
+    ) -> ClientResponse:
+        breaker = self.get(request.url.host or "")
+        if not breaker.allow():
+            raise CircuitOpenError(
+                f"{breaker.host} is unavailable, retrying in {breaker.retry_in():.0f}s"
+            )
+
+        try:
+            response = await handler(request)
+        except (ClientConnectionError, TimeoutError) as e:
+            breaker.record_failure(str(e) or type(e).__name__)
+            raise
+        except BaseException:
+            breaker.release_probe()
+            raise
+
+        if response.status >= 500:
+            breaker.record_failure(f"{response.status}: {response.reason}")
+        else:
+            breaker.record_success()
+        return response
+
+
+circuit_breakers = CircuitBreakers()
@@ -1,11 +1,124 @@
+import asyncio
+from typing import Literal, final
+
 import aiohttp
 
 from app.internal.env_settings import Settings
+from app.util.circuitbreaker import circuit_breakers
+from app.util.ratelimit import request_governor
+
+type Service = Literal[
+    "default", "audible", "prowlarr", "audiobookshelf", "notifications"
+]
+
+_timeouts: dict[Service, aiohttp.ClientTimeout] = {
+    "default": aiohttp.ClientTimeout(30),
+    "audible": aiohttp.ClientTimeout(30, sock_connect=10),
+    # indexers can take a long time to answer a search
+    "prowlarr": aiohttp.ClientTimeout(60, sock_connect=10),
+    "audiobookshelf": aiohttp.ClientTimeout(30, sock_connect=10),
+    "notifications": aiohttp.ClientTimeout(15, sock_connect=10),
+}
+
+
+@final
+class ClientRegistry:
+    """
+    Application wide HTTP sessions, one per upstream service with its own timeouts.
+    All sessions share a single connection pool, so keep-alive connections and
+    resolved DNS entries are reused across requests. Requests fail fast while the
+    circuit breaker of their host is open and are rate limited per host.
+    """
+
+    def __init__(self):
+        self._connector: aiohttp.TCPConnector | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._sessions: dict[Service, aiohttp.ClientSession] = {}
+
+    def start(self):
+        settings = Settings().http
+        self._loop = asyncio.get_running_loop()
+        self._connector = aiohttp.TCPConnector(
+            limit=settings.connection_limit,
+            limit_per_host=settings.connection_limit_per_host,
+            keepalive_timeout=settings.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=settings.dns_cache_ttl,
+        )
+        self._sessions = {}
+
+    def get(self, service: Service = "default") -> aiohttp.ClientSession:
+        # started lazily outside of the app lifespan, like in the CLI
+        if (
+            self._connector is None
+            or self._connector.closed
+            or self._loop is not asyncio.get_running_loop()
+        ):
+            self.start()
+        assert self._connector is not None
+
+        session = self._sessions.get(service)
+        if session is None or session.closed:
+            session = create_session(_timeouts[service], connector=self._connector)
+            self._sessions[service] = session
+        return session
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
+        if self._connector:
+            await self._connector.close()
+            self._connector = None
+
+
+client_registry = ClientRegistry()
+
+
+def create_session(
+    timeout: aiohttp.ClientTimeout,
+    *,
+    base_url: str | None = None,
+    connector: aiohttp.BaseConnector | None = None,
+) -> aiohttp.ClientSession:
+    """
+    Session whose requests go through the circuit breaker and the rate limit of their
+    host. The total timeout only starts once a request got a slot from the rate
+    limit, while reading the body is limited by the read timeout.
+    """
+    return aiohttp.ClientSession(
+        base_url=base_url,
+        connector=connector,
+        connector_owner=connector is None,
+        timeout=aiohttp.ClientTimeout(
+            sock_connect=timeout.sock_connect,
+            sock_read=timeout.sock_read or timeout.total,
+        ),
+        middlewares=(
+            circuit_breakers.middleware,
+            request_governor.middleware(timeout.total),
+        ),
+    )
+
+
+async def get_connection() -> aiohttp.ClientSession:
+    """Shared session for handlers. It must not be closed by the caller."""
+    return client_registry.get()
+
+
+async def get_audible_connection() -> aiohttp.ClientSession:
+    """Same as `get_connection`, but with the timeouts for Audible."""
+    return client_registry.get("audible")
+
+
+async def get_prowlarr_connection() -> aiohttp.ClientSession:
+    """Same as `get_connection`, but with the timeouts for Prowlarr searches."""
+    return client_registry.get("prowlarr")
 
 
-async def get_connection():
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(30)) as session:
-        yield session
+async def get_audiobookshelf_connection() -> aiohttp.ClientSession:
+    """Same as `get_connection`, but with the timeouts for Audiobookshelf."""
+    return client_registry.get("audiobookshelf")
 
 
 USER_AGENT = (
@@ -13,6 +13,7 @@ from app.internal.downloadclient.client import qBittorrentClient
 from app.internal.downloadclient.config import downclient_config
 from app.internal.models import Audiobook
 from app.util.book_post_processing import MissingFile, post_process_downloaded_book
+from app.util.connection import client_registry
 from app.util.db import get_session
 from app.util.log import logger
 
@@ -102,11 +103,12 @@ async def download_monitor_task(stop_event: asyncio.Event):
         abs_library_id = abs_config.get_library_id(session)
         if not abs_library_id:
             return
-        async with aiohttp.ClientSession() as client_session:
-            abs_library = await abs_get_library(abs_library_id, session, client_session)
-            if not abs_library:
-                return
-            abs_folders = [folder.fullPath for folder in abs_library.folders]
+        abs_library = await abs_get_library(
+            abs_library_id, session, client_registry.get("audiobookshelf")
+        )
+        if not abs_library:
+            return
+        abs_folders = [folder.fullPath for folder in abs_library.folders]
         while not stop_event.is_set():
             down_client = await get_global_downloadclient(session)
             if not down_client:
@@ -0,0 +1,254 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from fnmatch import fnmatch
+from typing import final
+
+from aiohttp import ClientError, ClientHandlerType, ClientRequest, ClientResponse
+from aiohttp.client_middlewares import ClientMiddlewareType
+from pydantic import BaseModel
+
+from app.internal.env_settings import HostLimits, Settings
+from app.util.log import logger
+
+MAX_RETRY_AFTER = 5 * 60
+"""Upper bound for how long a host is paused because of a `Retry-After` header"""
+
+_RETRY_STATUSES = {429, 503}
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class RateLimitTimeout(ClientError):
+    """A request waited longer than its deadline for the rate limit of its host."""
+
+
+class GovernorStats(BaseModel, frozen=True):
+    host: str
+    requests: int
+    timed_out: int
+    throttled: int
+    """Amount of responses that asked us to back off with `Retry-After`"""
+    in_flight: int
+    queued: int
+    wait_p50: float
+    wait_p95: float
+    wait_max: float
+
+
+@final
+class HostGovernor:
+    """
+    Limits the requests sent to a single host with a token bucket for the request
+    rate and a semaphore for the amount of concurrent requests. Waiting requests are
+    served in order and fail once they waited longer than the queue timeout.
+    """
+
+    def __init__(self, host: str, limits: HostLimits):
+        self.host = host
+        self.limits = limits
+        self.requests = 0
+        self.timed_out = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.queued = 0
+        self._tokens = float(limits.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(limits.concurrency)
+        self._waits: deque[float] = deque(maxlen=1000)
+        """Queue wait times of the most recent requests"""
+
+    async def acquire(self, deadline: float):
+        """Waits for a free slot. Has to be followed by `release`."""
+        start = time.monotonic()
+        self.queued += 1
+        try:
+            async with asyncio.timeout_at(_to_loop_time(deadline)):
+                await self._semaphore.acquire()
+                try:
+                    # the lock makes sure tokens are handed out in arrival order
+                    async with self._lock:
+                        await self._take_token()
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+        except TimeoutError:
+            self.timed_out += 1
+            raise RateLimitTimeout(
+                f"Timed out waiting for the rate limit of {self.host}"
+            )
+        finally:
+            self.queued -= 1
+
+        waited = time.monotonic() - start
+        self._waits.append(waited)
+        self.requests += 1
+        self.in_flight += 1
+        if waited > 1:
+            logger.debug("Request waited for rate limit", host=self.host, waited=waited)
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(
+                self.limits.burst,
+                self._tokens + (now - self._refilled_at) * self.limits.rate,
+            )
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.limits.rate)
+
+    def pause(self, seconds: float):
+        """Stops sending requests to the host for the given amount of seconds."""
+        self.throttled += 1
+        seconds = min(seconds, MAX_RETRY_AFTER)
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning("Upstream asked to back off", host=self.host, seconds=seconds)
+
+    def stats(self) -> GovernorStats:
+        waits = sorted(self._waits)
+        return GovernorStats(
+            host=self.host,
+            requests=self.requests,
+            timed_out=self.timed_out,
+            throttled=self.throttled,
+            in_flight=self.in_flight,
+            queued=self.queued,
+            wait_p50=_percentile(waits, 0.5),
+            wait_p95=_percentile(waits, 0.95),
+            wait_max=waits[-1] if waits else 0,
+        )
+
+
+def _to_loop_time(deadline: float) -> float:
+    return asyncio.get_running_loop().time() + deadline - time.monotonic()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """`Retry-After` is either given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except ValueError:
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+@final
+class RequestGovernor:
+    """
+    Keeps one `HostGovernor` per upstream host. Used as an aiohttp client middleware,
+    so every request of a session goes through the limits of its host.
+    """
+
+    def __init__(self):
+        self._hosts: dict[str, HostGovernor] = {}
+
+    def get(self, host: str) -> HostGovernor:
+        governor = self._hosts.get(host)
+        if governor is None:
+            governor = HostGovernor(host, _limits_for(host))
+            self._hosts[host] = governor
+        return governor
+
+    def middleware(self, timeout: float | None = None) -> ClientMiddlewareType:
+        """
+        `timeout` limits every attempt from the moment it got a slot until the
+        response headers arrive, so waiting for the rate limit is not part of it.
+        """
+
+        async def middleware(
+            request: ClientRequest, handler: ClientHandlerType
+        ) -> ClientResponse:
+            return await self._send(request, handler, timeout)
+
+        return middleware
+
+    async def _send(
+        self,
+        request: ClientRequest,
+        handler: ClientHandlerType,
+        timeout: float | None,
+    ) -> ClientResponse:
+        governor = self.get(request.url.host or "")
+        deadline = time.monotonic() + governor.limits.queue_timeout
+
+        response = await _attempt(governor, request, handler, deadline, timeout)
+        if response.status not in _RETRY_STATUSES:
+            return response
+        retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is None:
+            return response
+        governor.pause(retry_after)
+
+        # retry once if the pause still fits in the deadline of the request
+        if (
+            request.method not in _IDEMPOTENT_METHODS
+            or time.monotonic() + retry_after >= deadline
+        ):
+            return response
+        response.release()
+        return await _attempt(governor, request, handler, deadline, timeout)
+
+    def stats(self) -> list[GovernorStats]:
+        return [governor.stats() for governor in self._hosts.values()]
+
+
+async def _attempt(
+    governor: HostGovernor,
+    request: ClientRequest,
+    handler: ClientHandlerType,
+    deadline: float,
+    timeout: float | None,
+) -> ClientResponse:
+    await governor.acquire(deadline)
+    try:
+        async with asyncio.timeout(timeout):
+            response = await handler(request)
+    except BaseException:
+        governor.release()
+        raise
+
+    # the slot is held until the body is read or the response is released
+    connection = response.connection
+    if connection is None:
+        governor.release()
+    else:
+        connection.add_callback(governor.release)
+    return response
+
+
+def _limits_for(host: str) -> HostLimits:
+    settings = Settings().http
+    for pattern, limits in settings.host_limits.items():
+        if fnmatch(host, pattern):
+            return limits
+    return settings.default_limits
+
+
+request_governor = RequestGovernor()
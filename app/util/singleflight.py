@@ -0,0 +1,87 @@
+import asyncio
+import weakref
+from typing import Awaitable, Callable, Protocol, final
+
+from pydantic import BaseModel
+
+from app.util.log import logger
+
+
+class JoinTimeout(Exception):
+    """A caller gave up waiting for a call that was started by another caller."""
+
+
+class SingleFlightStats(BaseModel, frozen=True):
+    name: str
+    originated: int
+    coalesced: int
+    in_flight: int
+
+
+class _ReportsStats(Protocol):
+    def stats(self) -> SingleFlightStats: ...
+
+
+_single_flights: weakref.WeakSet[_ReportsStats] = weakref.WeakSet()
+
+
+@final
+class SingleFlight[K, V]:
+    """
+    Coalesces concurrent calls with the same key. The first caller starts the call
+    and all callers arriving while it is still running await the same result.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.originated = 0
+        """Amount of calls that actually had to be executed"""
+        self.coalesced = 0
+        """Amount of calls that instead awaited an already running call"""
+        self._in_flight: dict[K, asyncio.Future[V]] = {}
+        _single_flights.add(self)
+
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            name=self.name,
+            originated=self.originated,
+            coalesced=self.coalesced,
+            in_flight=len(self._in_flight),
+        )
+
+    async def do(
+        self,
+        key: K,
+        fn: Callable[[], Awaitable[V]],
+        join_timeout: float | None = None,
+    ) -> V:
+        """
+        `join_timeout` limits how long callers wait for a call that is already
+        running. They then get a `JoinTimeout`, while the call itself continues.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            logger.debug(
+                "Coalesced call",
+                name=self.name,
+                coalesced=self.coalesced,
+                originated=self.originated,
+            )
+            if join_timeout is not None:
+                done, _ = await asyncio.wait([future], timeout=join_timeout)
+                if not done:
+                    raise JoinTimeout(f"{self.name}: call for {key} is still running")
+        else:
+            self.originated += 1
+            future = asyncio.ensure_future(fn())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # shield so that a cancelled caller does not cancel the call for all others
+        return await asyncio.shield(future)
+
+
+def single_flight_stats() -> list[SingleFlightStats]:
+    """The counters of every single flight, sorted by name."""
+    return sorted((flight.stats() for flight in _single_flights), key=lambda s: s.name)
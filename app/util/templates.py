@@ -95,3 +95,18 @@ def catalog_response_toast(
         background=background,
         **kwargs,
     )
+
+
+def sse_event(event: str, data: str = "") -> str:
+    """Formats a server-sent event. Every line of the data gets its own field."""
+    lines = "".join(f"data: {line}\n" for line in data.splitlines() or [""])
+    return f"event: {event}\n{lines}\n"
+
+
+def catalog_sse_event(
+    name: str,
+    event: str,
+    **kwargs: Any,  # pyright: ignore[reportExplicitAny, reportAny]
+) -> str:
+    """Renders a component as an event to be swapped in by the htmx sse extension."""
+    return sse_event(event, catalog.render(name, **kwargs))  # pyright: ignore[reportAny]
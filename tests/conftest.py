@@ -0,0 +1,31 @@
+import os
+import tempfile
+from collections.abc import Iterator
+
+# the settings are read when the app modules are first imported
+os.environ.setdefault("ABR_APP__CONFIG_DIR", tempfile.mkdtemp())
+
+import pytest
+from sqlalchemy import Engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+import app.internal.models  # noqa: F401  # pyright: ignore[reportUnusedImport]
+
+
+@pytest.fixture(scope="session")
+def engine() -> Engine:
+    # a single database for all tests, as the config caches are keyed by the version
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def session(engine: Engine) -> Iterator[Session]:
+    with Session(engine) as session:
+        yield session
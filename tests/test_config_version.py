@@ -0,0 +1,29 @@
+from sqlmodel import Session, select
+
+from app.internal.models import Config
+from app.util.cache import CONFIG_VERSION_KEY, StringConfigCache
+
+
+class _TestConfig(StringConfigCache[str]):
+    pass
+
+
+def _version(session: Session) -> str | None:
+    return session.exec(
+        select(Config.value).where(Config.key == CONFIG_VERSION_KEY)
+    ).one_or_none()
+
+
+def test_first_change_creates_the_version(session: Session):
+    version = session.get(Config, CONFIG_VERSION_KEY)
+    if version:
+        session.delete(version)
+        session.commit()
+
+    config = _TestConfig()
+    config.set(session, "a", "1")
+    assert _version(session) == "1"
+
+    config.set(session, "a", "2")
+    config.delete(session, "a")
+    assert _version(session) == "3"
@@ -0,0 +1,379 @@
+"""
+The ranking by `SourceRanker` has to keep the order of the pairwise `CompareSource`
+comparator it replaced. The comparator is kept here as the reference.
+"""
+
+import random
+from datetime import datetime, timedelta
+from functools import cmp_to_key
+from typing import Callable
+
+import pytest
+from rapidfuzz import fuzz, utils
+from sqlmodel import Session
+
+from app.internal.models import (
+    Audiobook,
+    Author,
+    BookMetadata,
+    ProwlarrSource,
+    TorrentSource,
+    UsenetSource,
+    author_to_name_list,
+)
+from app.internal.ranking.download_ranking import RankSource, SourceRanker
+from app.internal.ranking.quality import (
+    FileFormat,
+    IndexerFlag,
+    QualityRange,
+    quality_config,
+    quality_range_keys,
+)
+from app.internal.ranking.quality_extract import Quality
+
+_Compare = Callable[[RankSource, RankSource], int]
+
+
+def _fuzzy_author_narrator_match(
+    source_people: list[str], book_people: list[str], name_exists_ratio: int
+) -> int:
+    if not source_people or not book_people:
+        return 0
+    score = 0
+    for book_person in book_people:
+        best_match = 0.0
+        for source_person in source_people:
+            match_score = fuzz.token_set_ratio(
+                book_person, source_person, processor=utils.default_process
+            )
+            best_match = max(best_match, match_score)
+        if best_match > name_exists_ratio:
+            score += 1
+    return score
+
+
+def _vaguely_exist_in_title(
+    words: list[str], title: str, name_exists_ratio: int
+) -> int:
+    return sum(
+        1
+        for w in words
+        if fuzz.token_set_ratio(w, title, processor=utils.default_process)
+        > name_exists_ratio
+    )
+
+
+def _exists_in_title(word: str, title: str, title_exists_ratio: int) -> bool:
+    return (
+        fuzz.partial_ratio(word, title, processor=utils.default_process)
+        > title_exists_ratio
+    )
+
+
+class _ReferenceComparator:
+    """The comparator before the sort key, reading every config value per call."""
+
+    def __init__(self, session: Session, book: Audiobook):
+        self.session = session
+        self.book = book
+        self.compare_order: list[_Compare] = [
+            self._compare_valid,
+            self._compare_title,
+            self._compare_authors,
+            self._compare_narrators,
+            self._compare_format,
+            self._compare_flags,
+            self._compare_indexer,
+            self._compare_subtitle,
+            self._compare_seeders,
+            self._compare_age,
+        ]
+
+    def __call__(self, a: RankSource, b: RankSource) -> int:
+        for compare in self.compare_order:
+            if result := compare(a, b):
+                return result
+        return 0
+
+    def is_valid(self, a: RankSource) -> bool:
+        quality_range = quality_config.get_range(
+            self.session, quality_range_keys[a.quality.file_format]
+        )
+        valid = quality_range.from_kbits < a.quality.kbits < quality_range.to_kbits
+        if a.source.protocol == "torrent":
+            valid = valid and a.source.seeders >= quality_config.get_min_seeders(
+                self.session
+            )
+        return valid and (
+            self._title(a, self.book.title)
+            or self._authors(a) > 0
+            or self._narrators(a) > 0
+        )
+
+    def _title(self, a: RankSource, title: str) -> bool:
+        return _exists_in_title(
+            title, a.source.title, quality_config.get_title_exists_ratio(self.session)
+        )
+
+    def _authors(self, a: RankSource) -> int:
+        ratio = quality_config.get_name_exists_ratio(self.session)
+        authors = author_to_name_list(self.book.authors)
+        return max(
+            _vaguely_exist_in_title(authors, a.source.title, ratio),
+            _fuzzy_author_narrator_match(
+                a.source.book_metadata.authors, authors, ratio
+            ),
+        )
+
+    def _narrators(self, a: RankSource) -> int:
+        ratio = quality_config.get_name_exists_ratio(self.session)
+        return max(
+            _vaguely_exist_in_title(self.book.narrators, a.source.title, ratio),
+            _fuzzy_author_narrator_match(
+                a.source.book_metadata.narrators, self.book.narrators, ratio
+            ),
+        )
+
+    def _compare_valid(self, a: RankSource, b: RankSource) -> int:
+        return int(self.is_valid(b)) - int(self.is_valid(a))
+
+    def _compare_title(self, a: RankSource, b: RankSource) -> int:
+        return int(self._title(b, self.book.title)) - int(
+            self._title(a, self.book.title)
+        )
+
+    def _compare_authors(self, a: RankSource, b: RankSource) -> int:
+        return self._authors(b) - self._authors(a)
+
+    def _compare_narrators(self, a: RankSource, b: RankSource) -> int:
+        return self._narrators(b) - self._narrators(a)
+
+    def _compare_format(self, a: RankSource, b: RankSource) -> int:
+        if a.quality.file_format == b.quality.file_format:
+            return 0
+        order = quality_config.get_format_order(self.session)
+
+        def rank(file_format: FileFormat) -> int:
+            return order.index(file_format) if file_format in order else len(order)
+
+        return rank(a.quality.file_format) - rank(b.quality.file_format)
+
+    def _compare_flags(self, a: RankSource, b: RankSource) -> int:
+        flags = quality_config.get_indexer_flags(self.session)
+
+        def score(source: ProwlarrSource) -> int:
+            return sum(f.score for f in flags if f.flag.lower() in source.indexer_flags)
+
+        return score(b.source) - score(a.source)
+
+    def _compare_indexer(self, a: RankSource, b: RankSource) -> int:
+        order = quality_config.get_indexer_order(self.session)
+
+        def rank(indexer_id: int) -> int:
+            return order.index(indexer_id) if indexer_id in order else len(order)
+
+        return rank(a.source.indexer_id) - rank(b.source.indexer_id)
+
+    def _compare_subtitle(self, a: RankSource, b: RankSource) -> int:
+        if not self.book.subtitle:
+            return 0
+        return int(self._title(b, self.book.subtitle)) - int(
+            self._title(a, self.book.subtitle)
+        )
+
+    def _compare_seeders(self, a: RankSource, b: RankSource) -> int:
+        if a.source.protocol == "usenet" or b.source.protocol == "usenet":
+            return 0
+        return b.source.seeders - a.source.seeders
+
+    def _compare_age(self, a: RankSource, b: RankSource) -> int:
+        if a.source.protocol != b.source.protocol:
+            return 0
+        if a.source.protocol == "usenet":
+            return int((a.source.publish_date - b.source.publish_date).total_seconds())
+        return int((b.source.publish_date - a.source.publish_date).total_seconds())
+
+
+def _book(authors: list[str], narrators: list[str], subtitle: str | None):
+    return Audiobook(
+        asin="B000000000",
+        title="The Way of Kings",
+        subtitle=subtitle,
+        authors=[Author(name=name) for name in authors],
+        narrators=narrators,
+        cover_image=None,
+        release_date=datetime(2010, 8, 31),
+        runtime_length_min=2700,
+    )
+
+
+_books = {
+    "full": _book(
+        ["Brandon Sanderson"],
+        ["Michael Kramer", "Kate Reading"],
+        "The Stormlight Archive, Book 1",
+    ),
+    "no_authors": _book([], ["Michael Kramer"], None),
+    "no_narrators": _book(["Brandon Sanderson"], [], None),
+    "no_people": _book([], [], "Book 1"),
+}
+
+_titles = [
+    "The Way of Kings",
+    "Brandon Sanderson - The Way of Kings",
+    "The Stormlight Archive 01 - The Way of Kings (Michael Kramer, Kate Reading)",
+    "Way of Kings [m4b]",
+    "Words of Radiance",
+    "Sanderson, Brandon - Mistborn",
+    "Kate Reading - Collected Works",
+    "Kings of the Wyld",
+]
+_people = [
+    [],
+    ["Brandon Sanderson"],
+    ["B. Sanderson", "Someone Else"],
+    ["Michael Kramer"],
+    ["Kate Reading", "Michael Kramer"],
+    ["Someone Else"],
+]
+_flags = [[], ["freeleech"], ["internal"], ["freeleech", "internal"], ["unknown"]]
+_formats: list[FileFormat] = ["flac", "m4b", "mp3", "unknown-audio", "unknown"]
+
+
+def _configure(session: Session):
+    quality_config.set_format_order(session, ["m4b", "flac", "mp3"])
+    quality_config.set_indexer_order(session, [3, 1])
+    quality_config.set_indexer_flags(
+        session,
+        [
+            IndexerFlag(flag="FreeLeech", score=100),
+            IndexerFlag(flag="freeleech", score=10),
+            IndexerFlag(flag="internal", score=50),
+        ],
+    )
+    quality_config.set_min_seeders(session, 2)
+    quality_config.set_name_exists_ratio(session, 75)
+    quality_config.set_title_exists_ratio(session, 90)
+    for key in quality_range_keys.values():
+        quality_config.set_range(
+            session, key, QualityRange(from_kbits=20, to_kbits=400)
+        )
+
+
+def _random_source(rng: random.Random, i: int, protocol: str) -> RankSource:
+    values = {
+        "guid": f"guid-{i}",
+        "indexer_id": rng.randint(1, 4),
+        "indexer": f"indexer-{i}",
+        "title": rng.choice(_titles),
+        "size": rng.randint(1, 10) * 100_000_000,
+        # whole seconds, as the reference compared the age in whole seconds
+        "publish_date": datetime(2020, 1, 1)
+        + timedelta(seconds=rng.randint(0, 5) * 3600),
+        "info_url": None,
+        "indexer_flags": rng.choice(_flags),
+        "book_metadata": BookMetadata(
+            authors=rng.choice(_people), narrators=rng.choice(_people)
+        ),
+    }
+    if protocol == "torrent":
+        source = TorrentSource(
+            **values, seeders=rng.randint(0, 4), leechers=rng.randint(0, 4)
+        )
+    else:
+        source = UsenetSource(**values, grabs=rng.randint(0, 4))
+    quality = Quality(
+        kbits=rng.choice([10, 64, 128, 320, 500]), file_format=rng.choice(_formats)
+    )
+    return RankSource(source=source, quality=quality)
+
+
+def _random_sources(rng: random.Random, protocol: str) -> list[RankSource]:
+    sources = [_random_source(rng, i, protocol) for i in range(rng.randint(1, 40))]
+    # exact duplicates have to keep their order
+    for _ in range(rng.randint(0, 5)):
+        duplicate = rng.choice(sources)
+        sources.append(
+            duplicate.model_copy(
+                update={
+                    "source": duplicate.source.model_copy(
+                        update={"guid": f"duplicate-{len(sources)}"}
+                    )
+                }
+            )
+        )
+    rng.shuffle(sources)
+    return sources
+
+
+def _guids(rank_sources: list[RankSource]) -> list[str]:
+    return [rs.source.guid for rs in rank_sources]
+
+
+# torrents and usenet sources are not mixed, as the reference comparator did not
+# order them consistently against each other
+@pytest.mark.parametrize("protocol", ["torrent", "usenet"])
+@pytest.mark.parametrize("book_name", list(_books))
+def test_rank_matches_reference(session: Session, protocol: str, book_name: str):
+    _configure(session)
+    book = _books[book_name]
+    ranker = SourceRanker(quality_config.compile(session), book)
+    reference = _ReferenceComparator(session, book)
+
+    rng = random.Random(f"{protocol}-{book_name}")
+    for _ in range(25):
+        sources = _random_sources(rng, protocol)
+        expected = sorted(sources, key=cmp_to_key(reference))
+        assert _guids(ranker.rank(sources)) == _guids(expected)
+
+
+@pytest.mark.parametrize("protocol", ["torrent", "usenet"])
+def test_best_matches_full_sort(session: Session, protocol: str):
+    _configure(session)
+    book = _books["full"]
+    ranker = SourceRanker(quality_config.compile(session), book)
+    reference = _ReferenceComparator(session, book)
+
+    rng = random.Random(protocol)
+    for _ in range(25):
+        sources = _random_sources(rng, protocol)
+        ranked = ranker.rank(sources)
+        valid = {
+            rs.source.guid
+            for rs, features in zip(sources, ranker.features(sources))
+            if features.valid
+        }
+        assert valid == {rs.source.guid for rs in sources if reference.is_valid(rs)}
+        for k in (1, 3, len(sources) + 1):
+            expected = [rs for rs in ranked if rs.source.guid in valid][:k]
+            assert _guids(ranker.best(sources, k)) == _guids(expected)
+
+
+def test_flags_are_summed_case_insensitively(session: Session):
+    _configure(session)
+    profile = quality_config.compile(session)
+
+    assert profile.flag_score(["freeleech"]) == 110
+    assert profile.flag_score(["freeleech", "internal"]) == 160
+    assert profile.flag_score(["freeleech", "freeleech"]) == 110
+    assert profile.flag_score(["FreeLeech"]) == 0
+    assert profile.flag_score([]) == 0
+
+
+def test_ties_keep_their_order(session: Session):
+    _configure(session)
+    book = _books["full"]
+    ranker = SourceRanker(quality_config.compile(session), book)
+
+    rng = random.Random("ties")
+    source = _random_source(rng, 0, "torrent")
+    sources = [
+        source.model_copy(
+            update={"source": source.source.model_copy(update={"guid": f"tie-{i}"})}
+        )
+        for i in range(10)
+    ]
+    assert _guids(ranker.rank(sources)) == _guids(sources)
+    assert _guids(ranker.best(sources, 3)) == _guids(
+        [rs for rs in sources if ranker.features([rs])[0].valid][:3]
+    )
@@ -0,0 +1,148 @@
+"""
+`parse_search_results` has to return the same sources as the parsing it replaced,
+which validated the response into intermediate models and copied every field into
+a new source. That parsing is kept here as the reference, together with the info
+hash that was added later on.
+"""
+
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Literal
+
+import pytest
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from app.internal.models import (
+    BookMetadata,
+    ProwlarrSource,
+    TorrentSource,
+    UsenetSource,
+)
+from app.internal.prowlarr.search_results import parse_search_results
+
+_fixture = Path(__file__).parent / "fixtures" / "prowlarr_search.json"
+
+
+class _ReferenceResultBase(BaseModel):
+    guid: str
+    indexerId: int
+    indexer: str
+    title: str
+    size: int
+    infoUrl: str | None = None
+    indexerFlags: list[str] = []
+    downloadUrl: str | None = None
+    magnetUrl: str | None = None
+    publishDate: str
+
+
+class _ReferenceTorrentResult(_ReferenceResultBase):
+    protocol: Literal["torrent"]
+    seeders: int = 0
+    leechers: int = 0
+    infoHash: str | None = None
+
+
+class _ReferenceUsenetResult(_ReferenceResultBase):
+    protocol: Literal["usenet"]
+    grabs: int = 0
+
+
+_ReferenceResults = TypeAdapter(list[_ReferenceTorrentResult | _ReferenceUsenetResult])
+
+
+def _reference_parse(body: bytes) -> list[ProwlarrSource]:
+    sources: list[ProwlarrSource] = []
+    for result in _ReferenceResults.validate_python(json.loads(body)):
+        if result.protocol == "torrent":
+            sources.append(
+                TorrentSource(
+                    protocol="torrent",
+                    guid=result.guid,
+                    indexer_id=result.indexerId,
+                    indexer=result.indexer,
+                    title=result.title,
+                    seeders=result.seeders,
+                    leechers=result.leechers,
+                    info_hash=result.infoHash,
+                    size=result.size,
+                    info_url=result.infoUrl,
+                    indexer_flags=[x.lower() for x in result.indexerFlags],
+                    download_url=result.downloadUrl,
+                    magnet_url=result.magnetUrl,
+                    publish_date=datetime.fromisoformat(result.publishDate),
+                )
+            )
+        else:
+            sources.append(
+                UsenetSource(
+                    protocol="usenet",
+                    guid=result.guid,
+                    indexer_id=result.indexerId,
+                    indexer=result.indexer,
+                    title=result.title,
+                    grabs=result.grabs,
+                    size=result.size,
+                    info_url=result.infoUrl,
+                    indexer_flags=[x.lower() for x in result.indexerFlags],
+                    download_url=result.downloadUrl,
+                    magnet_url=result.magnetUrl,
+                    publish_date=datetime.fromisoformat(result.publishDate),
+                )
+            )
+    return sources
+
+
+_Sources = TypeAdapter(list[ProwlarrSource])
+
+
+def test_parse_matches_reference():
+    body = _fixture.read_bytes()
+    sources = parse_search_results(body)
+    reference = _reference_parse(body)
+
+    assert len(sources) == len(reference)
+    for source, expected in zip(sources, reference):
+        assert isinstance(source, type(expected))
+    assert _Sources.dump_python(sources) == _Sources.dump_python(reference)
+    assert _Sources.dump_json(sources) == _Sources.dump_json(reference)
+
+
+def test_results_behave_like_sources():
+    sources = parse_search_results(_fixture.read_bytes())
+
+    for source in sources:
+        assert source == type(source).model_validate(source.model_dump())
+        assert source.book_metadata == BookMetadata()
+
+    # every result gets its own metadata, as it is edited per source
+    sources[0].book_metadata.title = "changed"
+    assert sources[1].book_metadata.title is None
+
+
+def test_flags_are_lowercased():
+    sources = parse_search_results(_fixture.read_bytes())
+    assert sources[0].indexer_flags == ["freeleech", "internal"]
+    assert sources[4].indexer_flags == []
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        {"protocol": "ftp"},
+        {"protocol": "torrent", "guid": "missing-fields"},
+        {
+            "protocol": "usenet",
+            "guid": "g",
+            "indexerId": 1,
+            "indexer": "i",
+            "title": "t",
+            "size": 1,
+            "publishDate": "not a date",
+        },
+    ],
+)
+def test_invalid_results_raise(result: dict[str, object]):
+    with pytest.raises(ValidationError):
+        _ = parse_search_results(json.dumps([result]).encode())
@@ -0,0 +1,55 @@
+from sqlmodel import Session, select
+
+from app.internal.models import GroupEnum, QueryJob, User
+from app.internal.query_queue import QueryJobPriority, enqueue_query
+
+
+def _user(session: Session, username: str) -> User:
+    user = User(username=username, password="x", group=GroupEnum.trusted)
+    session.add(user)
+    session.commit()
+    return user
+
+
+def _jobs(session: Session, asin: str) -> list[tuple[str, bool]]:
+    jobs = session.exec(select(QueryJob).where(QueryJob.asin == asin)).all()
+    return sorted((job.requester_username, job.auto_download) for job in jobs)
+
+
+def test_auto_downloads_are_queued_per_requester(session: Session):
+    alice = _user(session, "alice")
+    bob = _user(session, "bob")
+
+    _ = enqueue_query(
+        session,
+        "B0000000A1",
+        alice,
+        priority=QueryJobPriority.request,
+        auto_download=True,
+    )
+    _ = enqueue_query(
+        session,
+        "B0000000A1",
+        bob,
+        priority=QueryJobPriority.request,
+        auto_download=True,
+    )
+    _ = enqueue_query(session, "B0000000A1", bob, priority=QueryJobPriority.bulk)
+
+    assert _jobs(session, "B0000000A1") == [("alice", True), ("bob", True)]
+
+
+def test_upgraded_jobs_download_for_the_new_requester(session: Session):
+    carol = _user(session, "carol")
+    dave = _user(session, "dave")
+
+    _ = enqueue_query(session, "B0000000A2", carol, priority=QueryJobPriority.bulk)
+    _ = enqueue_query(
+        session,
+        "B0000000A2",
+        dave,
+        priority=QueryJobPriority.request,
+        auto_download=True,
+    )
+
+    assert _jobs(session, "B0000000A2") == [("dave", True)]
@@ -0,0 +1,37 @@
+from app.internal.audible.suggestions import PrefixIndex
+
+
+def _filled_index() -> PrefixIndex:
+    index = PrefixIndex()
+    index.build([(f"Aa {i:04}", 1) for i in range(2000)] + [("Az Popular", 50)])
+    return index
+
+
+def test_ranks_all_matches_of_a_prefix():
+    # sorts after thousands of other matches, but is the most popular
+    assert _filled_index().search("a", 3)[0] == "Az Popular"
+
+
+def test_prefix_matches_come_first():
+    index = PrefixIndex()
+    index.build([("The Hobbit", 1), ("Hobbit Tales", 1), ("The Silmarillion", 9)])
+    assert index.search("hob", 10) == ["Hobbit Tales", "The Hobbit"]
+    assert index.search("the", 10) == ["The Silmarillion", "The Hobbit"]
+
+
+def test_cached_results_are_updated_by_new_values():
+    index = _filled_index()
+    assert index.search("a", 1) == ["Az Popular"]
+
+    index.add("Ab Rising", 100)
+    assert index.search("a", 1) == ["Ab Rising"]
+
+    index.add("Az Popular", 100)
+    assert index.search("a", 1) == ["Az Popular"]
+
+
+def test_cached_results_are_not_shared():
+    index = _filled_index()
+    results = index.search("a", 2)
+    results.append("Changed")
+    assert index.search("a", 2) == ["Az Popular", "Aa 0000"]